@@ -1,28 +1,71 @@
 import asyncio
 import os
 import platform
-import subprocess
-from typing import Optional, Protocol
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Protocol
 
 from biz_gemini.auth import JWTManager, login_via_browser
 from biz_gemini.biz_client import BizGeminiClient, ChatResponse
-from biz_gemini.config import load_config, cookies_expired
+from biz_gemini.config import get_cached_config, cookies_expired
+from biz_gemini.exceptions import AuthenticationError, CookieRefreshError
 
 
-def open_image(filepath: str) -> bool:
-    """使用系统默认程序打开图片"""
+def _spawn_and_wait(argv: List[str]) -> None:
+    """通过 posix_spawn 启动外部程序并等待退出，非零退出码视为失败"""
+    pid = os.posix_spawnp(argv[0], argv, os.environ)
+    _, status = os.waitpid(pid, 0)
+    exit_code = os.waitstatus_to_exitcode(status)
+    if exit_code != 0:
+        raise OSError(f"{argv[0]} 退出码: {exit_code}")
+
+
+def _open_windows(filepaths: List[str]) -> None:
+    for filepath in filepaths:
+        os.startfile(filepath)
+
+
+def _open_macos(filepaths: List[str]) -> None:
+    # open 支持一次传入多个文件，一个进程打开全部图片
+    _spawn_and_wait(["open", *filepaths])
+
+
+def _open_linux(filepaths: List[str]) -> None:
+    # xdg-open 只接受单个文件参数
+    for filepath in filepaths:
+        _spawn_and_wait(["xdg-open", filepath])
+
+
+def _pick_open_impl() -> Callable[[List[str]], None]:
+    """根据当前平台选择打开文件的实现（仅在导入时调用一次）"""
+    system = platform.system()
+    if system == "Windows":
+        return _open_windows
+    if system == "Darwin":  # macOS
+        return _open_macos
+    return _open_linux
+
+
+_OPEN_IMPL = _pick_open_impl()
+
+
+def open_images(filepaths: List[str]) -> bool:
+    """使用系统默认程序批量打开图片"""
+    if not filepaths:
+        return True
     try:
-        if platform.system() == "Windows":
-            os.startfile(filepath)
-        elif platform.system() == "Darwin":  # macOS
-            subprocess.run(["open", filepath], check=True)
-        else:  # Linux
-            subprocess.run(["xdg-open", filepath], check=True)
+        _OPEN_IMPL(filepaths)
         return True
     except Exception:
         return False
 
 
+def open_image(filepath: str) -> bool:
+    """使用系统默认程序打开图片"""
+    return open_images([filepath])
+
+
 class ChatBackend(Protocol):
     def send(self, message: str) -> str: ...
     def send_full(self, message: str) -> ChatResponse: ...
@@ -56,9 +99,28 @@ class BizGeminiChatBackend:
         self.debug = value
 
 
+# cookie 过期检查结果的复用时间（秒）
+_EXPIRED_CHECK_TTL = 60
+# 最近一次过期检查：配置未变化（get_cached_config 返回同一对象）且未超时则直接复用
+_expired_check: dict = {"cfg": None, "expired": False, "checked_at": 0.0}
+
+
+def _cookies_expired_cached(cfg: dict) -> bool:
+    now = time.monotonic()
+    if _expired_check["cfg"] is cfg and now - _expired_check["checked_at"] < _EXPIRED_CHECK_TTL:
+        return _expired_check["expired"]
+    expired = cookies_expired(cfg, max_age_hours=24)
+    _expired_check.update(cfg=cfg, expired=expired, checked_at=now)
+    return expired
+
+
 def check_login_status() -> tuple[bool, Optional[dict], str]:
-    """检查登录状态，返回 (是否已登录, 配置, 状态消息)"""
-    cfg = load_config()
+    """检查登录状态，返回 (是否已登录, 配置, 状态消息)
+
+    返回的配置是副本：调用方（JWTManager、登录流程）可能修改它，不能污染进程共享的配置缓存。
+    """
+    # 配置文件未变化时复用已解析的配置，避免每次 /login 都重新读盘解析
+    cfg = get_cached_config()
 
     # 检查必要字段
     missing = [k for k in ("secure_c_ses", "csesidx", "group_id") if not cfg.get(k)]
@@ -66,40 +128,193 @@ def check_login_status() -> tuple[bool, Optional[dict], str]:
         return False, None, f"配置缺失字段: {', '.join(missing)}"
 
     # 检查 cookie 是否过期
-    if cookies_expired(cfg, max_age_hours=24):
-        return False, cfg, "登录信息已超过 24 小时，建议重新登录"
+    if _cookies_expired_cached(cfg):
+        return False, dict(cfg), "登录信息已超过 24 小时，建议重新登录"
+
+    return True, dict(cfg), "已登录"
+
+
+# 开关类命令的参数取值
+_TRUTHY = frozenset({"on", "true", "1", "yes"})
+_FALSY = frozenset({"off", "false", "0", "no"})
+
+
+@dataclass
+class CliState:
+    """命令行会话的运行时状态"""
+
+    loop: asyncio.AbstractEventLoop
+    backend: Optional[BizGeminiChatBackend] = None
+    logged_in: bool = False
+    show_thinking: bool = False
+    auto_open_images: bool = True  # 默认自动打开图片
+    debug_mode: bool = False  # 调试模式
+
+
+# 命令处理函数：返回 True 表示退出 CLI
+CommandHandler = Callable[[str, CliState], Optional[bool]]
 
-    return True, cfg, "已登录"
+
+def _cmd_exit(arg: str, state: CliState) -> Optional[bool]:
+    print("[*] 已退出")
+    return True
+
+
+def _cmd_login(arg: str, state: CliState) -> Optional[bool]:
+    print("[*] 正在启动浏览器登录...")
+    try:
+        state.loop.run_until_complete(login_via_browser())
+        # 重新检查登录状态
+        state.logged_in, cfg, status_msg = check_login_status()
+        if state.logged_in and cfg:
+            state.backend = BizGeminiChatBackend(cfg, include_thoughts=state.show_thinking)
+            print("[+] 登录成功，可以开始对话了")
+        else:
+            print(f"[!] 登录后状态异常: {status_msg}")
+    except Exception as e:
+        print(f"[!] 登录失败: {e}")
+    return None
+
+
+def _cmd_reset(arg: str, state: CliState) -> Optional[bool]:
+    if state.backend:
+        state.backend.reset()
+        print("[*] 已重置会话")
+    else:
+        print("[!] 尚未登录，请先输入 /login 进行登录")
+    return None
+
+
+def _cmd_showthinking(arg: str, state: CliState) -> Optional[bool]:
+    arg = arg.lower()
+    if arg in _TRUTHY:
+        state.show_thinking = True
+        if state.backend:
+            state.backend.set_include_thoughts(True)
+        print("[*] 已开启思考链显示")
+    elif arg in _FALSY:
+        state.show_thinking = False
+        if state.backend:
+            state.backend.set_include_thoughts(False)
+        print("[*] 已关闭思考链显示")
+    else:
+        status = "开启" if state.show_thinking else "关闭"
+        print(f"[*] 当前思考链显示状态: {status}")
+        print("[*] 用法: /showthinking on 或 /showthinking off")
+    return None
+
+
+def _cmd_openimage(arg: str, state: CliState) -> Optional[bool]:
+    arg = arg.lower()
+    if arg in _TRUTHY:
+        state.auto_open_images = True
+        print("[*] 已开启自动打开图片")
+    elif arg in _FALSY:
+        state.auto_open_images = False
+        print("[*] 已关闭自动打开图片")
+    else:
+        status = "开启" if state.auto_open_images else "关闭"
+        print(f"[*] 当前自动打开图片状态: {status}")
+        print("[*] 用法: /openimage on 或 /openimage off")
+    return None
+
+
+def _cmd_debug(arg: str, state: CliState) -> Optional[bool]:
+    arg = arg.lower()
+    if arg in _TRUTHY:
+        state.debug_mode = True
+        if state.backend:
+            state.backend.set_debug(True)
+        print("[*] 已开启调试模式，将显示完整 API 响应")
+    elif arg in _FALSY:
+        state.debug_mode = False
+        if state.backend:
+            state.backend.set_debug(False)
+        print("[*] 已关闭调试模式")
+    else:
+        status = "开启" if state.debug_mode else "关闭"
+        print(f"[*] 当前调试模式状态: {status}")
+        print("[*] 用法: /debug on 或 /debug off")
+    return None
+
+
+def _cmd_help(arg: str, state: CliState) -> Optional[bool]:
+    print("可用命令：")
+    print("  /login           启动浏览器进行登录")
+    print("  /new             重置会话")
+    print("  /showthinking    切换思考链显示 (on/off)")
+    print("  /openimage       切换自动打开图片 (on/off)")
+    print("  /debug           切换调试模式 (on/off) - 显示完整 API 响应")
+    print("  /exit            退出程序")
+    print("  /help            显示帮助")
+    return None
+
+
+_CMD_TABLE: Dict[str, CommandHandler] = {
+    "exit": _cmd_exit,
+    "quit": _cmd_exit,
+    "q": _cmd_exit,
+    "login": _cmd_login,
+    "new": _cmd_reset,
+    "reset": _cmd_reset,
+    "showthinking": _cmd_showthinking,
+    "openimage": _cmd_openimage,
+    "debug": _cmd_debug,
+    "help": _cmd_help,
+    "h": _cmd_help,
+    "?": _cmd_help,
+}
 
 
 def run_cli() -> None:
     """运行命令行交互界面"""
+    # 整个 CLI 生命周期复用同一个事件循环，避免每次 /login 重建 loop 和 executor
+    loop = asyncio.new_event_loop()
+    try:
+        _run_cli(CliState(loop=loop))
+    finally:
+        try:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            loop.close()
+
+
+def _read_stdin_line(prompt: str) -> str:
+    """非交互输入（管道/脚本）时直接读 stdin，跳过 input() 的 readline 处理"""
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+    line = sys.stdin.readline()
+    if not line:
+        raise EOFError
+    return line
+
+
+def _run_cli(state: CliState) -> None:
     print("=" * 60)
     print("Business Gemini 命令行对话")
     print("输入 /help 查看所有命令")
     print("=" * 60)
 
     # 检查登录状态
-    logged_in, cfg, status_msg = check_login_status()
-    backend: Optional[BizGeminiChatBackend] = None
-    show_thinking = False
-    auto_open_images = True  # 默认自动打开图片
-    debug_mode = False  # 调试模式
+    state.logged_in, cfg, status_msg = check_login_status()
 
-    if logged_in and cfg:
+    if state.logged_in and cfg:
         try:
-            backend = BizGeminiChatBackend(cfg, include_thoughts=show_thinking)
+            state.backend = BizGeminiChatBackend(cfg, include_thoughts=state.show_thinking)
             print(f"[*] {status_msg}")
         except Exception as e:
             print(f"[!] 初始化失败: {e}")
-            logged_in = False
+            state.logged_in = False
     else:
         print(f"[!] {status_msg}")
         print("[*] 请输入 /login 进行登录")
 
+    # 交互式终端保留 input() 的行编辑能力
+    read_line = input if sys.stdin.isatty() else _read_stdin_line
+
     while True:
         try:
-            user_input = input("\nYou > ").strip()
+            user_input = read_line("\nYou > ").strip()
         except (KeyboardInterrupt, EOFError):
             print("\n[*] 再见")
             return
@@ -112,142 +327,62 @@ def run_cli() -> None:
             cmd = cmd_parts[0].lower() if cmd_parts else ""
             cmd_arg = cmd_parts[1] if len(cmd_parts) > 1 else ""
 
-            # 退出命令
-            if cmd in {"exit", "quit", "q"}:
-                print("[*] 已退出")
+            handler = _CMD_TABLE.get(cmd)
+            if handler is None:
+                print(f"[!] 未知命令: /{cmd}，输入 /help 查看帮助")
+            elif handler(cmd_arg, state):
                 return
-
-            # 登录命令
-            if cmd == "login":
-                print("[*] 正在启动浏览器登录...")
-                try:
-                    asyncio.run(login_via_browser())
-                    # 重新检查登录状态
-                    logged_in, cfg, status_msg = check_login_status()
-                    if logged_in and cfg:
-                        backend = BizGeminiChatBackend(cfg, include_thoughts=show_thinking)
-                        print("[+] 登录成功，可以开始对话了")
-                    else:
-                        print(f"[!] 登录后状态异常: {status_msg}")
-                except Exception as e:
-                    print(f"[!] 登录失败: {e}")
-                continue
-
-            # 重置会话命令
-            if cmd in {"new", "reset"}:
-                if backend:
-                    backend.reset()
-                    print("[*] 已重置会话")
-                else:
-                    print("[!] 尚未登录，请先输入 /login 进行登录")
-                continue
-
-            # 显示思考链命令
-            if cmd == "showthinking":
-                arg = cmd_arg.lower()
-                if arg in {"on", "true", "1", "yes"}:
-                    show_thinking = True
-                    if backend:
-                        backend.set_include_thoughts(True)
-                    print("[*] 已开启思考链显示")
-                elif arg in {"off", "false", "0", "no"}:
-                    show_thinking = False
-                    if backend:
-                        backend.set_include_thoughts(False)
-                    print("[*] 已关闭思考链显示")
-                else:
-                    status = "开启" if show_thinking else "关闭"
-                    print(f"[*] 当前思考链显示状态: {status}")
-                    print("[*] 用法: /showthinking on 或 /showthinking off")
-                continue
-
-            # 自动打开图片命令
-            if cmd == "openimage":
-                arg = cmd_arg.lower()
-                if arg in {"on", "true", "1", "yes"}:
-                    auto_open_images = True
-                    print("[*] 已开启自动打开图片")
-                elif arg in {"off", "false", "0", "no"}:
-                    auto_open_images = False
-                    print("[*] 已关闭自动打开图片")
-                else:
-                    status = "开启" if auto_open_images else "关闭"
-                    print(f"[*] 当前自动打开图片状态: {status}")
-                    print("[*] 用法: /openimage on 或 /openimage off")
-                continue
-
-            # 调试模式命令
-            if cmd == "debug":
-                arg = cmd_arg.lower()
-                if arg in {"on", "true", "1", "yes"}:
-                    debug_mode = True
-                    if backend:
-                        backend.set_debug(True)
-                    print("[*] 已开启调试模式，将显示完整 API 响应")
-                elif arg in {"off", "false", "0", "no"}:
-                    debug_mode = False
-                    if backend:
-                        backend.set_debug(False)
-                    print("[*] 已关闭调试模式")
-                else:
-                    status = "开启" if debug_mode else "关闭"
-                    print(f"[*] 当前调试模式状态: {status}")
-                    print("[*] 用法: /debug on 或 /debug off")
-                continue
-
-            # 帮助命令
-            if cmd in {"help", "h", "?"}:
-                print("可用命令：")
-                print("  /login           启动浏览器进行登录")
-                print("  /new             重置会话")
-                print("  /showthinking    切换思考链显示 (on/off)")
-                print("  /openimage       切换自动打开图片 (on/off)")
-                print("  /debug           切换调试模式 (on/off) - 显示完整 API 响应")
-                print("  /exit            退出程序")
-                print("  /help            显示帮助")
-                continue
-
-            print(f"[!] 未知命令: /{cmd}，输入 /help 查看帮助")
             continue
 
         # 聊天消息
-        if not logged_in or not backend:
+        if not state.logged_in or not state.backend:
             print("[!] 尚未登录，请先输入 /login 进行登录")
             continue
 
         print("Gemini >", end=" ", flush=True)
         try:
-            response = backend.send_full(user_input)
+            response = state.backend.send_full(user_input)
+        except (AuthenticationError, CookieRefreshError) as e:
+            # 登录态失效（Cookie 过期、JWT 刷新失败等）
+            print(f"\n[!] 调用失败: {e}")
+            print("[*] 可能需要重新登录，请输入 /login")
+            state.logged_in = False
+            continue
         except Exception as e:
             print(f"\n[!] 调用失败: {e}")
-            # 检查是否是登录问题
-            if "cookie" in str(e).lower() or "401" in str(e) or "登录" in str(e):
-                print("[*] 可能需要重新登录，请输入 /login")
-                logged_in = False
             continue
 
-        # 输出文本响应
-        output_parts = []
-        for thought in response.thoughts:
-            output_parts.append(f"[思考] {thought}")
-        if response.text:
-            output_parts.append(response.text)
-
-        if output_parts:
-            print("\n".join(output_parts))
+        # 输出文本响应，直接逐段写入 stdout，不再拼接中间列表
+        write = sys.stdout.write
+        if response.thoughts or response.text:
+            for thought in response.thoughts:
+                write("[思考] ")
+                write(thought)
+                write("\n")
+            if response.text:
+                write(response.text)
+                write("\n")
+        else:
+            # 仅有图片（或空响应）时换行，避免后续输出接在 "Gemini >" 提示之后
+            write("\n")
+        sys.stdout.flush()
 
         # 处理图片
         if response.images:
+            to_open: List[str] = []
             for i, img in enumerate(response.images, 1):
                 if img.local_path:
                     print(f"[图片 {i}] 已保存: {img.local_path}")
-                    if auto_open_images:
-                        if open_image(img.local_path):
-                            print(f"[图片 {i}] 已在默认程序中打开")
-                        else:
-                            print(f"[图片 {i}] 无法自动打开，请手动查看")
+                    if state.auto_open_images:
+                        to_open.append(img.local_path)
                 elif img.url:
                     print(f"[图片 {i}] URL: {img.url}")
+            # 一次性打开本次响应的所有图片
+            if to_open:
+                if open_images(to_open):
+                    print(f"[*] 已在默认程序中打开 {len(to_open)} 张图片")
+                else:
+                    print("[!] 无法自动打开图片，请手动查看")
 
 
 def main() -> None:
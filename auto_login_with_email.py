@@ -1632,10 +1632,11 @@ def test_cookie_with_jwt(account: Dict[str, str]) -> bool:
     try:
         resp = requests.get(url, headers=headers, verify=False, timeout=30)
         if resp.status_code == 200:
-            text = resp.text
-            if text.startswith(")]}'\n") or text.startswith(")]}'"):
-                text = text[4:].strip()
-            data = json.loads(text)
+            # 直接在 bytes 上去掉 )]}' 前缀并解析，省去整段解码为 str
+            content = resp.content
+            if content.startswith(b")]}'"):
+                content = content[4:].strip()
+            data = json.loads(content)
             key_id = data.get("keyId")
             if key_id:
                 print(f"[验证] ✓ JWT 验证成功 - key_id: {key_id[:50]}...")
@@ -3520,7 +3521,7 @@ def _refresh_single_account_internal(account_idx: int, account: dict, headless:
                             
                             # 步骤2：重置验证码获取的状态（清除 last_max_id，让系统重新记录当前最大邮件ID）
                             try:
-                                if 'tempmail_url' in locals() and tempmail_url and tempmail_url in _tempmail_client_cache:
+                                if tempmail_url and tempmail_url in _tempmail_client_cache:
                                     client = _tempmail_client_cache[tempmail_url]
                                     client.last_max_id = 0
                                     print(f"[登录] ✓ 已重置邮件ID缓存，系统将重新记录当前最大邮件ID")
@@ -25,24 +25,8 @@
 __version__ = "1.0.0"
 __author__ = "ccpopy"
 
-# 认证相关
-from .auth import (
-    JWTManager,
-    check_session_status,
-    ensure_jwt_valid,
-    create_jwt,
-    decode_xsrf_token,
-    on_cookie_refreshed,
-)
-
-# 客户端相关
-from .biz_client import (
-    BizGeminiClient,
-    ChatResponse,
-    ChatImage,
-    ImageThumbnail,
-    build_headers,
-)
+import importlib
+from typing import TYPE_CHECKING, Any
 
 # 配置相关
 from .config import (
@@ -53,10 +37,6 @@ from .config import (
     DEFAULT_CONFIG,
 )
 
-# 适配器
-from .openai_adapter import OpenAICompatClient
-from .anthropic_adapter import AnthropicCompatClient
-
 # 异常类
 from .exceptions import (
     GeminiError,
@@ -82,14 +62,79 @@ from .exceptions import (
 # 日志相关
 from .logger import get_logger, setup_logger, logger
 
-# API Key 管理
-from .api_keys import (
-    generate_api_key,
-    list_api_keys,
-    get_api_key_by_id,
-    validate_api_key,
-    delete_api_key,
-)
+# 较重的子模块（httpx 客户端、适配器、SQLite 等）按需导入：名称 -> 子模块
+_LAZY_ATTRS = {
+    # 认证相关
+    "JWTManager": "auth",
+    "check_session_status": "auth",
+    "check_session_status_async": "auth",
+    "ensure_jwt_valid": "auth",
+    "create_jwt": "auth",
+    "decode_xsrf_token": "auth",
+    "on_cookie_refreshed": "auth",
+    # 客户端相关
+    "BizGeminiClient": "biz_client",
+    "ChatResponse": "biz_client",
+    "ChatDelta": "biz_client",
+    "ChatImage": "biz_client",
+    "ImageThumbnail": "biz_client",
+    "build_headers": "biz_client",
+    # 适配器
+    "OpenAICompatClient": "openai_adapter",
+    "AnthropicCompatClient": "anthropic_adapter",
+    # API Key 管理
+    "generate_api_key": "api_keys",
+    "generate_api_keys": "api_keys",
+    "list_api_keys": "api_keys",
+    "get_api_key_by_id": "api_keys",
+    "validate_api_key": "api_keys",
+    "delete_api_key": "api_keys",
+}
+
+if TYPE_CHECKING:
+    from .auth import (
+        JWTManager,
+        check_session_status,
+        check_session_status_async,
+        ensure_jwt_valid,
+        create_jwt,
+        decode_xsrf_token,
+        on_cookie_refreshed,
+    )
+    from .biz_client import (
+        BizGeminiClient,
+        ChatResponse,
+        ChatDelta,
+        ChatImage,
+        ImageThumbnail,
+        build_headers,
+    )
+    from .openai_adapter import OpenAICompatClient
+    from .anthropic_adapter import AnthropicCompatClient
+    from .api_keys import (
+        generate_api_key,
+        generate_api_keys,
+        list_api_keys,
+        get_api_key_by_id,
+        validate_api_key,
+        delete_api_key,
+    )
+
+
+def __getattr__(name: str) -> Any:
+    """首次访问时导入对应子模块并缓存到模块命名空间（PEP 562）。"""
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(f".{module_name}", __name__)
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list:
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
+
 
 # 导出列表
 __all__ = [
@@ -99,6 +144,7 @@ __all__ = [
     # 认证
     "JWTManager",
     "check_session_status",
+    "check_session_status_async",
     "ensure_jwt_valid",
     "create_jwt",
     "decode_xsrf_token",
@@ -106,6 +152,7 @@ __all__ = [
     # 客户端
     "BizGeminiClient",
     "ChatResponse",
+    "ChatDelta",
     "ChatImage",
     "ImageThumbnail",
     "build_headers",
@@ -143,6 +190,7 @@ __all__ = [
     "logger",
     # API Key
     "generate_api_key",
+    "generate_api_keys",
     "list_api_keys",
     "get_api_key_by_id",
     "validate_api_key",
@@ -6,16 +6,31 @@
 Anthropic API 文档: https://docs.anthropic.com/en/api/messages
 """
 import base64
+import io
+import json
+import os
+import random
 import time
-import uuid
-from typing import Any, Dict, Generator, List, Optional, Union
+from typing import Any, Dict, Generator, Iterator, List, Optional, Union
 
-from .biz_client import BizGeminiClient, ChatResponse
+from .biz_client import BizGeminiClient, ChatImage, ChatResponse
 from .logger import get_logger
 
 # 模块级 logger
 logger = get_logger("anthropic_adapter")
 
+# 消息 ID / 文件名只需唯一、无需密码学安全：使用启动时以 urandom 播种的 PRNG，
+# 避免每次请求都触发一次 urandom 系统调用
+_ID_RNG = random.Random()
+# 多 worker 由 fork 产生时重新播种，避免各 worker 生成相同的 ID 序列
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_ID_RNG.seed)
+
+
+def _random_hex(nbytes: int) -> str:
+    """生成 nbytes 字节长度的随机十六进制字符串。"""
+    return f"{_ID_RNG.getrandbits(nbytes * 8):0{nbytes * 2}x}"
+
 
 def _extract_system_text(system: Optional[Union[str, List[Dict]]]) -> Optional[str]:
     """从 system 参数中提取文本内容。
@@ -64,7 +79,7 @@ def _extract_files_from_messages(messages: List[Dict]) -> List[Dict]:
                             data = source.get("data", "")
                             media_type = source.get("media_type", "application/octet-stream")
                             # 生成文件名
-                            file_name = block.get("name", f"file_{uuid.uuid4().hex[:8]}")
+                            file_name = block.get("name", f"file_{_random_hex(4)}")
                             if not file_name.endswith(media_type.split("/")[-1]):
                                 ext = media_type.split("/")[-1]
                                 if ext == "plain":
@@ -89,15 +104,20 @@ def _flatten_anthropic_messages(
     - content 可以是字符串或 content blocks 列表
     - system 是独立的顶级参数（可以是字符串或数组）
     """
-    lines: List[str] = []
+    # 直接写入单个缓冲区，避免为每条消息构建中间列表再 join
+    buf = io.StringIO()
+    # 已写入内容时，下一段内容前需要先写换行分隔
+    need_sep = False
 
     # 添加 system prompt（如果有）
     system_text = _extract_system_text(system)
     if system_text:
-        lines.append(f"[System]\n{system_text}\n")
+        buf.write("[System]\n")
+        buf.write(system_text)
+        buf.write("\n")
+        need_sep = True
 
     for msg in messages:
-        role = msg.get("role", "user")
         content = msg.get("content", "")
 
         # content 可以是字符串或 content blocks 列表
@@ -105,23 +125,39 @@ def _flatten_anthropic_messages(
             text_content = content
         elif isinstance(content, list):
             # 处理 content blocks: [{"type": "text", "text": "..."}]
-            texts: List[str] = []
-            for block in content:
-                if isinstance(block, dict):
-                    block_type = block.get("type", "")
-                    if block_type == "text":
-                        texts.append(str(block.get("text", "")))
-                    elif block_type == "image":
-                        # 图片暂时跳过，后续可以扩展支持
-                        pass
-            text_content = "\n".join(texts)
+            # 图片等其他类型暂时跳过，后续可以扩展支持；由 str.join 在 C 层直接消费生成器
+            text_content = "\n".join(
+                str(block.get("text", ""))
+                for block in content
+                if isinstance(block, dict) and block.get("type") == "text"
+            )
         else:
             text_content = str(content)
 
         if text_content:
-            lines.append(text_content)
-
-    return "\n".join(lines)
+            if need_sep:
+                buf.write("\n")
+            buf.write(text_content)
+            need_sep = True
+
+    return buf.getvalue()
+
+
+def _build_image_source(img: ChatImage) -> Dict:
+    """构建图片 source 对象（本地图片通过 /api/images/ 提供 URL）。"""
+    if img.base64_data:
+        return {
+            "type": "base64",
+            "media_type": img.mime_type or "image/png",
+            "data": img.base64_data
+        }
+    elif img.local_path:
+        filename = os.path.basename(img.local_path)
+        return {
+            "type": "url",
+            "url": f"/api/images/{filename}"
+        }
+    return {"type": "url", "url": ""}
 
 
 def _build_anthropic_content(response: ChatResponse) -> List[Dict]:
@@ -148,25 +184,10 @@ def _build_anthropic_content(response: ChatResponse) -> List[Dict]:
 
     # 处理图片（Anthropic 格式使用 image block）
     for img in response.images:
-        if img.base64_data:
+        if img.base64_data or img.local_path:
             content_blocks.append({
                 "type": "image",
-                "source": {
-                    "type": "base64",
-                    "media_type": img.mime_type or "image/png",
-                    "data": img.base64_data
-                }
-            })
-        elif img.local_path:
-            # 提供本地文件 URL
-            import os
-            filename = os.path.basename(img.local_path)
-            content_blocks.append({
-                "type": "image",
-                "source": {
-                    "type": "url",
-                    "url": f"/api/images/{filename}"
-                }
+                "source": _build_image_source(img)
             })
 
     # 确保至少有一个 content block
@@ -179,12 +200,70 @@ def _build_anthropic_content(response: ChatResponse) -> List[Dict]:
     return content_blocks
 
 
-def _split_text_chunks(text: str, size: int = 100) -> List[str]:
-    """将文本分割成小块用于流式传输。"""
-    chunks = []
+def _estimate_tokens(text: str) -> int:
+    """估算 token 数量（按 UTF-8 字节数，每 4 字节约 1 个 token）。
+
+    按字节而非字符计数，中日韩文本不会被严重低估。
+    """
+    if not text:
+        return 0
+    return max(1, len(text.encode("utf-8", errors="ignore")) >> 2)
+
+
+# Claude 模型名映射到 Gemini 模型
+_MODEL_MAPPING: Dict[str, Optional[str]] = {
+    # Claude 模型 -> Gemini 等效
+    "claude-haiku-4-5-20251001": "gemini-2.5-flash",
+    "claude-sonnet-4-5-20250929": "gemini-2.5-pro",
+    "claude-opus-4-5-20251101": "gemini-3-pro-preview",
+    # 直接使用 Gemini 模型名
+    "gemini-2.5-pro": "gemini-2.5-pro",
+    "gemini-2.5-flash": "gemini-2.5-flash",
+    "gemini-3-pro-preview": "gemini-3-pro-preview",
+    # 默认
+    "business-gemini": None,
+}
+
+# 前缀匹配表，按前缀长度降序排列以保证最长匹配优先
+_MODEL_PREFIXES = tuple(sorted(_MODEL_MAPPING.items(), key=lambda item: len(item[0]), reverse=True))
+
+# 流式传输时每个 delta 的字符数，过小会产生大量 SSE 事件
+STREAM_CHUNK_SIZE = 1024
+
+
+def _iter_text_chunks(text: str, size: int = STREAM_CHUNK_SIZE) -> Iterator[str]:
+    """将文本按需切分成小块用于流式传输（空文本产生一个空块）。"""
+    if not text:
+        yield ""
+        return
     for i in range(0, len(text), size):
-        chunks.append(text[i:i + size])
-    return chunks if chunks else [""]
+        yield text[i:i + size]
+
+
+# 高频 SSE 事件的预构建模板，只需对文本本身做 JSON 编码（输出与 json.dumps 整个事件一致）
+_SSE_DELTA_TEMPLATE = (
+    'event: content_block_delta\n'
+    'data: {"type": "content_block_delta", "index": %d, "delta": {"type": "%s_delta", "%s": %s}}\n\n'
+)
+_SSE_STOP_TEMPLATE = 'event: content_block_stop\ndata: {"type": "content_block_stop", "index": %d}\n\n'
+
+
+def format_sse_event(event: Dict) -> str:
+    """将流式事件格式化为 SSE 文本（event + data 行）。
+
+    content_block_delta / content_block_stop 占流式事件的绝大多数，
+    使用预构建模板，避免对整个嵌套 dict 递归序列化。
+    """
+    event_type = event.get("type", "unknown")
+    if event_type == "content_block_delta":
+        delta = event["delta"]
+        block_type = delta.get("type", "")[:-len("_delta")]
+        if block_type in ("text", "thinking") and len(delta) == 2 and len(event) == 3:
+            text = json.dumps(delta[block_type], ensure_ascii=False)
+            return _SSE_DELTA_TEMPLATE % (event["index"], block_type, block_type, text)
+    elif event_type == "content_block_stop" and len(event) == 2:
+        return _SSE_STOP_TEMPLATE % event["index"]
+    return f"event: {event_type}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
 
 
 class AnthropicCompatClient:
@@ -200,10 +279,17 @@ class AnthropicCompatClient:
     """
 
     class _Messages:
-        def __init__(self, biz_client: BizGeminiClient, default_model: str = "gemini-2.5-pro", session_name: Optional[str] = None):
+        def __init__(
+            self,
+            biz_client: BizGeminiClient,
+            default_model: str = "gemini-2.5-pro",
+            session_name: Optional[str] = None,
+            stream_chunk_size: int = STREAM_CHUNK_SIZE,
+        ):
             self._biz = biz_client
             self._default_model = default_model
             self._session_name = session_name
+            self._stream_chunk_size = stream_chunk_size
 
         def create(
             self,
@@ -217,6 +303,7 @@ class AnthropicCompatClient:
             top_k: Optional[int] = None,
             stop_sequences: Optional[List[str]] = None,
             metadata: Optional[Dict] = None,
+            thinking: Optional[Dict] = None,
             **kwargs,
         ) -> Union[Dict, Generator[Dict, None, None]]:
             """创建消息完成。
@@ -232,6 +319,7 @@ class AnthropicCompatClient:
                 top_k: Top-k 采样
                 stop_sequences: 停止序列
                 metadata: 元数据
+                thinking: 扩展思考配置，{"type": "enabled", ...} 时返回思考链
 
             Returns:
                 非流式: 完整响应字典
@@ -251,12 +339,14 @@ class AnthropicCompatClient:
                     logger.warning(f"文件上传失败: {e}")
 
             prompt = _flatten_anthropic_messages(messages, system)
-            msg_id = f"msg_{uuid.uuid4().hex[:24]}"
+            msg_id = f"msg_{_random_hex(12)}"
+            # 仅在客户端请求扩展思考时返回思考链
+            include_thoughts = bool(thinking and thinking.get("type") == "enabled")
 
             if not stream:
-                return self._create_sync(model_name, prompt, msg_id, max_tokens)
+                return self._create_sync(model_name, prompt, msg_id, max_tokens, include_thoughts)
             else:
-                return self._create_stream(model_name, prompt, msg_id, max_tokens)
+                return self._create_stream(model_name, prompt, msg_id, max_tokens, include_thoughts)
 
         def _create_sync(
             self,
@@ -264,6 +354,7 @@ class AnthropicCompatClient:
             prompt: str,
             msg_id: str,
             max_tokens: int,
+            include_thoughts: bool = False,
         ) -> Dict:
             """同步创建消息。"""
             # 映射模型名称
@@ -275,7 +366,7 @@ class AnthropicCompatClient:
                 session_name=self._session_name,
                 auto_save_images=True,
                 model_id=model_id,
-                include_thoughts=True,  # 获取思考链
+                include_thoughts=include_thoughts,
             )
 
             # 构建 Anthropic 格式响应
@@ -290,8 +381,8 @@ class AnthropicCompatClient:
                 "stop_reason": "end_turn",
                 "stop_sequence": None,
                 "usage": {
-                    "input_tokens": self._estimate_tokens(prompt),
-                    "output_tokens": self._estimate_tokens(response.text or ""),
+                    "input_tokens": _estimate_tokens(prompt),
+                    "output_tokens": _estimate_tokens(response.text or ""),
                 }
             }
 
@@ -301,21 +392,16 @@ class AnthropicCompatClient:
             prompt: str,
             msg_id: str,
             max_tokens: int,
+            include_thoughts: bool = False,
         ) -> Generator[Dict, None, None]:
-            """流式创建消息，返回 SSE 事件生成器。"""
-            model_id = self._map_model_id(model_name)
+            """流式创建消息，返回 SSE 事件生成器。
 
-            # 获取完整响应，使用指定的 session_name
-            response = self._biz.chat_full(
-                prompt,
-                session_name=self._session_name,
-                auto_save_images=True,
-                model_id=model_id,
-                include_thoughts=True,
-            )
+            上游每产出一段内容就立即转发为 content_block_delta，
+            连续的同类内容（思考 / 正文）合并到同一个 content block 中。
+            """
+            model_id = self._map_model_id(model_name)
 
-            input_tokens = self._estimate_tokens(prompt)
-            output_tokens = 0
+            input_tokens = _estimate_tokens(prompt)
 
             # 1. message_start 事件
             yield {
@@ -336,71 +422,67 @@ class AnthropicCompatClient:
             }
 
             content_index = 0
+            # 当前打开的 content block 类型："thinking" / "text" / None
+            open_block: Optional[str] = None
+            response = ChatResponse()
 
-            # 2. 处理思考链（如果有）
-            for thought in response.thoughts:
-                # content_block_start
-                yield {
-                    "type": "content_block_start",
-                    "index": content_index,
-                    "content_block": {
-                        "type": "thinking",
-                        "thinking": ""
-                    }
-                }
-
-                # 分块发送思考内容
-                for chunk in _split_text_chunks(thought):
-                    output_tokens += len(chunk) // 4
+            # 2. 边接收边转发思考链和文本，使用指定的 session_name
+            for event in self._biz.chat_stream(
+                prompt,
+                session_name=self._session_name,
+                auto_save_images=True,
+                model_id=model_id,
+                include_thoughts=include_thoughts,
+            ):
+                if isinstance(event, ChatResponse):
+                    response = event
+                    continue
+                if not event.text:
+                    continue
+
+                block_type = "thinking" if event.thought else "text"
+                if open_block != block_type:
+                    if open_block is not None:
+                        # content_block_stop
+                        yield {
+                            "type": "content_block_stop",
+                            "index": content_index
+                        }
+                        content_index += 1
+                    # content_block_start
                     yield {
-                        "type": "content_block_delta",
+                        "type": "content_block_start",
                         "index": content_index,
-                        "delta": {
-                            "type": "thinking_delta",
-                            "thinking": chunk
+                        "content_block": {
+                            "type": block_type,
+                            block_type: ""
                         }
                     }
+                    open_block = block_type
 
-                # content_block_stop
-                yield {
-                    "type": "content_block_stop",
-                    "index": content_index
-                }
-
-                content_index += 1
-
-            # 3. 处理文本内容
-            if response.text:
-                # content_block_start
-                yield {
-                    "type": "content_block_start",
-                    "index": content_index,
-                    "content_block": {
-                        "type": "text",
-                        "text": ""
-                    }
-                }
-
-                # 分块发送文本
-                for chunk in _split_text_chunks(response.text):
-                    output_tokens += len(chunk) // 4
+                # 分块发送内容
+                for chunk in _iter_text_chunks(event.text, self._stream_chunk_size):
                     yield {
                         "type": "content_block_delta",
                         "index": content_index,
                         "delta": {
-                            "type": "text_delta",
-                            "text": chunk
+                            "type": f"{block_type}_delta",
+                            block_type: chunk
                         }
                     }
 
-                # content_block_stop
+            # 3. 关闭最后一个内容块
+            if open_block is not None:
                 yield {
                     "type": "content_block_stop",
                     "index": content_index
                 }
-
                 content_index += 1
 
+            output_tokens = _estimate_tokens(response.text)
+            for thought in response.thoughts:
+                output_tokens += _estimate_tokens(thought)
+
             # 4. 处理图片（如果有）
             for img in response.images:
                 if img.local_path or img.base64_data:
@@ -409,7 +491,7 @@ class AnthropicCompatClient:
                         "index": content_index,
                         "content_block": {
                             "type": "image",
-                            "source": self._build_image_source(img)
+                            "source": _build_image_source(img)
                         }
                     }
 
@@ -439,26 +521,12 @@ class AnthropicCompatClient:
 
         def _map_model_id(self, model_name: str) -> Optional[str]:
             """映射模型名称到 Gemini 模型 ID。"""
-            # Claude 模型名映射到 Gemini 模型
-            model_mapping = {
-                # Claude 模型 -> Gemini 等效
-                "claude-haiku-4-5-20251001": "gemini-2.5-flash",
-                "claude-sonnet-4-5-20250929": "gemini-2.5-pro",
-                "claude-opus-4-5-20251101": "gemini-3-pro-preview",
-                # 直接使用 Gemini 模型名
-                "gemini-2.5-pro": "gemini-2.5-pro",
-                "gemini-2.5-flash": "gemini-2.5-flash",
-                "gemini-3-pro-preview": "gemini-3-pro-preview",
-                # 默认
-                "business-gemini": None,
-            }
-
             # 检查完整名称
-            if model_name in model_mapping:
-                return model_mapping[model_name]
+            if model_name in _MODEL_MAPPING:
+                return _MODEL_MAPPING[model_name]
 
-            # 检查前缀匹配
-            for prefix, target in model_mapping.items():
+            # 检查前缀匹配（最长前缀优先）
+            for prefix, target in _MODEL_PREFIXES:
                 if model_name.startswith(prefix):
                     return target
 
@@ -469,31 +537,14 @@ class AnthropicCompatClient:
             # 默认使用 auto
             return None
 
-        def _build_image_source(self, img) -> Dict:
-            """构建图片 source 对象。"""
-            if img.base64_data:
-                return {
-                    "type": "base64",
-                    "media_type": img.mime_type or "image/png",
-                    "data": img.base64_data
-                }
-            elif img.local_path:
-                import os
-                filename = os.path.basename(img.local_path)
-                return {
-                    "type": "url",
-                    "url": f"/api/images/{filename}"
-                }
-            return {"type": "url", "url": ""}
-
-        def _estimate_tokens(self, text: str) -> int:
-            """估算 token 数量（简单估算：每4个字符约1个token）。"""
-            if not text:
-                return 0
-            return max(1, len(text) // 4)
-
-    def __init__(self, biz_client: BizGeminiClient, default_model: str = "gemini-2.5-pro", session_name: Optional[str] = None):
-        self.messages = self._Messages(biz_client, default_model, session_name)
+    def __init__(
+        self,
+        biz_client: BizGeminiClient,
+        default_model: str = "gemini-2.5-pro",
+        session_name: Optional[str] = None,
+        stream_chunk_size: int = STREAM_CHUNK_SIZE,
+    ):
+        self.messages = self._Messages(biz_client, default_model, session_name, stream_chunk_size)
         self._biz = biz_client
         self._session_name = session_name
 
@@ -2,17 +2,29 @@
 
 提供 API Key 的生成、存储、验证等功能。
 使用 SQLite3 数据库存储 API Keys。
+
+并发模型：数据库为 WAL 模式，没有全局 Python 锁。读操作从有界只读连接池借用连接，
+互不阻塞；所有写操作经由唯一的写连接（由 _writer_lock 串行化）执行。
 """
+import atexit
+import base64
+import hashlib
+import hmac
 import logging
 import os
+import queue
 import secrets
 import shutil
 import sqlite3
-import string
 import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import Iterator, List, Optional, Dict, Any
+
+from .exceptions import ConfigurationError
 
 # 模块级 logger
 logger = logging.getLogger("api_keys")
@@ -22,9 +34,58 @@ PROJECT_ROOT = Path(__file__).parent.parent
 DATA_DIR = PROJECT_ROOT / "data"
 DB_FILE = DATA_DIR / "api_keys.db"
 OLD_DB_FILE = PROJECT_ROOT / "api_keys.db"  # 旧位置，用于迁移
+MIGRATED_MARKER = ".migrated"  # 迁移完成标记文件（位于 data 目录）
+INITIALIZED_MARKER = ".initialized"  # 建表完成标记文件，内容为表结构版本
+INIT_LOCK_FILE = ".init.lock"  # 多进程初始化互斥用的锁文件
+# 只读模式：仅做验证的 worker 设置 API_KEYS_READ_ONLY=1，不初始化数据库、不记录最后使用时间，写操作抛出异常
+READ_ONLY = os.getenv("API_KEYS_READ_ONLY", "").lower() in ("1", "true", "yes")
+# 只读模式下额外以 immutable=1 打开（SQLite 跳过全部文件锁与变更检测）。
+# 仅当数据库在进程运行期间不会被任何进程修改时才可开启，否则可能读到不一致的数据
+IMMUTABLE = READ_ONLY and os.getenv("API_KEYS_IMMUTABLE", "").lower() in ("1", "true", "yes")
+
+# 表结构（建表/索引）变化时递增，使已有部署重新执行 init_db
+SCHEMA_VERSION = "1"
+
+# WAL 下读可以并发、写只能串行：读操作从有界只读连接池借用连接，写操作共用一个写连接
+_READ_POOL_SIZE = 4
+_read_pool: Optional["_ReadPool"] = None
+_read_pool_lock = threading.Lock()
+_writer_lock = threading.Lock()
+_writer_conn: Optional[sqlite3.Connection] = None
+_writer_path: Optional[str] = None
+# 所有已打开的连接，用于统一关闭
+_open_connections: set = set()
+_open_connections_lock = threading.Lock()
+
+# last_used_at 批量写入：验证路径只入队，后台线程定期合并为一个事务提交
+_LAST_USED_FLUSH_INTERVAL = 0.2  # 秒
+_LAST_USED_FLUSH_BATCH = 256  # 积压达到该数量时提前刷新
+_last_used_buf: deque = deque()
+_flush_wakeup = threading.Event()
+_flusher_thread: Optional[threading.Thread] = None
+_flusher_lock = threading.Lock()
 
-# 线程锁，确保数据库操作线程安全
-_db_lock = threading.Lock()
+# 启用中的 key 快照：db_path -> (api_key -> id 的映射, 变更检测连接, 加载时的 data_version, 下次检测时刻)，
+# 验证时只做字典查找。本进程内的增删/启停提交后立即更新快照（写时复制，读无需加锁）；
+# 任何连接（包括其他 worker 与本进程的写连接）提交修改都会改变 data_version，
+# 每隔 _ACTIVE_KEYS_CHECK_INTERVAL 秒最多检测一次，发现变化即重新加载
+_active_keys: Dict[str, tuple] = {}
+_active_keys_lock = threading.Lock()
+_ACTIVE_KEYS_CHECK_INTERVAL = 1.0  # 秒
+# PRAGMA data_version 只在同一连接上可比较，因此每个数据库使用一个专用只读连接读取
+_version_conns: Dict[str, sqlite3.Connection] = {}
+_version_lock = threading.Lock()
+
+# 自签名 key：sk-<20 位随机 nonce>_<27 位 HMAC-SHA256 十六进制截断>，总长度与旧格式一致（51）
+# nonce 为 15 字节随机数的 URL 安全 base64（可能含 "-"/"_"，签名部分为十六进制，按最后一个 "_" 拆分）
+# 旧格式 key 只含字母数字、不含 "_"，因此可以据此区分新旧格式
+_KEY_NONCE_BYTES = 15
+_KEY_NONCE_LEN = 20
+_KEY_SIG_LEN = 27
+_KEY_SIG_SEP = "_"
+# 签名密钥保存在数据库中，多个 worker 共享；按数据库路径缓存
+_hmac_secrets: Dict[str, bytes] = {}
+_hmac_secrets_lock = threading.Lock()
 
 
 def _migrate_db_if_needed() -> None:
@@ -32,10 +93,21 @@ def _migrate_db_if_needed() -> None:
     # 确保 data 目录存在
     DATA_DIR.mkdir(parents=True, exist_ok=True)
     
+    # 已迁移过则直接跳过
+    marker = DATA_DIR / MIGRATED_MARKER
+    if marker.exists():
+        return
+    
     # 如果旧文件存在且新文件不存在，执行迁移
     if OLD_DB_FILE.exists() and not DB_FILE.exists():
         try:
-            shutil.move(str(OLD_DB_FILE), str(DB_FILE))
+            try:
+                # 同一文件系统上为原子重命名
+                os.replace(OLD_DB_FILE, DB_FILE)
+            except OSError:
+                # 跨文件系统时退回复制 + 删除
+                shutil.move(str(OLD_DB_FILE), str(DB_FILE))
+            marker.touch()
             logger.info(f"数据库已自动迁移: {OLD_DB_FILE} -> {DB_FILE}")
         except Exception as e:
             logger.warning(f"数据库迁移失败: {e}，将在新位置创建数据库")
@@ -44,32 +116,459 @@ def _migrate_db_if_needed() -> None:
         logger.warning(f"检测到新旧位置都存在数据库文件，使用新位置: {DB_FILE}")
 
 
-def _get_connection() -> sqlite3.Connection:
-    """获取数据库连接"""
-    conn = sqlite3.connect(str(DB_FILE), check_same_thread=False)
+# 每个连接都需要设置的 PRAGMA（journal_mode=WAL 持久化在数据库文件中，只需在 init_db 设置一次）
+_CONNECTION_PRAGMAS = """
+    PRAGMA synchronous=NORMAL;
+    PRAGMA busy_timeout=5000;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-20000;
+    PRAGMA mmap_size=268435456;
+"""
+# 新建数据库时使用的页大小（只能在数据库为空时设置）
+_NEW_DB_PAGE_SIZE = 8192
+# 这些文件系统上 mmap 与文件锁不可靠，SQLite 官方不建议使用
+_NETWORK_FS_TYPES = frozenset({"nfs", "nfs4", "cifs", "smb3", "smbfs", "fuse.sshfs"})
+
+# SQL 语句常量：同一字符串对象反复执行可命中 sqlite3 连接内的预编译语句缓存
+_STATEMENT_CACHE_SIZE = 128
+_SQL_CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS api_keys (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        key TEXT UNIQUE NOT NULL,
+        name TEXT DEFAULT '',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_used_at TIMESTAMP,
+        is_active INTEGER DEFAULT 1
+    )
+"""
+# key 上的 UNIQUE 约束已隐式建立索引（sqlite_autoindex_api_keys_1），不再重复建索引；
+# 列表按 created_at 倒序，为其建索引以免排序时全表扫描
+_SQL_CREATE_INDEXES = """
+    CREATE INDEX IF NOT EXISTS idx_api_keys_created_at ON api_keys(created_at);
+"""
+_SQL_INSERT = "INSERT INTO api_keys (key, name, created_at) VALUES (?, ?, ?)"
+_SQL_LIST = """
+    SELECT id, key, name, created_at, last_used_at, is_active
+    FROM api_keys
+    ORDER BY created_at DESC
+"""
+# 脱敏显示：sk-xxxx...xxxx（显示前7位和后4位），直接在 SQLite 中拼接
+_SQL_LIST_MASKED = """
+    SELECT id,
+           CASE WHEN length(key) > 11 THEN substr(key, 1, 7) || '...' || substr(key, -4) ELSE key END AS key,
+           name, created_at, last_used_at, is_active
+    FROM api_keys
+    ORDER BY created_at DESC
+"""
+_SQL_SELECT_BY_ID = "SELECT id, key, name, created_at, last_used_at, is_active FROM api_keys WHERE id = ?"
+_SQL_SELECT_ACTIVE = "SELECT key, id FROM api_keys WHERE is_active = 1"
+_SQL_SELECT_ACTIVE_ID = "SELECT id FROM api_keys WHERE key = ? AND is_active = 1"
+_SQL_DATA_VERSION = "PRAGMA data_version"
+_SQL_SELECT_KEY_BY_ID = "SELECT key FROM api_keys WHERE id = ?"
+_SQL_UPDATE_LAST_USED = "UPDATE api_keys SET last_used_at = ? WHERE id = ?"
+_SQL_UPDATE_ACTIVE = "UPDATE api_keys SET is_active = ? WHERE id = ?"
+# SQLite >= 3.35 支持 RETURNING：修改的同时取回 key，省去一次 SELECT
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+_SQL_UPDATE_ACTIVE_RETURNING = "UPDATE api_keys SET is_active = ? WHERE id = ? RETURNING key"
+_SQL_DELETE_RETURNING = "DELETE FROM api_keys WHERE id = ? RETURNING key"
+_SQL_SELECT_SECRET = "SELECT value FROM api_key_meta WHERE name = 'hmac_secret'"
+_SQL_DELETE = "DELETE FROM api_keys WHERE id = ?"
+
+
+def _open_connection(db_path: str, read_only: bool = False) -> sqlite3.Connection:
+    """打开新的数据库连接并应用 PRAGMA"""
+    if read_only:
+        uri = f"{Path(db_path).resolve().as_uri()}?mode=ro"
+        if IMMUTABLE:
+            uri += "&immutable=1"
+        conn = sqlite3.connect(
+            uri, uri=True, check_same_thread=False, cached_statements=_STATEMENT_CACHE_SIZE
+        )
+    else:
+        # 写连接自行管理事务（BEGIN IMMEDIATE），避免 sqlite3 模块隐式开启 DEFERRED 事务
+        conn = sqlite3.connect(
+            db_path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=_STATEMENT_CACHE_SIZE,
+        )
+        if conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+            conn.execute(f"PRAGMA page_size={_NEW_DB_PAGE_SIZE}")
     conn.row_factory = sqlite3.Row
+    conn.executescript(_CONNECTION_PRAGMAS)
+    with _open_connections_lock:
+        _open_connections.add(conn)
     return conn
 
 
-def init_db() -> None:
-    """初始化数据库，创建表结构"""
-    with _db_lock:
-        conn = _get_connection()
+def _discard_connection(conn: sqlite3.Connection) -> None:
+    with _open_connections_lock:
+        _open_connections.discard(conn)
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+
+class _ReadPool:
+    """有界只读连接池：按需创建连接，最多 size 个，用完归还复用"""
+
+    def __init__(self, db_path: str, size: int):
+        self.db_path = db_path
+        self.size = size
+        self.closed = False
+        self._idle: queue.Queue = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if not can_create:
+            # 连接数已达上限，等待其他调用方归还
+            return self._idle.get()
+        try:
+            return _open_connection(self.db_path, read_only=True)
+        except BaseException:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if self.closed:
+            _discard_connection(conn)
+        else:
+            self._idle.put(conn)
+
+    def close(self) -> None:
+        self.closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            _discard_connection(conn)
+
+
+@contextmanager
+def _read_connection() -> Iterator[sqlite3.Connection]:
+    """从只读连接池借用一个连接（数据库路径变化时重建连接池）"""
+    global _read_pool
+    db_path = str(DB_FILE)
+    pool = _read_pool
+    if pool is None or pool.closed or pool.db_path != db_path:
+        with _read_pool_lock:
+            pool = _read_pool
+            if pool is None or pool.closed or pool.db_path != db_path:
+                if pool is not None:
+                    pool.close()
+                pool = _read_pool = _ReadPool(db_path, _READ_POOL_SIZE)
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+def _ensure_writable() -> None:
+    if READ_ONLY:
+        raise ConfigurationError("API Key 存储处于只读模式（API_KEYS_READ_ONLY），不允许写入")
+
+
+@contextmanager
+def _write_transaction(db_path: Optional[str] = None) -> Iterator[sqlite3.Connection]:
+    """在唯一的写连接上执行 BEGIN IMMEDIATE 事务，成功提交、异常回滚"""
+    global _writer_conn, _writer_path
+    _ensure_writable()
+    if db_path is None:
+        db_path = str(DB_FILE)
+    with _writer_lock:
+        if _writer_conn is None or _writer_path != db_path:
+            if _writer_conn is not None:
+                _discard_connection(_writer_conn)
+                _writer_conn = None
+            _writer_conn = _open_connection(db_path)
+            _writer_path = db_path
+        conn = _writer_conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+@atexit.register
+def close_connections() -> None:
+    """关闭所有打开的数据库连接，之后的调用会自动重新连接"""
+    global _read_pool, _writer_conn, _writer_path
+    with _read_pool_lock:
+        if _read_pool is not None:
+            _read_pool.close()
+            _read_pool = None
+    with _version_lock:
+        _version_conns.clear()
+    with _writer_lock:
+        _writer_conn = None
+        _writer_path = None
+        with _open_connections_lock:
+            conns = list(_open_connections)
+            _open_connections.clear()
+    for conn in conns:
         try:
-            cursor = conn.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS api_keys (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    key TEXT UNIQUE NOT NULL,
-                    name TEXT DEFAULT '',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_used_at TIMESTAMP,
-                    is_active INTEGER DEFAULT 1
-                )
-            """)
-            conn.commit()
-        finally:
             conn.close()
+        except sqlite3.Error:
+            pass
+
+
+def flush_last_used_updates() -> int:
+    """将积压的 last_used_at 更新写入数据库
+
+    Returns:
+        写入的更新条数
+    """
+    rows_by_path: Dict[str, list] = {}
+    while True:
+        try:
+            db_path, used_at, key_id = _last_used_buf.popleft()
+        except IndexError:
+            break
+        rows_by_path.setdefault(db_path, []).append((used_at, key_id))
+
+    flushed = 0
+    for db_path, rows in rows_by_path.items():
+        if not os.path.exists(db_path):
+            # 数据库已被移除（如测试临时库），没有可更新的记录
+            continue
+        try:
+            with _write_transaction(db_path) as conn:
+                conn.executemany(_SQL_UPDATE_LAST_USED, rows)
+            flushed += len(rows)
+        except sqlite3.Error as e:
+            logger.warning(f"写入 API Key 最后使用时间失败（{len(rows)} 条）: {e}")
+    return flushed
+
+
+# atexit 按注册的逆序执行：先刷新积压的更新，再关闭连接
+atexit.register(flush_last_used_updates)
+
+
+def _flush_loop() -> None:
+    while True:
+        _flush_wakeup.wait(_LAST_USED_FLUSH_INTERVAL)
+        _flush_wakeup.clear()
+        flush_last_used_updates()
+
+
+def _format_timestamp(value: Any) -> Any:
+    """将整数时间戳格式化为本地时间字符串；旧数据中已是字符串的原样返回"""
+    if isinstance(value, int):
+        return datetime.fromtimestamp(value).strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def _record_last_used(key_id: int) -> None:
+    """记录一次 API Key 使用，由后台线程批量落盘"""
+    global _flusher_thread
+    if READ_ONLY:
+        return
+    # 热路径只取整数时间戳，展示时再格式化
+    _last_used_buf.append((str(DB_FILE), int(time.time()), key_id))
+    if len(_last_used_buf) >= _LAST_USED_FLUSH_BATCH:
+        _flush_wakeup.set()
+    if _flusher_thread is None or not _flusher_thread.is_alive():
+        with _flusher_lock:
+            if _flusher_thread is None or not _flusher_thread.is_alive():
+                _flusher_thread = threading.Thread(
+                    target=_flush_loop, name="api-key-last-used", daemon=True
+                )
+                _flusher_thread.start()
+
+
+def _read_data_version(db_path: str) -> tuple:
+    """返回 (变更检测连接, 当前 data_version)，调用方需持有 _version_lock
+
+    任何其他连接提交修改后 data_version 都会改变。
+    """
+    conn = _version_conns.get(db_path)
+    if conn is not None:
+        try:
+            return conn, conn.execute(_SQL_DATA_VERSION).fetchone()[0]
+        except sqlite3.ProgrammingError:
+            # 连接已被 close_connections() 关闭
+            pass
+    conn = _version_conns[db_path] = _open_connection(db_path, read_only=True)
+    return conn, conn.execute(_SQL_DATA_VERSION).fetchone()[0]
+
+
+def reload_active_keys() -> Dict[str, int]:
+    """从数据库重新加载启用中的 key 快照
+
+    Returns:
+        api_key -> id 的映射（只读，勿修改）
+    """
+    db_path = str(DB_FILE)
+    # 持锁查询，保证与写操作的快照更新不会交错覆盖
+    with _active_keys_lock:
+        # 先取 data_version 再查询：查询期间有新提交时下次检测会再次重新加载
+        with _version_lock:
+            version_conn, version = _read_data_version(db_path)
+        with _read_connection() as conn:
+            rows = conn.execute(_SQL_SELECT_ACTIVE).fetchall()
+        keys = {row[0]: row[1] for row in rows}
+        _active_keys[db_path] = (
+            keys, version_conn, version, time.monotonic() + _ACTIVE_KEYS_CHECK_INTERVAL
+        )
+    return keys
+
+
+def _get_active_keys() -> Dict[str, int]:
+    db_path = str(DB_FILE)
+    entry = _active_keys.get(db_path)
+    if entry is None:
+        return reload_active_keys()
+    if time.monotonic() < entry[3]:
+        return entry[0]
+    # 检测间隔已到：只由一个线程执行 PRAGMA，其余线程继续使用当前快照而不排队
+    if not _version_lock.acquire(blocking=False):
+        return entry[0]
+    try:
+        current = _read_data_version(db_path)
+    finally:
+        _version_lock.release()
+    # 检测连接被重建时 data_version 不再可比，同样重新加载
+    if current != entry[1:3]:
+        return reload_active_keys()
+    with _active_keys_lock:
+        entry = _active_keys.get(db_path)
+        if entry is not None and entry[1:3] == current:
+            _active_keys[db_path] = entry[:3] + (time.monotonic() + _ACTIVE_KEYS_CHECK_INTERVAL,)
+    return entry[0] if entry is not None else reload_active_keys()
+
+
+def _lookup_active_key_id(api_key: str) -> Optional[int]:
+    """快照未命中时直接查库，命中则补入快照"""
+    with _read_connection() as conn:
+        row = conn.execute(_SQL_SELECT_ACTIVE_ID, (api_key,)).fetchone()
+    if row is None:
+        return None
+    _update_active_keys(add={api_key: row[0]})
+    return row[0]
+
+
+def _update_active_keys(add: Optional[Dict[str, int]] = None, remove: Optional[str] = None) -> None:
+    """写操作提交后更新快照；快照尚未加载时无需处理"""
+    db_path = str(DB_FILE)
+    with _active_keys_lock:
+        entry = _active_keys.get(db_path)
+        if entry is None:
+            return
+        keys = dict(entry[0])
+        if add:
+            keys.update(add)
+        if remove is not None:
+            keys.pop(remove, None)
+        _active_keys[db_path] = (keys,) + entry[1:]
+
+
+def _get_hmac_secret(db_path: Optional[str] = None) -> Optional[bytes]:
+    """获取（必要时创建）数据库中的 API Key 签名密钥
+
+    只读模式下只读取不创建，密钥尚不存在时返回 None。
+    """
+    if db_path is None:
+        db_path = str(DB_FILE)
+    secret = _hmac_secrets.get(db_path)
+    if secret is not None:
+        return secret
+    if READ_ONLY:
+        try:
+            with _read_connection() as conn:
+                row = conn.execute(_SQL_SELECT_SECRET).fetchone()
+        except sqlite3.OperationalError:
+            row = None
+        if row is None:
+            return None
+        secret = bytes.fromhex(row["value"])
+        _hmac_secrets[db_path] = secret
+        return secret
+    with _hmac_secrets_lock:
+        secret = _hmac_secrets.get(db_path)
+        if secret is None:
+            with _write_transaction(db_path) as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS api_key_meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)"
+                )
+                conn.execute(
+                    "INSERT OR IGNORE INTO api_key_meta (name, value) VALUES ('hmac_secret', ?)",
+                    (secrets.token_hex(32),)
+                )
+                row = conn.execute(_SQL_SELECT_SECRET).fetchone()
+            secret = bytes.fromhex(row["value"])
+            _hmac_secrets[db_path] = secret
+        return secret
+
+
+def _sign_nonce(secret: bytes, nonce: str) -> str:
+    return hmac.new(secret, nonce.encode("ascii"), hashlib.sha256).hexdigest()[:_KEY_SIG_LEN]
+
+
+def _verify_signed_key(body: str) -> bool:
+    """校验新格式 key 的签名（常量时间比较），不访问 api_keys 表"""
+    nonce, _, sig = body.rpartition(_KEY_SIG_SEP)
+    if len(nonce) != _KEY_NONCE_LEN or len(sig) != _KEY_SIG_LEN or not nonce.isascii():
+        return False
+    secret = _get_hmac_secret()
+    if secret is None:
+        # 尚无签名密钥，说明不存在新格式的 key
+        return False
+    return hmac.compare_digest(sig, _sign_nonce(secret, nonce))
+
+
+def _warn_if_network_fs(db_path: Path) -> None:
+    """数据库位于网络文件系统时给出警告（仅 Linux，读取 /proc/mounts）"""
+    try:
+        with open("/proc/mounts", encoding="utf-8") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return
+    target = str(db_path.resolve())
+    best_mount, best_type = "", ""
+    for mount_point, fs_type in mounts:
+        prefix = mount_point.rstrip("/") + "/"
+        if target.startswith(prefix) and len(mount_point) > len(best_mount):
+            best_mount, best_type = mount_point, fs_type
+    if best_type in _NETWORK_FS_TYPES:
+        logger.warning(
+            f"API Key 数据库位于网络文件系统（{best_type}: {best_mount}），"
+            f"mmap 与文件锁可能不可靠，建议将 data 目录放在本地磁盘或 tmpfs 上"
+        )
+
+
+def init_db() -> None:
+    """初始化数据库，创建表结构"""
+    _warn_if_network_fs(DB_FILE)
+    with _write_transaction() as conn:
+        conn.execute(_SQL_CREATE_TABLE)
+        conn.execute(_SQL_CREATE_INDEXES)
+        # 让查询规划器拿到统计信息
+        conn.execute("ANALYZE api_keys")
+    # WAL 模式：读不阻塞写、写入 fsync 更少；该设置持久化在数据库文件中（不能在事务内切换）
+    with _writer_lock:
+        _writer_conn.execute("PRAGMA journal_mode=WAL")
+
+
+def _new_api_key(secret: bytes) -> str:
+    """生成 sk- 前缀 + 20 位随机 nonce + "_" + 签名，验证时可先做签名校验再查库"""
+    nonce = base64.urlsafe_b64encode(os.urandom(_KEY_NONCE_BYTES)).decode("ascii")
+    return f"sk-{nonce}{_KEY_SIG_SEP}{_sign_nonce(secret, nonce)}"
 
 
 def generate_api_key(name: str = "") -> Dict[str, Any]:
@@ -81,33 +580,60 @@ def generate_api_key(name: str = "") -> Dict[str, Any]:
     Returns:
         包含完整 API Key 信息的字典
     """
-    # 生成 sk- 前缀 + 48位随机字符串
-    alphabet = string.ascii_letters + string.digits
-    random_part = ''.join(secrets.choice(alphabet) for _ in range(48))
-    api_key = f"sk-{random_part}"
+    return generate_api_keys([name])[0]
+
+
+def generate_api_keys(names: List[str]) -> List[Dict[str, Any]]:
+    """批量生成 API Key，所有插入在同一个事务中提交
     
-    with _db_lock:
-        conn = _get_connection()
-        try:
-            cursor = conn.cursor()
-            # 使用本地时间
-            local_now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            cursor.execute(
-                "INSERT INTO api_keys (key, name, created_at) VALUES (?, ?, ?)",
-                (api_key, name, local_now)
-            )
-            conn.commit()
-            key_id = cursor.lastrowid
-            
-            return {
-                "id": key_id,
+    Args:
+        names: 每个 API Key 的名称/备注
+        
+    Returns:
+        与 names 顺序一致的 API Key 信息字典列表
+    """
+    _ensure_writable()
+    secret = _get_hmac_secret()
+    # 使用本地时间
+    local_now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    result = []
+    with _write_transaction() as conn:
+        for name in names:
+            api_key = _new_api_key(secret)
+            cursor = conn.execute(_SQL_INSERT, (api_key, name, local_now))
+            result.append({
+                "id": cursor.lastrowid,
                 "key": api_key,
                 "name": name,
                 "created_at": local_now,
                 "is_active": True
+            })
+    _update_active_keys(add={item["key"]: item["id"] for item in result})
+    return result
+
+
+def iter_api_keys(include_full_key: bool = False) -> Iterator[Dict[str, Any]]:
+    """逐行产出 API Key 信息，不一次性加载整张表
+    
+    迭代未结束前会占用一个池连接并保持读事务，调用方应尽快消费完。
+    
+    Args:
+        include_full_key: 是否包含完整的 key，False 则返回脱敏版本
+        
+    Yields:
+        API Key 信息字典
+    """
+    sql = _SQL_LIST if include_full_key else _SQL_LIST_MASKED
+    with _read_connection() as conn:
+        for row in conn.execute(sql):
+            yield {
+                "id": row["id"],
+                "name": row["name"] or "",
+                "created_at": row["created_at"],
+                "last_used_at": _format_timestamp(row["last_used_at"]),
+                "is_active": bool(row["is_active"]),
+                "key": row["key"],
             }
-        finally:
-            conn.close()
 
 
 def list_api_keys(include_full_key: bool = False) -> List[Dict[str, Any]]:
@@ -119,68 +645,24 @@ def list_api_keys(include_full_key: bool = False) -> List[Dict[str, Any]]:
     Returns:
         API Key 列表
     """
-    with _db_lock:
-        conn = _get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT id, key, name, created_at, last_used_at, is_active
-                FROM api_keys
-                ORDER BY created_at DESC
-            """)
-            rows = cursor.fetchall()
-            
-            result = []
-            for row in rows:
-                key_data = {
-                    "id": row["id"],
-                    "name": row["name"] or "",
-                    "created_at": row["created_at"],
-                    "last_used_at": row["last_used_at"],
-                    "is_active": bool(row["is_active"])
-                }
-                
-                full_key = row["key"]
-                if include_full_key:
-                    key_data["key"] = full_key
-                else:
-                    # 脱敏显示：sk-xxxx...xxxx（显示前7位和后4位）
-                    if len(full_key) > 11:
-                        key_data["key"] = f"{full_key[:7]}...{full_key[-4:]}"
-                    else:
-                        key_data["key"] = full_key
-                
-                result.append(key_data)
-            
-            return result
-        finally:
-            conn.close()
+    return list(iter_api_keys(include_full_key))
 
 
 def get_api_key_by_id(key_id: int) -> Optional[Dict[str, Any]]:
     """根据 ID 获取完整的 API Key 信息"""
-    with _db_lock:
-        conn = _get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT id, key, name, created_at, last_used_at, is_active FROM api_keys WHERE id = ?",
-                (key_id,)
-            )
-            row = cursor.fetchone()
-            
-            if row:
-                return {
-                    "id": row["id"],
-                    "key": row["key"],
-                    "name": row["name"] or "",
-                    "created_at": row["created_at"],
-                    "last_used_at": row["last_used_at"],
-                    "is_active": bool(row["is_active"])
-                }
-            return None
-        finally:
-            conn.close()
+    with _read_connection() as conn:
+        row = conn.execute(_SQL_SELECT_BY_ID, (key_id,)).fetchone()
+    
+    if row:
+        return {
+            "id": row["id"],
+            "key": row["key"],
+            "name": row["name"] or "",
+            "created_at": row["created_at"],
+            "last_used_at": _format_timestamp(row["last_used_at"]),
+            "is_active": bool(row["is_active"])
+        }
+    return None
 
 
 def validate_api_key(api_key: str) -> bool:
@@ -194,29 +676,36 @@ def validate_api_key(api_key: str) -> bool:
     """
     if not api_key or not api_key.startswith("sk-"):
         return False
+    # 新格式 key 签名不符直接拒绝，无需查库；旧格式（不含 "_"）没有签名可校验，只查快照
+    signed = _KEY_SIG_SEP in api_key
+    if signed and not _verify_signed_key(api_key[3:]):
+        return False
     
-    with _db_lock:
-        conn = _get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT id, is_active FROM api_keys WHERE key = ?",
-                (api_key,)
-            )
-            row = cursor.fetchone()
-            
-            if row and row["is_active"]:
-                # 更新最后使用时间（本地时间）
-                local_now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                cursor.execute(
-                    "UPDATE api_keys SET last_used_at = ? WHERE id = ?",
-                    (local_now, row["id"])
-                )
-                conn.commit()
-                return True
+    key_id = _get_active_keys().get(api_key)
+    if key_id is None:
+        if not signed:
             return False
-        finally:
-            conn.close()
+        # 签名有效却不在快照中：可能是刚由其他进程创建，以数据库为准
+        key_id = _lookup_active_key_id(api_key)
+        if key_id is None:
+            return False
+    # 最后使用时间异步批量更新，不在请求路径上提交事务
+    _record_last_used(key_id)
+    return True
+
+
+def _modify_returning_key(
+    conn: sqlite3.Connection, sql: str, sql_returning: str, params: tuple, key_id: int
+) -> Optional[str]:
+    """执行按 id 的修改语句并返回被修改行的 key；没有匹配行时返回 None"""
+    if _HAS_RETURNING:
+        row = conn.execute(sql_returning, params).fetchone()
+        return row["key"] if row else None
+    row = conn.execute(_SQL_SELECT_KEY_BY_ID, (key_id,)).fetchone()
+    if row is None:
+        return None
+    conn.execute(sql, params)
+    return row["key"]
 
 
 def delete_api_key(key_id: int) -> bool:
@@ -228,15 +717,14 @@ def delete_api_key(key_id: int) -> bool:
     Returns:
         True 如果删除成功，否则 False
     """
-    with _db_lock:
-        conn = _get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM api_keys WHERE id = ?", (key_id,))
-            conn.commit()
-            return cursor.rowcount > 0
-        finally:
-            conn.close()
+    with _write_transaction() as conn:
+        api_key = _modify_returning_key(
+            conn, _SQL_DELETE, _SQL_DELETE_RETURNING, (key_id,), key_id
+        )
+    if api_key is None:
+        return False
+    _update_active_keys(remove=api_key)
+    return True
 
 
 def toggle_api_key(key_id: int, is_active: bool) -> bool:
@@ -249,21 +737,60 @@ def toggle_api_key(key_id: int, is_active: bool) -> bool:
     Returns:
         True 如果更新成功，否则 False
     """
-    with _db_lock:
-        conn = _get_connection()
+    with _write_transaction() as conn:
+        api_key = _modify_returning_key(
+            conn,
+            _SQL_UPDATE_ACTIVE,
+            _SQL_UPDATE_ACTIVE_RETURNING,
+            (1 if is_active else 0, key_id),
+            key_id,
+        )
+    if api_key is None:
+        return False
+    if is_active:
+        _update_active_keys(add={api_key: key_id})
+    else:
+        _update_active_keys(remove=api_key)
+    return True
+
+
+def _schema_initialized() -> bool:
+    marker = DATA_DIR / INITIALIZED_MARKER
+    try:
+        return DB_FILE.exists() and marker.read_text().strip() == SCHEMA_VERSION
+    except OSError:
+        return False
+
+
+def _initialize() -> None:
+    """导入时初始化：迁移旧数据库并建表
+
+    多 worker 部署下用文件锁保证只有一个进程执行，其余进程看到完成标记后直接跳过，
+    避免每个进程都执行一次写事务。Windows 下不加锁，行为与之前一致。
+    """
+    if READ_ONLY or _schema_initialized():
+        return
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    
+    if os.name == "nt":
+        _migrate_db_if_needed()
+        init_db()
+        return
+    
+    import fcntl
+
+    with open(DATA_DIR / INIT_LOCK_FILE, "w") as lock_fd:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX)
         try:
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE api_keys SET is_active = ? WHERE id = ?",
-                (1 if is_active else 0, key_id)
-            )
-            conn.commit()
-            return cursor.rowcount > 0
+            # 等锁期间可能已由其他进程完成
+            if _schema_initialized():
+                return
+            _migrate_db_if_needed()
+            init_db()
+            (DATA_DIR / INITIALIZED_MARKER).write_text(SCHEMA_VERSION)
         finally:
-            conn.close()
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
 
 
 # 初始化：先迁移旧数据库，再初始化
-_migrate_db_if_needed()
-init_db()
-
+_initialize()
@@ -6,24 +6,37 @@
 - XSRF 令牌处理
 - 浏览器自动登录
 """
+import atexit
 import base64
+import functools
 import hashlib
 import hmac
 import json
+import logging
+import os
+import re
+import threading
 import time
-from http.cookies import SimpleCookie
-from dataclasses import dataclass
+from collections.abc import Mapping
 from datetime import datetime
-from typing import Dict, Optional, Any
+from types import MappingProxyType
+from typing import Dict, Generator, Optional, Any
 
 import httpx
 
+try:
+    import orjson
+    _json_loads = orjson.loads  # 可选依赖，直接解析 bytes，且更快
+except ImportError:
+    _json_loads = json.loads
+
 from .config import (
     TIME_FMT,
     clear_conversation_sessions,
     clear_jwt_cache,
     clear_redis_session_cache,
     cookies_expired,
+    get_auth_state_generation,
     get_cached_jwt,
     get_proxy,
     is_cookie_expired,
@@ -34,6 +47,8 @@ from .config import (
     save_config,
     set_cached_jwt,
 )
+from .constants import REDIS_JWT_EXPIRES_KEY, REDIS_JWT_KEYS, REDIS_JWT_TOKEN_KEY
+from .exceptions import SessionExpiredError, TokenRefreshError
 from .logger import get_logger
 
 # 模块级 logger
@@ -41,6 +56,44 @@ logger = get_logger("auth")
 
 GETOXSRF_URL = "https://business.gemini.google/auth/getoxsrf"
 
+# getoxsrf / refreshcookies 请求的固定请求头（只读），每次请求复制后再加上 cookie
+GETOXSRF_HEADERS = MappingProxyType({
+    "accept": "*/*",
+    "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "origin": "https://business.gemini.google",
+    "referer": "https://business.gemini.google/",
+    "sec-fetch-dest": "empty",
+    "sec-fetch-mode": "cors",
+    "sec-fetch-site": "same-site",
+})
+
+# 预先完成密钥填充的 HMAC 对象，按签名密钥缓存；签名时 copy() 一份再 update，
+# 省去每次重新计算 ipad/opad。密钥随 XSRF token 轮换，数量很少，超出上限直接清空。
+# 注：一次性的 hmac.digest() 在 OpenSSL 3 下每次都要重新初始化 EVP 上下文，
+# 实测比模板 copy() 慢约 40%，与 hmac.new() 相当，因此不改用它
+_HMAC_TEMPLATES: Dict[bytes, "hmac.HMAC"] = {}
+_HMAC_TEMPLATES_MAX = 8
+
+
+def _hmac_sha256(key_bytes: bytes, message: bytes) -> bytes:
+    """使用缓存的 HMAC 模板计算 HMAC-SHA256。"""
+    template = _HMAC_TEMPLATES.get(key_bytes)
+    if template is None:
+        if len(_HMAC_TEMPLATES) >= _HMAC_TEMPLATES_MAX:
+            _HMAC_TEMPLATES.clear()
+        template = _HMAC_TEMPLATES.setdefault(key_bytes, hmac.new(key_bytes, None, hashlib.sha256))
+    mac = template.copy()
+    mac.update(message)
+    return mac.digest()
+
+
+def clear_hmac_templates() -> None:
+    """清除签名相关缓存：HMAC 模板、XSRF 令牌解码结果、JWT header 与 payload 前缀（签名密钥失效时调用）。"""
+    _HMAC_TEMPLATES.clear()
+    decode_xsrf_token.cache_clear()
+    _encoded_jwt_header.cache_clear()
+    _jwt_payload_prefix.cache_clear()
+
 
 def url_safe_b64encode(data: bytes) -> str:
     """将字节数据编码为 URL 安全的 Base64 字符串（无 padding）。
@@ -55,7 +108,14 @@ def url_safe_b64encode(data: bytes) -> str:
         >>> url_safe_b64encode(b"hello")
         'aGVsbG8'
     """
-    return base64.urlsafe_b64encode(data).decode("utf-8").rstrip("=")
+    return _b64url(data).decode("ascii")
+
+
+def _b64url(data: bytes) -> bytes:
+    """url_safe_b64encode 的 bytes 版本，供 JWT 拼接在 bytes 上完成。"""
+    # 在 bytes 上去掉 padding（Base64 输出必为 ASCII）。
+    # 注：JWT 各段只有一两百字节，实测 pybase64 的 SIMD 实现在此尺寸下反而略慢于标准库，因此不引入
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
 
 
 def kq_encode(s: str) -> str:
@@ -72,6 +132,17 @@ def kq_encode(s: str) -> str:
     Returns:
         经过特殊处理后的 URL 安全 Base64 字符串。
     """
+    return _kq_encode_bytes(s).decode("ascii")
+
+
+def _kq_encode_bytes(s: str) -> bytes:
+    """kq_encode 的 bytes 版本。"""
+    # 快速路径：全部字符 <= 255（JWT 的 header/payload 总是如此）时，
+    # 逐字符取值就等价于 latin-1 编码
+    try:
+        return _b64url(s.encode("latin-1"))
+    except UnicodeEncodeError:
+        pass
     byte_arr = bytearray()
     for ch in s:
         val = ord(ch)
@@ -80,9 +151,10 @@ def kq_encode(s: str) -> str:
             byte_arr.append(val >> 8)
         else:
             byte_arr.append(val)
-    return url_safe_b64encode(bytes(byte_arr))
+    return _b64url(bytes(byte_arr))
 
 
+@functools.lru_cache(maxsize=8)
 def decode_xsrf_token(xsrf_token: str) -> bytes:
     """将 XSRF 令牌解码为字节数组，用作 HMAC 签名密钥。
 
@@ -93,12 +165,33 @@ def decode_xsrf_token(xsrf_token: str) -> bytes:
         解码后的字节数组，可用于 JWT 签名。
 
     Note:
-        会自动补齐 Base64 padding。
+        会自动补齐 Base64 padding。同一个令牌在其有效期内会被反复解码，结果按令牌缓存。
     """
-    padding = 4 - len(xsrf_token) % 4
-    if padding != 4:
-        xsrf_token += "=" * padding
-    return base64.urlsafe_b64decode(xsrf_token)
+    return base64.urlsafe_b64decode(xsrf_token + "==="[:-len(xsrf_token) & 3])
+
+
+@functools.lru_cache(maxsize=4)
+def _encoded_jwt_header(key_id: str) -> bytes:
+    """JWT header 只随 key_id 变化，编码结果（Base64url bytes）按 key_id 缓存。"""
+    header = {
+        "alg": "HS256",
+        "typ": "JWT",
+        "kid": key_id,
+    }
+    return _kq_encode_bytes(json.dumps(header, separators=(",", ":")))
+
+
+@functools.lru_cache(maxsize=4)
+def _jwt_payload_prefix(csesidx: str) -> str:
+    """payload 中 iat 之前的部分只随 csesidx 变化，按 csesidx 缓存其紧凑 JSON。
+
+    与 json.dumps(payload, separators=(",", ":")) 的输出逐字节一致，
+    每次签发只需拼接三个整数，省去整份 payload 的 JSON 序列化。
+    """
+    iss = json.dumps("https://business.gemini.google")
+    aud = json.dumps("https://biz-discoveryengine.googleapis.com")
+    sub = json.dumps(f"csesidx/{csesidx}")
+    return f'{{"iss":{iss},"aud":{aud},"sub":{sub},"iat":'
 
 
 def create_jwt(
@@ -126,32 +219,56 @@ def create_jwt(
         >>> key = decode_xsrf_token(xsrf_token)
         >>> jwt, exp = create_jwt(key, "key123", "session456")
     """
-    now = int(time.time())
-    header = {
-        "alg": "HS256",
-        "typ": "JWT",
-        "kid": key_id,
-    }
-    payload = {
-        "iss": "https://business.gemini.google",
-        "aud": "https://biz-discoveryengine.googleapis.com",
-        "sub": f"csesidx/{csesidx}",
-        "iat": now,
-        "exp": now + lifetime,
-        "nbf": now,
-    }
+    now = time.time_ns() // 1_000_000_000
+    payload_json = f'{_jwt_payload_prefix(csesidx)}{now},"exp":{now + lifetime},"nbf":{now}}}'
 
-    header_b64 = kq_encode(json.dumps(header, separators=(",", ":")))
-    payload_b64 = kq_encode(json.dumps(payload, separators=(",", ":")))
-    message = f"{header_b64}.{payload_b64}"
-
-    signature = hmac.new(key_bytes, message.encode("utf-8"), hashlib.sha256).digest()
-    signature_b64 = url_safe_b64encode(signature)
-    token = f"{message}.{signature_b64}"
+    # 各段保持为 Base64url bytes，签名和拼接都直接在 bytes 上进行，最后只解码一次
+    message = b".".join((_encoded_jwt_header(key_id), _kq_encode_bytes(payload_json)))
+    signature_b64 = _b64url(_hmac_sha256(key_bytes, message))
+    token = b".".join((message, signature_b64)).decode("ascii")
     return token, float(now + lifetime)
 
 
-def _build_cookie_header(config: dict) -> tuple[str, dict]:
+_COOKIE_PREVIEW_LEN = 100
+_COOKIE_DEBUG_KEYS = ("cookie_source", "cookie_header_length", "cookie_header_preview")
+
+
+class CookieDebug(Mapping):
+    """Cookie 调试信息，按只读字典访问。
+
+    长度与预览在访问时才计算，热路径上调用方丢弃它时不产生额外分配；
+    实现 Mapping 接口，dict(...) / JSON 序列化的结果与原先的调试字典一致。
+    （不用 dataclass：序列化器会对 dataclass 调用 asdict，从而输出完整 Cookie。）
+    """
+
+    __slots__ = ("cookie_source", "cookie_str")
+
+    def __init__(self, cookie_source: str, cookie_str: str):
+        self.cookie_source = cookie_source
+        self.cookie_str = cookie_str
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "cookie_source":
+            return self.cookie_source
+        if key == "cookie_header_length":
+            return len(self.cookie_str)
+        if key == "cookie_header_preview":
+            if len(self.cookie_str) > _COOKIE_PREVIEW_LEN:
+                return self.cookie_str[:_COOKIE_PREVIEW_LEN] + "..."
+            return self.cookie_str
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(_COOKIE_DEBUG_KEYS)
+
+    def __len__(self) -> int:
+        return len(_COOKIE_DEBUG_KEYS)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+def _build_cookie_header(config: dict) -> tuple[str, CookieDebug]:
     """构造 HTTP Cookie 请求头字符串。
 
     优先使用完整的 cookie_raw，否则从拆分字段拼接。
@@ -166,38 +283,27 @@ def _build_cookie_header(config: dict) -> tuple[str, dict]:
     Returns:
         元组 (cookie_str, debug_info)，其中：
         - cookie_str: 构造的 Cookie 字符串
-        - debug_info: 调试信息字典，包含 cookie_source、cookie_header_length、
+        - debug_info: CookieDebug 调试信息，包含 cookie_source、cookie_header_length、
           cookie_header_preview 等
     """
     cookie_raw = config.get("cookie_raw")
 
     if cookie_raw:
         # 优先使用 cookie_raw（完整的 raw cookie header）
-        cookie_str = cookie_raw
-        debug_info = {
-            "cookie_source": "cookie_raw",
-            "cookie_header_length": len(cookie_str),
-            "cookie_header_preview": cookie_str[:100] + "..." if len(cookie_str) > 100 else cookie_str,
-        }
-    else:
-        # 回退：使用拆分字段拼接
-        secure_c_ses = config.get("secure_c_ses")
-        host_c_oses = config.get("host_c_oses")
-        nid = config.get("nid")
-
-        cookie_str = f"__Secure-C_SES={secure_c_ses}"
-        if host_c_oses:
-            cookie_str += f"; __Host-C_OSES={host_c_oses}"
-        if nid:
-            cookie_str += f"; NID={nid}"
-
-        debug_info = {
-            "cookie_source": "fields",
-            "cookie_header_length": len(cookie_str),
-            "cookie_header_preview": cookie_str[:100] + "..." if len(cookie_str) > 100 else cookie_str,
-        }
+        return cookie_raw, CookieDebug("cookie_raw", cookie_raw)
 
-    return cookie_str, debug_info
+    # 回退：使用拆分字段拼接
+    host_c_oses = config.get("host_c_oses")
+    nid = config.get("nid")
+
+    parts = [f"__Secure-C_SES={config.get('secure_c_ses')}"]
+    if host_c_oses:
+        parts.append(f"__Host-C_OSES={host_c_oses}")
+    if nid:
+        parts.append(f"NID={nid}")
+    cookie_str = "; ".join(parts)
+
+    return cookie_str, CookieDebug("fields", cookie_str)
 
 
 def _parse_cookie_str(cookie_str: str) -> Dict[str, str]:
@@ -209,9 +315,39 @@ def _parse_cookie_str(cookie_str: str) -> Dict[str, str]:
     Returns:
         Cookie 名称到值的映射字典。
     """
-    jar = SimpleCookie()
-    jar.load(cookie_str)
-    return {k: morsel.value for k, morsel in jar.items()}
+    # 直接按 ";" / "=" 偏移扫描，不经过 SimpleCookie 的正则与 Morsel 构造
+    cookies: Dict[str, str] = {}
+    pos = 0
+    n = len(cookie_str)
+    while pos < n:
+        end = cookie_str.find(";", pos)
+        if end < 0:
+            end = n
+        eq = cookie_str.find("=", pos, end)
+        if eq >= 0:
+            name = cookie_str[pos:eq].strip()
+            if name:
+                cookies[name] = cookie_str[eq + 1:end].strip()
+        pos = end + 1
+    return cookies
+
+
+def _parse_setcookie_name_value(header: str) -> Optional[tuple[str, str]]:
+    """从单个 Set-Cookie 头中提取 (name, value)，忽略 Path/Expires 等属性。
+
+    Args:
+        header: Set-Cookie 头的值，如 "NID=abc; Path=/; HttpOnly"。
+
+    Returns:
+        (name, value) 元组；第一段中没有 "=" 时返回 None。
+    """
+    end = header.find(";")
+    if end < 0:
+        end = len(header)
+    eq = header.find("=", 0, end)
+    if eq < 0:
+        return None
+    return header[:eq].strip(), header[eq + 1:end].strip()
 
 
 def check_session_status(config: Optional[dict] = None) -> dict:
@@ -231,92 +367,113 @@ def check_session_status(config: Optional[dict] = None) -> dict:
     if config is None:
         config = load_config()
 
-    secure_c_ses = config.get("secure_c_ses")
-    csesidx = config.get("csesidx")
-
-    if not secure_c_ses or not csesidx:
-        return {
-            "valid": False,
-            "expired": True,
-            "warning": False,
-            "username": None,
-            "error": "缺少凭证信息",
-            "raw_response": None,
-            "cookie_debug": None,
-        }
-
-    # 构造 Cookie 字符串，优先使用 cookie_raw
-    cookie_str, cookie_debug = _build_cookie_header(config)
+    if not config.get("secure_c_ses") or not config.get("csesidx"):
+        return _session_status_missing_credentials()
 
     try:
         # 使用 getoxsrf 验证 session 是否有效
         result = _get_jwt_via_api(config)
-        # 如果成功获取 JWT，说明 session 有效
-        return {
-            "valid": True,
-            "expired": False,
-            "warning": False,
-            "username": None,
-            "error": None,
-            "raw_response": {"keyId": result.get("key_id", "")[:20] + "..."},
-            "cookie_debug": cookie_debug,
-        }
     except Exception as e:
-        error_msg = str(e)
-        # 检查是否是 302 重定向到 refreshcookies（可能需要刷新 Cookie）
-        if "302" in error_msg or "refreshcookies" in error_msg.lower():
-            return {
-                "valid": False,
-                "expired": False,
-                "warning": True,
-                "username": None,
-                "error": f"需要刷新 Cookie: {error_msg}",
-                "raw_response": None,
-                "cookie_debug": cookie_debug,
-            }
-        # 其他错误视为 session 过期
+        return _session_status_from_error(config, e)
+    return _session_status_from_result(result)
+
+
+async def check_session_status_async(config: Optional[dict] = None) -> dict:
+    """check_session_status 的异步版本，供事件循环中的调用方使用，返回结构相同。"""
+    if config is None:
+        config = load_config()
+
+    if not config.get("secure_c_ses") or not config.get("csesidx"):
+        return _session_status_missing_credentials()
+
+    try:
+        result = await _get_jwt_via_api_async(config)
+    except Exception as e:
+        return _session_status_from_error(config, e)
+    return _session_status_from_result(result)
+
+
+def _session_status_missing_credentials() -> dict:
+    """缺少凭证时的 session 状态。"""
+    return {
+        "valid": False,
+        "expired": True,
+        "warning": False,
+        "username": None,
+        "error": "缺少凭证信息",
+        "raw_response": None,
+        "cookie_debug": None,
+    }
+
+
+def _session_status_from_result(result: dict) -> dict:
+    """成功获取 JWT，说明 session 有效。"""
+    return {
+        "valid": True,
+        "expired": False,
+        "warning": False,
+        "username": None,
+        "error": None,
+        "raw_response": {"keyId": result.get("key_id", "")[:20] + "..."},
+        "cookie_debug": result.get("cookie_debug"),
+    }
+
+
+def _session_status_from_error(config: dict, e: Exception) -> dict:
+    """根据 getoxsrf 失败的异常构造 session 状态。"""
+    error_msg = str(e)
+    # 请求失败时拿不到 getoxsrf 的调试信息，按配置重新构造
+    _, cookie_debug = _build_cookie_header(config)
+    # 检查是否是 302 重定向到 refreshcookies（可能需要刷新 Cookie）
+    if "302" in error_msg or "refreshcookies" in error_msg.lower():
         return {
             "valid": False,
-            "expired": True,
-            "warning": False,
+            "expired": False,
+            "warning": True,
             "username": None,
-            "error": error_msg,
+            "error": f"需要刷新 Cookie: {error_msg}",
             "raw_response": None,
             "cookie_debug": cookie_debug,
         }
+    # 其他错误视为 session 过期
+    return {
+        "valid": False,
+        "expired": True,
+        "warning": False,
+        "username": None,
+        "error": error_msg,
+        "raw_response": None,
+        "cookie_debug": cookie_debug,
+    }
 
 
-def _get_jwt_via_api(config: Optional[dict] = None) -> dict:
-    """通过 getoxsrf 接口生成一次 JWT。"""
-    if config is None:
-        config = load_config()
-
-    secure_c_ses = config.get("secure_c_ses")
+def _require_credentials(config: dict) -> str:
+    """校验 getoxsrf 所需凭证，返回 csesidx。"""
     csesidx = config.get("csesidx")
-    if not secure_c_ses or not csesidx:
-        raise ValueError("缺少 secure_c_ses / csesidx，请先运行 `python app.py login`")
+    if not config.get("secure_c_ses") or not csesidx:
+        raise SessionExpiredError("缺少 secure_c_ses / csesidx，请先运行 `python app.py login`")
+    return csesidx
 
-    proxy = get_proxy(config)
-
-    # 调用 getoxsrf（带 refreshcookies 跟随与精简 cookie 回退）
-    resp, _debug = request_getoxsrf(config, allow_minimal_retry=True)
 
+def _parse_getoxsrf_response(resp: httpx.Response, csesidx: str, debug_info: dict) -> dict:
+    """解析 getoxsrf 响应并签发 JWT。"""
     # 检查 HTTP 状态码
     if resp.status_code != 200:
         location = resp.headers.get("location", "")
-        raise ValueError(f"getoxsrf 请求失败: HTTP {resp.status_code}, location: {location}")
+        raise TokenRefreshError(f"getoxsrf 请求失败: HTTP {resp.status_code}, location: {location}")
 
-    text = resp.text
-    if text.startswith(")]}'"):
-        text = text[4:].strip()
+    # 直接解析原始 bytes，省去一次解码为 str 的开销
+    content = resp.content
+    if content.startswith(b")]}'"):
+        content = content[4:].strip()
 
     try:
-        data = json.loads(text)
-    except json.JSONDecodeError as e:
-        raise ValueError(f"getoxsrf 返回非 JSON 数据: {text[:500]}") from e
+        data = _json_loads(content)
+    except ValueError as e:  # json / orjson 的 JSONDecodeError 均为 ValueError 子类
+        raise TokenRefreshError(f"getoxsrf 返回非 JSON 数据: {resp.text[:500]}") from e
 
     if "keyId" not in data or "xsrfToken" not in data:
-        raise ValueError(f"getoxsrf 返回数据缺少必要字段，可能是 Cookie 已过期，请重新登录。返回内容: {data}")
+        raise SessionExpiredError(f"getoxsrf 返回数据缺少必要字段，可能是 Cookie 已过期，请重新登录。返回内容: {data}")
 
     key_id = data["keyId"]
     xsrf_token = data["xsrfToken"]
@@ -328,183 +485,372 @@ def _get_jwt_via_api(config: Optional[dict] = None) -> dict:
         "jwt": jwt,
         "key_id": key_id,
         "expires_at_ts": exp_ts,
+        "cookie_debug": debug_info,
     }
 
 
-def request_getoxsrf(config: Optional[dict] = None, allow_minimal_retry: bool = True) -> tuple[httpx.Response, dict]:
-    """执行 getoxsrf 请求，内建 refreshcookies 跟随与精简 cookie 回退。"""
+def _get_jwt_via_api(config: Optional[dict] = None) -> dict:
+    """通过 getoxsrf 接口生成一次 JWT，结果中附带该次请求的 cookie 调试信息。"""
     if config is None:
         config = load_config()
+    csesidx = _require_credentials(config)
 
-    secure_c_ses = config.get("secure_c_ses")
-    csesidx = config.get("csesidx")
-    if not secure_c_ses or not csesidx:
-        raise ValueError("缺少 secure_c_ses / csesidx，请先运行 `python app.py login`")
+    # 调用 getoxsrf（带 refreshcookies 跟随与精简 cookie 回退）
+    resp, debug_info = request_getoxsrf(config, allow_minimal_retry=True)
+    return _parse_getoxsrf_response(resp, csesidx, debug_info)
 
-    proxy = get_proxy(config)
 
-    # 使用 _build_cookie_header 构造 Cookie（优先使用 cookie_raw）
-    cookie_str, cookie_debug = _build_cookie_header(config)
+async def _get_jwt_via_api_async(config: Optional[dict] = None) -> dict:
+    """_get_jwt_via_api 的异步版本，不阻塞事件循环。"""
+    if config is None:
+        config = load_config()
+    csesidx = _require_credentials(config)
+
+    resp, debug_info = await request_getoxsrf_async(config, allow_minimal_retry=True)
+    return _parse_getoxsrf_response(resp, csesidx, debug_info)
 
-    # 精简版 cookie，只使用核心认证 Cookie
-    minimal_cookie_str = None
-    if secure_c_ses:
-        minimal_cookie_str = f"__Secure-C_SES={secure_c_ses}"
-        if config.get("host_c_oses"):
-            minimal_cookie_str += f"; __Host-C_OSES={config['host_c_oses']}"
-        # 注意：不包含 NID，因为它可能触发 refreshcookies
 
-    url = f"{GETOXSRF_URL}?csesidx={csesidx}"
+# getoxsrf 单次请求超时（秒）
+_GETOXSRF_TIMEOUT = 30.0
 
-    client_kwargs = {
+def _httpx_transport_kwargs(proxy: Optional[str]) -> Dict[str, Any]:
+    """getoxsrf 连接池（transport）的参数。"""
+    transport_kwargs: Dict[str, Any] = {
         "verify": False,
-        "follow_redirects": False,
-        "timeout": 30.0,
+        # JWT 约每 4 分钟刷新一次，默认 5s 的空闲过期会让连接在两次刷新之间被丢弃；
+        # 服务端先关闭的空闲连接会在取用时被检测并重建
+        "limits": httpx.Limits(max_keepalive_connections=4, keepalive_expiry=300),
     }
     if proxy:
-        client_kwargs["proxy"] = proxy
-
-    headers_base = {
-        "accept": "*/*",
-        "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "origin": "https://business.gemini.google",
-        "referer": "https://business.gemini.google/",
-        "sec-fetch-dest": "empty",
-        "sec-fetch-mode": "cors",
-        "sec-fetch-site": "same-site",
+        transport_kwargs["proxy"] = proxy
+    return transport_kwargs
+
+
+def _httpx_client_kwargs(proxy: Optional[str]) -> Dict[str, Any]:
+    """getoxsrf 客户端（同步 / 异步）的公共参数。"""
+    return {
+        **_httpx_transport_kwargs(proxy),
+        "follow_redirects": False,
+        "timeout": _GETOXSRF_TIMEOUT,
     }
 
-    def _send_with_refresh(client: httpx.Client, cookie_header: str) -> httpx.Response:
-        headers = {**headers_base, "cookie": cookie_header}
-        resp = client.get(url, headers=headers)
+
+# getoxsrf 使用的连接池（httpx.HTTPTransport）按代理地址复用，保留 keep-alive 连接与 TLS 上下文，
+# 避免每次刷新 JWT 都重新握手。连接池本身线程安全，锁只保护缓存的查找与创建
+_CLIENT_CACHE: Dict[Optional[str], httpx.HTTPTransport] = {}
+_CLIENT_LOCK = threading.Lock()
+
+
+def _get_httpx_client(proxy: Optional[str]) -> httpx.Client:
+    """返回一个使用指定代理共享连接池的 httpx.Client。
+
+    Client 每次新建（复用已有 transport，开销很小），只承载本次调用的 cookie jar：
+    跟随 refreshcookies 重定向时使用的 Cookie 不会与并发或之前的调用混在一起，
+    请求期间也无需持锁。调用方不要关闭返回的 Client，否则会一并关闭共享连接池。
+    """
+    transport = _CLIENT_CACHE.get(proxy)
+    if transport is None:
+        with _CLIENT_LOCK:
+            transport = _CLIENT_CACHE.get(proxy)
+            if transport is None:
+                transport = _CLIENT_CACHE[proxy] = httpx.HTTPTransport(**_httpx_transport_kwargs(proxy))
+    return httpx.Client(transport=transport, follow_redirects=False, timeout=_GETOXSRF_TIMEOUT)
+
+
+@atexit.register
+def close_httpx_clients() -> None:
+    """关闭所有共享的 getoxsrf 连接池。"""
+    with _CLIENT_LOCK:
+        transports = list(_CLIENT_CACHE.values())
+        _CLIENT_CACHE.clear()
+    for transport in transports:
+        try:
+            transport.close()
+        except Exception as e:
+            logger.debug(f"关闭 httpx 连接池失败: {e}")
+
+
+# 本进程内上次 getoxsrf 成功时使用的 Cookie 变体（"minimal" / "cookie_raw" / "fields"），
+# 下次请求优先使用它，省去一次必然失败的 302 往返；Cookie 刷新后重置
+_LAST_GOOD_VARIANT: Optional[str] = None
+
+
+def _getoxsrf_cookie_candidates(config: dict, cookie_str: str, cookie_source: str) -> list[tuple[str, str]]:
+    """按尝试顺序返回 (cookie_header, variant) 列表。
+
+    默认先试精简版（只含核心认证 Cookie），再试完整版；上次完整版成功时先试完整版。
+    """
+    # 精简版 cookie，只使用核心认证 Cookie
+    # 注意：不包含 NID，因为它可能触发 refreshcookies
+    host_c_oses = config.get("host_c_oses")
+    if host_c_oses:
+        minimal_cookie_str = f"__Secure-C_SES={config['secure_c_ses']}; __Host-C_OSES={host_c_oses}"
+    else:
+        minimal_cookie_str = f"__Secure-C_SES={config['secure_c_ses']}"
+
+    candidates = [(minimal_cookie_str, "minimal")]
+    if cookie_str and cookie_str != minimal_cookie_str:
+        candidates.append((cookie_str, cookie_source))
+    if _LAST_GOOD_VARIANT not in (None, "minimal"):
+        candidates.reverse()
+    return candidates
+
+
+def _merge_refreshed_cookies(cookie_header: str, set_cookie_headers: list[str]) -> Optional[str]:
+    """将 refreshcookies 返回的 Set-Cookie 合并进原 Cookie 头；没有新 Cookie 时返回 None。"""
+    new_cookies = {}
+    for cookie_item in set_cookie_headers:
+        # 解析 Set-Cookie 头，提取 name=value
+        name_value = _parse_setcookie_name_value(cookie_item)
+        if name_value:
+            new_cookies[name_value[0]] = name_value[1]
+    if not new_cookies:
+        return None
+
+    logger.info(f"refreshcookies 返回了新 Cookie: {list(new_cookies.keys())}")
+    # 解析原有 Cookie，合并新 Cookie（新的覆盖旧的）
+    existing_cookies = _parse_cookie_str(cookie_header)
+    existing_cookies.update(new_cookies)
+    return "; ".join(f"{k}={v}" for k, v in existing_cookies.items())
+
+
+def _getoxsrf_debug_info(
+    cookie_source: str,
+    used_cookie_header: str,
+    used_variant: str,
+    resp: httpx.Response,
+    proxy: Optional[str],
+) -> dict:
+    """构造 request_getoxsrf 返回的调试信息。"""
+    return {
+        "cookie_source": cookie_source,
+        "cookie_header_length": len(used_cookie_header),
+        "cookie_header_preview": used_cookie_header[:100] + "..." if len(used_cookie_header) > 100 else used_cookie_header,
+        "used_cookie_variant": used_variant,
+        "status_code": resp.status_code,
+        "location": resp.headers.get("location"),
+        "proxy_used": proxy,
+    }
+
+
+# getoxsrf 交互中的一次请求：(url, 请求头, 是否跟随重定向)
+_GetoxsrfRequest = tuple[str, dict, bool]
+
+
+def _getoxsrf_exchange(
+    url: str, candidates: list[tuple[str, str]], allow_minimal_retry: bool
+) -> Generator[_GetoxsrfRequest, httpx.Response, tuple[httpx.Response, str, str]]:
+    """getoxsrf 的请求序列与重试决策（不做 I/O），同步与异步版本共用。
+
+    逐个 yield 待发送的请求，调用方发送后把响应 send() 回来；
+    结束时返回 (最终响应, 使用的 Cookie 头, Cookie 变体)。
+    """
+
+    def send_with_refresh(cookie_header: str):
+        headers = dict(GETOXSRF_HEADERS)
+        headers["cookie"] = cookie_header
+        resp = yield url, headers, False
         if resp.status_code == 302:
             location = resp.headers.get("location", "")
             if "refreshcookies" in location.lower():
                 logger.info("检测到 refreshcookies 重定向，尝试跟随")
                 # 重要：refreshcookies 请求也需要携带 Cookie
-                resp_refresh = client.get(location, headers=headers, follow_redirects=True)
+                resp_refresh = yield location, headers, True
                 if resp_refresh.status_code in (200, 204, 302, 303):
                     # 关键：从 refreshcookies 响应中提取新的 Cookie，合并到原有 Cookie 中
-                    new_cookies = {}
-                    for cookie_item in resp_refresh.headers.get_list("set-cookie"):
-                        # 解析 Set-Cookie 头，提取 name=value
-                        if "=" in cookie_item:
-                            cookie_part = cookie_item.split(";")[0].strip()
-                            if "=" in cookie_part:
-                                name, value = cookie_part.split("=", 1)
-                                new_cookies[name.strip()] = value.strip()
-
-                    # 如果有新 Cookie，合并到请求头中
-                    if new_cookies:
-                        logger.info(f"refreshcookies 返回了新 Cookie: {list(new_cookies.keys())}")
-                        # 解析原有 Cookie
-                        existing_cookies = {}
-                        for part in cookie_header.split(";"):
-                            part = part.strip()
-                            if "=" in part:
-                                name, value = part.split("=", 1)
-                                existing_cookies[name.strip()] = value.strip()
-                        # 合并新 Cookie（新的覆盖旧的）
-                        existing_cookies.update(new_cookies)
-                        # 重新构造 Cookie 字符串
-                        updated_cookie_header = "; ".join(f"{k}={v}" for k, v in existing_cookies.items())
-                        headers = {**headers_base, "cookie": updated_cookie_header}
-                        logger.info(f"使用更新后的 Cookie 重试 getoxsrf")
-
-                    resp = client.get(url, headers=headers)
+                    updated_cookie_header = _merge_refreshed_cookies(
+                        cookie_header, resp_refresh.headers.get_list("set-cookie")
+                    )
+                    if updated_cookie_header:
+                        headers = {**headers, "cookie": updated_cookie_header}
+                        logger.info("使用更新后的 Cookie 重试 getoxsrf")
+
+                    resp = yield url, headers, False
                 else:
                     logger.warning(f"refreshcookies 请求失败: HTTP {resp_refresh.status_code}")
         return resp
 
-    used_cookie_header = minimal_cookie_str if minimal_cookie_str else cookie_str
-    used_variant = "minimal" if minimal_cookie_str else cookie_debug.get("cookie_source", "cookie_raw")
+    used_cookie_header, used_variant = candidates[0]
+    resp = yield from send_with_refresh(used_cookie_header)
 
-    with httpx.Client(**client_kwargs) as client:
-        # 优先使用精简 Cookie
-        resp = _send_with_refresh(client, used_cookie_header)
+    # 首选 Cookie 仍是 302，换另一种再试
+    if allow_minimal_retry and resp.status_code == 302 and len(candidates) > 1:
+        alt_cookie_header, alt_variant = candidates[1]
+        logger.info(f"getoxsrf 使用 {used_variant} cookie 返回 302，改用 {alt_variant} 再试")
+        alt_resp = yield from send_with_refresh(alt_cookie_header)
+        if alt_resp.status_code != 302:
+            resp = alt_resp
+            used_cookie_header = alt_cookie_header
+            used_variant = alt_variant
 
-        # 若精简 Cookie 仍是 302，尝试完整 cookie_raw（作为备用）
-        if (
-            allow_minimal_retry
-            and resp.status_code == 302
-            and cookie_str
-            and cookie_str != used_cookie_header
-        ):
-            logger.info("getoxsrf 精简 cookie 返回 302，改用完整 cookie_raw 再试")
-            alt_resp = _send_with_refresh(client, cookie_str)
-            if alt_resp.status_code != 302:
-                resp = alt_resp
-                used_cookie_header = cookie_str
-                used_variant = cookie_debug.get("cookie_source", "cookie_raw")
-
-    debug_info = {
-        "cookie_source": cookie_debug.get("cookie_source"),
-        "cookie_header_length": len(used_cookie_header),
-        "cookie_header_preview": used_cookie_header[:100] + "..." if len(used_cookie_header) > 100 else used_cookie_header,
-        "used_cookie_variant": used_variant,
-        "status_code": resp.status_code,
-        "location": resp.headers.get("location"),
-        "proxy_used": proxy,
-    }
+    return resp, used_cookie_header, used_variant
 
-    return resp, debug_info
+
+def _prepare_getoxsrf(config: Optional[dict]) -> tuple[Optional[str], str, str, list[tuple[str, str]]]:
+    """返回 (代理, getoxsrf URL, Cookie 来源, Cookie 候选列表)。"""
+    if config is None:
+        config = load_config()
+    csesidx = _require_credentials(config)
+
+    # 使用 _build_cookie_header 构造 Cookie（优先使用 cookie_raw）
+    cookie_str, cookie_debug = _build_cookie_header(config)
+    cookie_source = cookie_debug.cookie_source
+    candidates = _getoxsrf_cookie_candidates(config, cookie_str, cookie_source)
+    return get_proxy(config), f"{GETOXSRF_URL}?csesidx={csesidx}", cookie_source, candidates
+
+
+def _finish_getoxsrf(
+    outcome: tuple[httpx.Response, str, str], cookie_source: str, proxy: Optional[str]
+) -> tuple[httpx.Response, dict]:
+    """记住成功的 Cookie 变体，返回 (响应, 调试信息)。"""
+    global _LAST_GOOD_VARIANT
+    resp, used_cookie_header, used_variant = outcome
+    if resp.status_code == 200:
+        _LAST_GOOD_VARIANT = used_variant
+    return resp, _getoxsrf_debug_info(cookie_source, used_cookie_header, used_variant, resp, proxy)
+
+
+def request_getoxsrf(config: Optional[dict] = None, allow_minimal_retry: bool = True) -> tuple[httpx.Response, dict]:
+    """执行 getoxsrf 请求，内建 refreshcookies 跟随与精简 cookie 回退。"""
+    proxy, url, cookie_source, candidates = _prepare_getoxsrf(config)
+    exchange = _getoxsrf_exchange(url, candidates, allow_minimal_retry)
+
+    client = _get_httpx_client(proxy)
+    resp = None
+    try:
+        while True:
+            req_url, headers, follow = exchange.send(resp)
+            resp = client.get(req_url, headers=headers, follow_redirects=follow)
+    except StopIteration as stop:
+        outcome = stop.value
+
+    return _finish_getoxsrf(outcome, cookie_source, proxy)
+
+
+async def request_getoxsrf_async(
+    config: Optional[dict] = None, allow_minimal_retry: bool = True
+) -> tuple[httpx.Response, dict]:
+    """request_getoxsrf 的异步版本，使用 httpx.AsyncClient。
+
+    AsyncClient 的连接池绑定事件循环，因此每次调用新建客户端，不进入 _CLIENT_CACHE。
+    """
+    proxy, url, cookie_source, candidates = _prepare_getoxsrf(config)
+    exchange = _getoxsrf_exchange(url, candidates, allow_minimal_retry)
+
+    async with httpx.AsyncClient(**_httpx_client_kwargs(proxy)) as client:
+        resp = None
+        try:
+            while True:
+                req_url, headers, follow = exchange.send(resp)
+                resp = await client.get(req_url, headers=headers, follow_redirects=follow)
+        except StopIteration as stop:
+            outcome = stop.value
+
+    return _finish_getoxsrf(outcome, cookie_source, proxy)
 
 
 # JWT 有效期阈值（秒），超过此时间需要刷新
 JWT_REFRESH_THRESHOLD = 240  # 4 分钟
+# JWT 硬过期阈值（秒）：剩余有效期不足此值时才阻塞调用方同步刷新，
+# 介于两者之间时先返回旧 JWT，同时在后台刷新（stale-while-revalidate）
+JWT_HARD_EXPIRY_THRESHOLD = 30
+
+# 进程内刷新锁：同一进程内的所有 JWTManager 共用，避免并发请求同时调用 getoxsrf
+_JWT_REFRESH_LOCK = threading.Lock()
+# 跨进程刷新锁（Redis SET NX）：多 worker 时只有一个进程去刷新，其余等待其结果
+_JWT_REFRESH_LOCK_KEY = "jwt_refresh_lock"
+# 持锁进程崩溃时锁自动释放；须长于一次刷新的最坏耗时：两种 Cookie 各最多 3 次请求
+# （getoxsrf、refreshcookies、重试），每次最长 _GETOXSRF_TIMEOUT 秒
+_JWT_REFRESH_LOCK_TTL = int(_GETOXSRF_TIMEOUT * 6) + 20
+_JWT_REFRESH_WAIT = 5.0  # 秒，等待其他 worker 刷新结果的最长时间
+_JWT_REFRESH_POLL_INTERVAL = 0.1
+
+# 保证同一时刻最多只有一个后台刷新线程
+_BACKGROUND_REFRESH_LOCK = threading.Lock()
+
+# ensure_jwt_valid() 无参调用时的命中结果快照：(monotonic 时刻, 代数, 阈值, 结果)。
+# 短时间内的连续调用复用它，省去 load_config() 读盘与 is_cookie_expired() 查询；
+# clear_jwt_cache() / mark_cookie_expired() 会递增认证状态代数使快照失效。
+# 元组整体替换，多线程读写无需加锁
+_ENSURE_JWT_SNAPSHOT: Optional[tuple[float, int, int, dict]] = None
+_ENSURE_JWT_SNAPSHOT_TTL = 1.0
 
 
-@dataclass
 class JWTManager:
     """管理 JWT，自动在过期前刷新。
 
     支持Redis共享缓存（多worker模式）和全局内存缓存（单worker模式）。
     当 Cookie 刷新后，需要调用 invalidate() 清除缓存。
-    """
 
-    config: dict
-    _jwt: Optional[str] = None
-    _expires_at_ts: float = 0.0
-    use_global_cache: bool = True  # 是否使用全局缓存
-    _redis_manager: Optional[Any] = None  # Redis管理器实例
+    每个请求都会访问实例属性，因此使用 __slots__ 而非 dataclass：
+    没有实例 __dict__，缓存命中路径上的属性读取更快，也不会在 repr 中带出 config/JWT。
+    """
 
-    def __post_init__(self):
+    __slots__ = (
+        "config",
+        "_jwt",
+        "_expires_at_ts",
+        "use_global_cache",  # 是否使用全局缓存
+        "_redis_manager",  # Redis管理器实例
+        "_redis_enabled",  # 初始化时确定，热路径不再逐次查询
+        "_fresh_until",  # 实例 JWT 无需刷新的截止时刻（time.monotonic()，已扣除 60s 余量）
+    )
+
+    def __init__(
+        self,
+        config: dict,
+        jwt: Optional[str] = None,
+        expires_at_ts: float = 0.0,
+        use_global_cache: bool = True,
+    ):
         """初始化时创建 Redis 管理器。"""
+        self.config = config
+        self._jwt: Optional[str] = None
+        self._expires_at_ts = 0.0
+        self.use_global_cache = use_global_cache
+        self._redis_manager: Optional[Any] = None
+        self._redis_enabled = False
+        self._fresh_until = 0.0
+
         try:
             from .redis_manager import get_redis_manager
             self._redis_manager = get_redis_manager(self.config)
-            if self._redis_manager.is_redis_enabled():
+            self._redis_enabled = self._redis_manager.is_redis_enabled()
+            if self._redis_enabled:
                 logger.info("JWTManager: 使用 Redis 存储 JWT")
             else:
                 logger.debug("JWTManager: Redis 未启用，使用内存存储 JWT")
         except Exception as e:
             logger.warning(f"Redis 初始化失败，降级到内存存储: {e}")
             self._redis_manager = None
+            self._redis_enabled = False
+
+        if jwt:
+            self._set_jwt(jwt, expires_at_ts)
 
     def _get_cached_jwt_from_redis(self) -> tuple[Optional[str], float]:
         """从 Redis 获取缓存的 JWT。"""
-        if not self._redis_manager or not self._redis_manager.is_redis_enabled():
+        if not self._redis_enabled:
             return None, 0.0
 
         try:
-            jwt_data = self._redis_manager.get_json("jwt_token")
-            if jwt_data and isinstance(jwt_data, dict):
-                return jwt_data.get("token"), jwt_data.get("expires_at", 0.0)
+            token, expires_at = self._redis_manager.mget(REDIS_JWT_KEYS)
+            if token and expires_at:
+                return token, float(expires_at)
         except Exception as e:
             logger.debug(f"从 Redis 读取 JWT 失败: {e}")
         return None, 0.0
 
     def _set_cached_jwt_to_redis(self, jwt: str, expires_at: float) -> None:
         """将 JWT 保存到 Redis。"""
-        if not self._redis_manager or not self._redis_manager.is_redis_enabled():
+        if not self._redis_enabled:
             return
 
         try:
             ttl = int(expires_at - time.time())
             if ttl > 0:
-                self._redis_manager.set_json(
-                    "jwt_token",
-                    {"token": jwt, "expires_at": expires_at},
+                self._redis_manager.set_many(
+                    {REDIS_JWT_TOKEN_KEY: jwt, REDIS_JWT_EXPIRES_KEY: repr(expires_at)},
                     ex=ttl + 60  # 额外 60 秒容错
                 )
         except Exception as e:
@@ -512,65 +858,138 @@ class JWTManager:
 
     def _clear_jwt_from_redis(self) -> None:
         """从 Redis 清除 JWT。"""
-        if not self._redis_manager or not self._redis_manager.is_redis_enabled():
+        if not self._redis_enabled:
             return
 
         try:
-            self._redis_manager.delete("jwt_token")
+            for key in REDIS_JWT_KEYS:
+                self._redis_manager.delete(key)
         except Exception as e:
             logger.debug(f"从 Redis 删除 JWT 失败: {e}")
 
-    def get_jwt(self) -> str:
-        """获取有效的 JWT，必要时自动刷新。"""
-        now = time.time()
+    def _set_jwt(self, jwt: Optional[str], expires_at: float) -> None:
+        """更新实例缓存，并换算出基于 time.monotonic() 的刷新截止时刻。"""
+        self._jwt = jwt
+        self._expires_at_ts = expires_at
+        if jwt:
+            self._fresh_until = time.monotonic() + (expires_at - time.time() - 60)
+        else:
+            self._fresh_until = 0.0
 
-        # 优先从Redis获取（如果启用）
-        if self._redis_manager and self._redis_manager.is_redis_enabled():
+    def _get_valid_cached_jwt(self, now: float) -> Optional[str]:
+        """依次检查实例缓存、Redis 和全局内存缓存，返回剩余有效期超过 60s 的 JWT。"""
+        # 实例缓存仍新鲜时直接使用，不访问 Redis / 全局缓存
+        if self._jwt and time.monotonic() < self._fresh_until:
+            return self._jwt
+
+        # 其次从Redis获取（如果启用）
+        if self._redis_enabled:
             cached_jwt, cached_expires = self._get_cached_jwt_from_redis()
             if cached_jwt and cached_expires > now + 60:
-                self._jwt = cached_jwt
-                self._expires_at_ts = cached_expires
+                self._set_jwt(cached_jwt, cached_expires)
                 return cached_jwt
 
         # 回退到全局内存缓存
         if self.use_global_cache:
             cached_jwt, cached_expires = get_cached_jwt()
             if cached_jwt and cached_expires > now + 60:
-                self._jwt = cached_jwt
-                self._expires_at_ts = cached_expires
+                self._set_jwt(cached_jwt, cached_expires)
                 # 同步到Redis
-                if self._redis_manager and self._redis_manager.is_redis_enabled():
+                if self._redis_enabled:
                     self._set_cached_jwt_to_redis(cached_jwt, cached_expires)
                 return cached_jwt
+        return None
+
+    def get_jwt(self) -> str:
+        """获取有效的 JWT，必要时自动刷新。
+
+        实例缓存命中时只做一次单调时钟比较；未命中时加锁后再检查一次（双重检查），
+        保证同一时刻只有一个线程刷新；启用 Redis 时再用跨进程锁合并多个 worker 的刷新。
+        """
+        jwt = self._jwt
+        if jwt and time.monotonic() < self._fresh_until:
+            return jwt
 
-        # 检查实例缓存，提前 60s 刷新
-        if not self._jwt or now > self._expires_at_ts - 60:
+        now = time.time()
+        cached_jwt = self._get_valid_cached_jwt(now)
+        if cached_jwt:
+            return cached_jwt
+
+        with _JWT_REFRESH_LOCK:
+            # 等锁期间的耗时远小于 60s 的提前刷新余量，沿用同一个 now
+            cached_jwt = self._get_valid_cached_jwt(now)
+            if cached_jwt:
+                return cached_jwt
+            if self._refresh_if_leader():
+                return self._jwt  # type: ignore[return-value]
+
+        # 其他 worker 持有跨进程刷新锁：在进程锁之外等待其结果，
+        # 不阻塞本进程的 ensure_jwt_valid() 与后台刷新
+        cached_jwt = self._wait_for_other_worker()
+        if cached_jwt:
+            return cached_jwt
+
+        logger.debug("等待其他 worker 刷新 JWT 超时，自行刷新")
+        with _JWT_REFRESH_LOCK:
+            cached_jwt = self._get_valid_cached_jwt(time.time())
+            if cached_jwt:
+                return cached_jwt
             self.refresh()
         return self._jwt  # type: ignore[return-value]
 
+    def _refresh_if_leader(self) -> bool:
+        """未启用 Redis 或抢到跨进程刷新锁时刷新并返回 True；锁被其他 worker 持有时返回 False。"""
+        if not self._redis_enabled:
+            self.refresh()
+            return True
+
+        lock_value = f"{os.getpid()}:{threading.get_ident()}:{time.time()}"
+        if not self._redis_manager.set_nx(_JWT_REFRESH_LOCK_KEY, lock_value, ex=_JWT_REFRESH_LOCK_TTL):
+            return False
+        try:
+            self.refresh()
+        finally:
+            # 只释放自己的锁：刷新超过 TTL 时锁可能已被其他 worker 重新获取
+            self._redis_manager.delete_if_equals(_JWT_REFRESH_LOCK_KEY, lock_value)
+        return True
+
+    def _wait_for_other_worker(self) -> Optional[str]:
+        """轮询 Redis，等待其他 worker 写入新 JWT；超时返回 None。"""
+        deadline = time.monotonic() + _JWT_REFRESH_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(_JWT_REFRESH_POLL_INTERVAL)
+            cached_jwt, cached_expires = self._get_cached_jwt_from_redis()
+            if cached_jwt and cached_expires > time.time() + 60:
+                self._set_jwt(cached_jwt, cached_expires)
+                return cached_jwt
+        return None
+
     def refresh(self) -> None:
         """刷新 JWT。"""
-        result = _get_jwt_via_api(self.config)
-        self._jwt = result["jwt"]
-        self._expires_at_ts = result["expires_at_ts"]
+        self._store_refreshed(_get_jwt_via_api(self.config))
+
+    def _store_refreshed(self, result: dict) -> None:
+        """保存刷新结果到实例、Redis 与全局内存缓存。"""
+        self._set_jwt(result["jwt"], result["expires_at_ts"])
 
         # 更新 Redis 缓存
-        if self._redis_manager and self._redis_manager.is_redis_enabled():
+        if self._redis_enabled:
             self._set_cached_jwt_to_redis(self._jwt, self._expires_at_ts)
 
         # 更新全局内存缓存
         if self.use_global_cache:
             set_cached_jwt(self._jwt, self._expires_at_ts)
 
-        logger.debug(f"JWT 已刷新，过期时间: {datetime.fromtimestamp(self._expires_at_ts).strftime('%H:%M:%S')}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"JWT 已刷新，过期时间: {time.strftime('%H:%M:%S', time.localtime(self._expires_at_ts))}")
 
     def invalidate(self) -> None:
         """使 JWT 缓存失效（Cookie 刷新后调用）。"""
-        self._jwt = None
-        self._expires_at_ts = 0.0
+        self._set_jwt(None, 0.0)
+        clear_hmac_templates()
 
         # 清除 Redis 缓存
-        if self._redis_manager and self._redis_manager.is_redis_enabled():
+        if self._redis_enabled:
             self._clear_jwt_from_redis()
 
         # 清除全局内存缓存
@@ -583,7 +1002,9 @@ class JWTManager:
 def ensure_jwt_valid(config: Optional[dict] = None, threshold_seconds: int = JWT_REFRESH_THRESHOLD) -> dict:
     """确保 JWT 有效，必要时刷新。
 
-    这是所有对外请求入口应该调用的函数。
+    这是所有对外请求入口应该调用的函数。剩余有效期不足 threshold_seconds
+    但仍超过 JWT_HARD_EXPIRY_THRESHOLD 时直接返回旧 JWT 并在后台刷新，
+    只有没有可用 JWT 时才阻塞等待刷新。
 
     Args:
         config: 配置字典，如果为 None 则自动加载
@@ -598,7 +1019,19 @@ def ensure_jwt_valid(config: Optional[dict] = None, threshold_seconds: int = JWT
             "error": str | None,
         }
     """
-    if config is None:
+    global _ENSURE_JWT_SNAPSHOT
+    use_snapshot = config is None
+    if use_snapshot:
+        # 先读代数再检查状态：检查期间若状态变化，存下的快照会因代数过旧而失效
+        generation = get_auth_state_generation()
+        snapshot = _ENSURE_JWT_SNAPSHOT
+        if (
+            snapshot is not None
+            and snapshot[1] == generation
+            and snapshot[2] == threshold_seconds
+            and time.monotonic() - snapshot[0] < _ENSURE_JWT_SNAPSHOT_TTL
+        ):
+            return dict(snapshot[3])
         config = load_config()
 
     # 检查 Cookie 是否已标记为过期
@@ -619,11 +1052,24 @@ def ensure_jwt_valid(config: Optional[dict] = None, threshold_seconds: int = JWT
             "error": "缺少凭证信息",
         }
 
-    now = time.time()
-
     # 检查全局缓存
     cached_jwt, cached_expires = get_cached_jwt()
-    if cached_jwt and cached_expires > now + threshold_seconds:
+    remaining = cached_expires - time.time() if cached_jwt else 0.0
+    if remaining > threshold_seconds:
+        result = {
+            "valid": True,
+            "jwt": cached_jwt,
+            "refreshed": False,
+            "error": None,
+        }
+        if use_snapshot:
+            _ENSURE_JWT_SNAPSHOT = (time.monotonic(), generation, threshold_seconds, result)
+            return dict(result)
+        return result
+
+    # 即将过期但仍可用：直接返回旧 JWT，后台刷新
+    if remaining > JWT_HARD_EXPIRY_THRESHOLD:
+        _schedule_background_refresh(config, threshold_seconds)
         return {
             "valid": True,
             "jwt": cached_jwt,
@@ -631,7 +1077,21 @@ def ensure_jwt_valid(config: Optional[dict] = None, threshold_seconds: int = JWT
             "error": None,
         }
 
-    # 需要刷新 JWT
+    # 没有可用的 JWT，阻塞刷新；加锁后再检查一次，后台线程可能刚刚刷新完成
+    with _JWT_REFRESH_LOCK:
+        cached_jwt, cached_expires = get_cached_jwt()
+        if cached_jwt and cached_expires > time.time() + JWT_HARD_EXPIRY_THRESHOLD:
+            return {
+                "valid": True,
+                "jwt": cached_jwt,
+                "refreshed": False,
+                "error": None,
+            }
+        return _refresh_global_jwt(config)
+
+
+def _refresh_global_jwt(config: dict) -> dict:
+    """通过 getoxsrf 刷新 JWT 并写入全局缓存，返回 ensure_jwt_valid 格式的结果。"""
     try:
         result = _get_jwt_via_api(config)
         jwt = result["jwt"]
@@ -643,7 +1103,7 @@ def ensure_jwt_valid(config: Optional[dict] = None, threshold_seconds: int = JWT
         # 标记 Cookie 有效
         mark_cookie_valid()
 
-        logger.info(f"JWT 已刷新，过期时间: {datetime.fromtimestamp(expires_at).strftime('%H:%M:%S')}")
+        logger.info(f"JWT 已刷新，过期时间: {time.strftime('%H:%M:%S', time.localtime(expires_at))}")
 
         return {
             "valid": True,
@@ -668,19 +1128,48 @@ def ensure_jwt_valid(config: Optional[dict] = None, threshold_seconds: int = JWT
         }
 
 
+def _schedule_background_refresh(config: dict, threshold_seconds: int) -> None:
+    """在后台线程中刷新 JWT；已有后台刷新在进行时直接返回。"""
+    if not _BACKGROUND_REFRESH_LOCK.acquire(blocking=False):
+        return
+
+    def _run() -> None:
+        try:
+            with _JWT_REFRESH_LOCK:
+                cached_jwt, cached_expires = get_cached_jwt()
+                if cached_jwt and cached_expires > time.time() + threshold_seconds:
+                    return
+                _refresh_global_jwt(config)
+        finally:
+            _BACKGROUND_REFRESH_LOCK.release()
+
+    try:
+        threading.Thread(target=_run, name="jwt-background-refresh", daemon=True).start()
+    except Exception:
+        _BACKGROUND_REFRESH_LOCK.release()
+        raise
+
+
 def on_cookie_refreshed() -> None:
     """Cookie 刷新后的回调，清理 JWT 和 session 缓存"""
+    global _LAST_GOOD_VARIANT
+    _LAST_GOOD_VARIANT = None
     clear_jwt_cache()
+    clear_hmac_templates()
     clear_conversation_sessions()
     clear_redis_session_cache()  # 清除 Redis 中的旧 session 缓存，避免 403 错误
     mark_cookie_valid()
     logger.info("Cookie 已刷新，JWT 和 session 缓存已清除")
 
 
+_CSESIDX_RE = re.compile(r"[?&]csesidx=([^&#]+)")
+_GROUP_ID_RE = re.compile(r"/cid/([^/?#]+)")
+
+
 def _parse_csesidx_from_url(url: str) -> Optional[str]:
-    if "csesidx=" in url:
-        return url.split("csesidx=", 1)[1].split("&", 1)[0]
-    return None
+    """从 URL 查询参数中提取 csesidx。"""
+    match = _CSESIDX_RE.search(url)
+    return match.group(1) if match else None
 
 
 def _parse_group_id_from_url(url: str) -> Optional[str]:
@@ -689,15 +1178,10 @@ def _parse_group_id_from_url(url: str) -> Optional[str]:
     https://business.gemini.google/home/cid/51518926-c5e4-4372-b9c1-b4e6f2afa7ed/r/research/...
     中提取 GROUP_ID（原 CONFIG_ID）。
     """
-    marker = "/cid/"
-    if marker not in url:
-        return None
-    after = url.split(marker, 1)[1]
-    if not after:
+    match = _GROUP_ID_RE.search(url)
+    if not match:
         return None
-    for sep in ("/", "?", "#"):
-        after = after.split(sep, 1)[0]
-    return sanitize_group_id(after)
+    return sanitize_group_id(match.group(1))
 
 
 async def login_via_browser() -> dict:
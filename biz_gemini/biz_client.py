@@ -1,17 +1,20 @@
 import base64
 import json
 import os
+import re
 import uuid
 import time
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Dict, List, Optional
+from types import MappingProxyType
+from typing import Any, Dict, Generator, List, Optional, Union
 
 import urllib3
 import requests
 
-from .auth import JWTManager
+from .auth import JWTManager, _json_loads
 from .config import get_proxy
+from .exceptions import AuthenticationError
 from .logger import get_logger
 
 # 模块级 logger
@@ -288,6 +291,154 @@ class ChatResponse:
                 parts.append(f"[图片 {i}] (base64 数据)")
         return "\n".join(parts)
 
+@dataclass
+class ChatDelta:
+    """流式聊天中的一段增量内容。
+
+    Attributes:
+        text: 本段文本。
+        thought: 是否为思考链内容。
+    """
+    text: str
+    thought: bool = False
+
+
+def _append_delta(pending: List[ChatDelta], text: str, thought: bool) -> None:
+    """追加增量内容，与上一个同类增量相邻时直接合并。"""
+    if pending and pending[-1].thought == thought:
+        pending[-1].text += text
+    else:
+        pending.append(ChatDelta(text, thought=thought))
+
+
+# 流式 JSON 数组解析时关心的结构字符
+_JSON_STRUCT_RE = re.compile(r'["\\{}\[\]]')
+# 顶层元素之间允许出现的分隔内容
+_JSON_SEP_RE = re.compile(r"[\s,\[\]]*")
+
+
+class _JsonArrayStreamParser:
+    """增量解析 widgetStreamAssist 返回的 JSON 数组。
+
+    上游按行逐步输出一个 JSON 数组，每收到一个完整的顶层元素就立即解析返回，
+    不必等待整个响应结束。遇到非法内容时抛出 ValueError。
+    """
+
+    def __init__(self) -> None:
+        self._buf = ""
+        self._pos = 0  # 下一次扫描的位置
+        self._start = -1  # 当前顶层元素在 _buf 中的起始位置
+        self._depth = 0
+        self._base = 0  # 顶层元素所在的嵌套深度（位于数组内时为 1）
+        self._in_string = False
+        self.started = False  # 是否已遇到任何 JSON 结构
+
+    @property
+    def complete(self) -> bool:
+        """是否已完整解析（所有括号均已闭合）。"""
+        return self.started and self._depth == 0 and not self._in_string
+
+    def feed(self, text: str) -> List[Any]:
+        """追加一段文本，返回其中新完成的顶层元素。"""
+        items: List[Any] = []
+        buf = self._buf + text
+        pos = self._pos
+        while True:
+            m = _JSON_STRUCT_RE.search(buf, pos)
+            if m is None:
+                self._check_separator(buf, pos, len(buf))
+                pos = len(buf)
+                break
+            ch, i, pos = m.group(), m.start(), m.end()
+            if self._in_string:
+                if ch == "\\":
+                    if pos >= len(buf):
+                        # 转义符在末尾，等待更多数据
+                        pos = i
+                        break
+                    pos += 1
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            self._check_separator(buf, self._pos if self._start < 0 else i, i)
+            self._pos = pos
+            if ch == '"':
+                if self._start < 0:
+                    raise ValueError("顶层出现未预期的字符串")
+                self._in_string = True
+            elif ch in "{[":
+                if not self.started:
+                    self.started = True
+                    if ch == "[":
+                        self._base = 1
+                        self._depth = 1
+                        continue
+                if self._depth == self._base and self._start < 0:
+                    self._start = i
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth < 0:
+                    raise ValueError("括号不匹配")
+                if self._depth == self._base and self._start >= 0:
+                    items.append(_json_loads(buf[self._start:pos]))
+                    buf = buf[pos:]
+                    pos = 0
+                    self._start = -1
+            self._pos = pos
+
+        if self._start < 0:
+            # 顶层元素之外的分隔符已校验，可以丢弃
+            buf = ""
+            pos = 0
+        self._buf = buf
+        self._pos = pos
+        return items
+
+    def _check_separator(self, buf: str, begin: int, end: int) -> None:
+        if self._start < 0 and begin < end and not _JSON_SEP_RE.fullmatch(buf, begin, end):
+            raise ValueError("顶层出现非法内容")
+
+
+# Gemini API 请求头中除 authorization 外均为常量，模块加载时构造一次（只读）
+_API_HEADERS_BASE = MappingProxyType({
+    "accept": "*/*",
+    "accept-encoding": "gzip, deflate, br, zstd",
+    "accept-language": "zh-CN,zh;q=0.9,en;q=0.8,en-GB;q=0.7,en-US;q=0.6",
+    "cache-control": "no-cache",
+    "pragma": "no-cache",
+    "dnt": "1",
+    "authorization": "",  # 占位，保持请求头顺序
+    "content-type": "application/json",
+    "origin": "https://business.gemini.google",
+    "priority": "u=1, i",
+    "referer": "https://business.gemini.google/",
+    "sec-ch-ua": '"Chromium";v="142", "Google Chrome";v="142", "Not_A Brand";v="99"',
+    "sec-ch-ua-arch": '"x86"',
+    "sec-ch-ua-bitness": '"64"',
+    "sec-ch-ua-form-factors": '"Desktop"',
+    "sec-ch-ua-full-version": '"142.0.7444.176"',
+    "sec-ch-ua-full-version-list": '"Chromium";v="142.0.7444.176", "Google Chrome";v="142.0.7444.176", "Not_A Brand";v="99.0.0.0"',
+    "sec-ch-ua-mobile": "?0",
+    "sec-ch-ua-model": '""',
+    "sec-ch-ua-platform": '"Windows"',
+    "sec-ch-ua-platform-version": '"15.0.0"',
+    "sec-ch-ua-wow64": "?0",
+    "sec-fetch-dest": "empty",
+    "sec-fetch-mode": "cors",
+    "sec-fetch-site": "cross-site",
+    "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36",
+    "x-browser-channel": "stable",
+    "x-browser-copyright": "Copyright 2025 Google LLC. All Rights reserved.",
+    "x-browser-validation": "Aj9fzfu+SaGLBY9Oqr3S7RokOtM=",
+    "x-browser-year": "2025",
+    "x-client-data": "CIe2yQEIpLbJAQipncoBCPyMywEIkqHLAQiFoM0BCP6bzwEI9p3PAQ==",
+    "x-server-timeout": "1800",
+})
+
+
 def build_headers(jwt: str) -> dict:
     """构造符合 Gemini API 要求的 HTTP 请求头。
 
@@ -297,43 +448,11 @@ def build_headers(jwt: str) -> dict:
         jwt: JWT 认证令牌。
 
     Returns:
-        完整的 HTTP 请求头字典。
+        完整的 HTTP 请求头字典（每次返回新的字典，调用方可自行修改）。
     """
-    return {
-        "accept": "*/*",
-        "accept-encoding": "gzip, deflate, br, zstd",
-        "accept-language": "zh-CN,zh;q=0.9,en;q=0.8,en-GB;q=0.7,en-US;q=0.6",
-        "cache-control": "no-cache",
-        "pragma": "no-cache",
-        "dnt": "1",
-        "authorization": f"Bearer {jwt}",
-        "content-type": "application/json",
-        "origin": "https://business.gemini.google",
-        "priority": "u=1, i",
-        "referer": "https://business.gemini.google/",
-        "sec-ch-ua": '"Chromium";v="142", "Google Chrome";v="142", "Not_A Brand";v="99"',
-        "sec-ch-ua-arch": '"x86"',
-        "sec-ch-ua-bitness": '"64"',
-        "sec-ch-ua-form-factors": '"Desktop"',
-        "sec-ch-ua-full-version": '"142.0.7444.176"',
-        "sec-ch-ua-full-version-list": '"Chromium";v="142.0.7444.176", "Google Chrome";v="142.0.7444.176", "Not_A Brand";v="99.0.0.0"',
-        "sec-ch-ua-mobile": "?0",
-        "sec-ch-ua-model": '""',
-        "sec-ch-ua-platform": '"Windows"',
-        "sec-ch-ua-platform-version": '"15.0.0"',
-        "sec-ch-ua-wow64": "?0",
-        "sec-fetch-dest": "empty",
-        "sec-fetch-mode": "cors",
-        "sec-fetch-site": "cross-site",
-        "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-        "(KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36",
-        "x-browser-channel": "stable",
-        "x-browser-copyright": "Copyright 2025 Google LLC. All Rights reserved.",
-        "x-browser-validation": "Aj9fzfu+SaGLBY9Oqr3S7RokOtM=",
-        "x-browser-year": "2025",
-        "x-client-data": "CIe2yQEIpLbJAQipncoBCPyMywEIkqHLAQiFoM0BCP6bzwEI9p3PAQ==",
-        "x-server-timeout": "1800",
-    }
+    headers = dict(_API_HEADERS_BASE)
+    headers["authorization"] = f"Bearer {jwt}"
+    return headers
 
 
 class BizGeminiClient:
@@ -414,7 +533,8 @@ class BizGeminiClient:
             新创建的会话名称/ID。
 
         Raises:
-            RuntimeError: 创建会话失败或多次重试后仍失败。
+            AuthenticationError: 刷新 JWT 后仍返回 401（登录态已失效）。
+            RuntimeError: 创建会话失败。
         """
         session_id = uuid.uuid4().hex[:12]
         body = {
@@ -447,6 +567,12 @@ class BizGeminiClient:
                 self.jwt_manager.invalidate()
                 continue
 
+            # 刷新 JWT 后仍然 401，说明登录态已失效
+            if resp.status_code == 401:
+                raise AuthenticationError(
+                    f"创建会话失败: {resp.status_code} {resp.text[:200]}"
+                )
+
             if resp.status_code != 200:
                 # 解析错误详情
                 error_detail = resp.text[:500]
@@ -469,7 +595,7 @@ class BizGeminiClient:
                 raise RuntimeError(f"创建会话成功但未返回 session.name: {data}")
             return self._session_name
 
-        raise RuntimeError("多次尝试创建会话失败（可能是 cookie 失效，需要重新登录）。")
+        raise AuthenticationError("多次尝试创建会话失败（可能是 cookie 失效，需要重新登录）。")
 
     def reset_session(self) -> None:
         """重置当前会话状态。
@@ -492,7 +618,8 @@ class BizGeminiClient:
             删除成功返回 True。
 
         Raises:
-            RuntimeError: 删除失败或多次重试后仍失败。
+            AuthenticationError: 刷新 JWT 后仍返回 401（登录态已失效）。
+            RuntimeError: 删除失败。
         """
         body = {
             "configId": self.group_id,
@@ -518,6 +645,12 @@ class BizGeminiClient:
                 self.jwt_manager.refresh()
                 continue
 
+            # 刷新 JWT 后仍然 401，说明登录态已失效
+            if resp.status_code == 401:
+                raise AuthenticationError(
+                    f"删除会话失败: {resp.status_code} {resp.text[:200]}"
+                )
+
             if resp.status_code != 200:
                 raise RuntimeError(
                     f"删除会话失败: {resp.status_code} {resp.text[:200]}"
@@ -525,7 +658,7 @@ class BizGeminiClient:
 
             return True
 
-        raise RuntimeError("多次尝试删除会话失败（可能是 cookie 失效，需要重新登录）。")
+        raise AuthenticationError("多次尝试删除会话失败（可能是 cookie 失效，需要重新登录）。")
 
     def list_sessions(
         self,
@@ -573,6 +706,12 @@ class BizGeminiClient:
                 self.jwt_manager.refresh()
                 continue
 
+            # 刷新 JWT 后仍然 401，说明登录态已失效
+            if resp.status_code == 401:
+                raise AuthenticationError(
+                    f"获取会话列表失败: {resp.status_code} {resp.text[:200]}"
+                )
+
             if resp.status_code != 200:
                 # 解析错误详情
                 error_detail = resp.text[:500]
@@ -589,7 +728,8 @@ class BizGeminiClient:
                     f"获取会话列表失败: {resp.status_code} {error_status} - {error_msg}"
                 )
 
-            data = resp.json()
+            # 直接解析原始 bytes（安装 orjson 时使用 orjson），不先解码为 str
+            data = _json_loads(resp.content)
             sessions = data.get("listSessionsResponse", {}).get("sessions", [])
             logger.debug(
                 f"list_sessions response count={len(sessions)}, status={resp.status_code}, "
@@ -599,7 +739,7 @@ class BizGeminiClient:
                 logger.debug(f"list_sessions raw response: {json.dumps(data, ensure_ascii=False)[:500]}")
             return data
 
-        raise RuntimeError("多次尝试获取会话列表失败（可能是 cookie 失效，需要重新登录）。")
+        raise AuthenticationError("多次尝试获取会话列表失败（可能是 cookie 失效，需要重新登录）。")
 
     def get_session(
         self,
@@ -650,6 +790,12 @@ class BizGeminiClient:
                 self.jwt_manager.refresh()
                 continue
 
+            # 刷新 JWT 后仍然 401，说明登录态已失效
+            if resp.status_code == 401:
+                raise AuthenticationError(
+                    f"获取会话详情失败: {resp.status_code} {resp.text[:200]}"
+                )
+
             if resp.status_code != 200:
                 raise RuntimeError(
                     f"获取会话详情失败: {resp.status_code} {resp.text[:200]}"
@@ -661,7 +807,7 @@ class BizGeminiClient:
             logger.debug(f"get_session response session.name: {full_session_name}")
             return data
 
-        raise RuntimeError("多次尝试获取会话详情失败（可能是 cookie 失效，需要重新登录）。")
+        raise AuthenticationError("多次尝试获取会话详情失败（可能是 cookie 失效，需要重新登录）。")
 
     def add_context_file(
         self,
@@ -716,6 +862,12 @@ class BizGeminiClient:
                 self.jwt_manager.refresh()
                 continue
 
+            # 刷新 JWT 后仍然 401，说明登录态已失效
+            if resp.status_code == 401:
+                raise AuthenticationError(
+                    f"添加上下文文件失败: {resp.status_code} {resp.text[:200]}"
+                )
+
             if resp.status_code != 200:
                 logger.debug(f"add_context_file error: {resp.text[:500]}")
                 raise RuntimeError(
@@ -731,7 +883,7 @@ class BizGeminiClient:
                 "token_count": add_response.get("tokenCount"),
             }
 
-        raise RuntimeError("多次尝试添加上下文文件失败（可能是 cookie 失效，需要重新登录）。")
+        raise AuthenticationError("多次尝试添加上下文文件失败（可能是 cookie 失效，需要重新登录）。")
 
     def add_context_files(
         self,
@@ -856,6 +1008,12 @@ class BizGeminiClient:
                 session = self.session_name
                 continue
 
+            # 刷新 JWT 后仍然 401，说明登录态已失效
+            if resp.status_code == 401:
+                raise AuthenticationError(
+                    f"调用 widgetStreamAssist 失败: {resp.status_code} {resp.text[:200]}"
+                )
+
             if resp.status_code != 200:
                 raise RuntimeError(
                     f"调用 widgetStreamAssist 失败: {resp.status_code} {resp.text[:200]}"
@@ -1140,118 +1298,171 @@ class BizGeminiClient:
             model_id: 模型 ID
             file_ids: 要包含在请求中的文件 ID 列表（用于引用已上传的文件）
         """
-        resp = self._do_stream_assist(message, session_name, model_id, file_ids)
-
-        full_response = ""
-        for line in resp.iter_lines():
-            if line:
-                full_response += line.decode("utf-8") + "\n"
-
         result = ChatResponse()
+        for event in self.chat_stream(
+            message,
+            session_name=session_name,
+            include_thoughts=include_thoughts,
+            auto_save_images=auto_save_images,
+            debug=debug,
+            model_id=model_id,
+            file_ids=file_ids,
+        ):
+            if isinstance(event, ChatResponse):
+                result = event
+        return result
 
-        try:
-            data_list = json.loads(full_response)
-        except json.JSONDecodeError:
-            # 解析失败时，直接返回原始文本
-            result.text = full_response
-            return result
+    def chat_stream(
+        self,
+        message: str,
+        session_name: Optional[str] = None,
+        include_thoughts: bool = False,
+        auto_save_images: bool = True,
+        debug: bool = False,
+        model_id: Optional[str] = None,
+        file_ids: Optional[List[str]] = None,
+    ) -> Generator[Union[ChatDelta, ChatResponse], None, None]:
+        """发送一条消息，边接收边产出增量内容。
 
-        # 调试模式：打印完整响应
-        if debug:
-            logger.debug("完整 API 响应:")
-            logger.debug(json.dumps(data_list, indent=2, ensure_ascii=False))
+        上游每返回一段文本或思考内容就产出一个 ChatDelta；响应结束后
+        （图片下载完成）最后产出完整的 ChatResponse。参数同 chat_full。
+        """
+        resp = self._do_stream_assist(message, session_name, model_id, file_ids)
+
+        result = ChatResponse()
+        raw_lines: List[str] = []
+        data_list: List[Any] = []
+        parser = _JsonArrayStreamParser()
+        parse_failed = False
 
         texts: list[str] = []
         file_ids: list[dict] = []  # 收集需要下载的文件 {fileId, mimeType}
         current_session: Optional[str] = None
         processed_file_ids: set = set()  # 用于去重，避免同一张图片被添加多次
 
-        for data in data_list:
-            sar = data.get("streamAssistResponse")
-            if not sar:
+        for line in resp.iter_lines():
+            if not line:
                 continue
-
-            # 获取 session 信息
-            session_info = sar.get("sessionInfo", {})
-            if session_info.get("session"):
-                current_session = session_info["session"]
-
-            # 检查顶层的 generatedImages
-            top_gen_images = sar.get("generatedImages") or []
-            for gen_img in top_gen_images:
-                self._parse_generated_image(gen_img, result, auto_save_images)
-
-            answer = sar.get("answer") or {}
-            answer_state = answer.get("state") or sar.get("state")
-            skipped_reasons = answer.get("assistSkippedReasons") or sar.get("assistSkippedReasons") or []
-            policy_result = answer.get("customerPolicyEnforcementResult") or sar.get("customerPolicyEnforcementResult") or {}
-
-            # 检查 answer 级别的 generatedImages
-            answer_gen_images = answer.get("generatedImages") or []
-            for gen_img in answer_gen_images:
-                self._parse_generated_image(gen_img, result, auto_save_images)
-
-            replies = answer.get("replies") or []
-
-            # 处理被策略阻断的情况：无回复但 state=SKIPPED
-            if (answer_state == "SKIPPED" or skipped_reasons) and not replies:
-                violation_detail = None
-                if "CUSTOMER_POLICY_VIOLATION" in skipped_reasons:
-                    for pr in policy_result.get("policyResults") or []:
-                        armor = pr.get("modelArmorEnforcementResult") or {}
-                        violation_detail = armor.get("modelArmorViolation")
-                        if violation_detail:
-                            break
-                if "CUSTOMER_POLICY_VIOLATION" in skipped_reasons:
-                    msg = "由于提示违反了您组织定义的安全政策，因此 Gemini Enterprise 无法回复。"
-                    if violation_detail:
-                        msg += f"（原因: {violation_detail}）"
-                elif skipped_reasons:
-                    msg = f"Gemini Enterprise 未能生成回复（原因: {', '.join(skipped_reasons)}）"
-                else:
-                    msg = f"Gemini Enterprise 未能生成回复（状态: {answer_state or '未知'}）"
-
-                texts.append(msg)
+            line_text = line.decode("utf-8") + "\n"
+            raw_lines.append(line_text)
+            if parse_failed:
+                continue
+            try:
+                items = parser.feed(line_text)
+            except ValueError:
+                parse_failed = True
                 continue
 
-            for reply in replies:
-                # 检查 reply 级别的 generatedImages
-                reply_gen_images = reply.get("generatedImages") or []
-                for gen_img in reply_gen_images:
+            # 同一批到达的元素（例如上游一次性返回整个数组）中连续的同类内容合并成一个增量
+            pending: List[ChatDelta] = []
+            for data in items:
+                if debug:
+                    data_list.append(data)
+                sar = data.get("streamAssistResponse") if isinstance(data, dict) else None
+                if not sar:
+                    continue
+
+                # 获取 session 信息
+                session_info = sar.get("sessionInfo", {})
+                if session_info.get("session"):
+                    current_session = session_info["session"]
+
+                # 检查顶层的 generatedImages
+                top_gen_images = sar.get("generatedImages") or []
+                for gen_img in top_gen_images:
                     self._parse_generated_image(gen_img, result, auto_save_images)
 
-                gc = reply.get("groundedContent", {})
-                content = gc.get("content", {})
-                text = content.get("text", "")
-                thought = content.get("thought", False)
-
-                # 检查 file 字段（图片生成的关键）
-                file_info = content.get("file")
-                if file_info and file_info.get("fileId"):
-                    fid = file_info["fileId"]
-                    # 只收集未处理过的 file_id
-                    if fid not in processed_file_ids:
-                        file_ids.append({
-                            "fileId": fid,
-                            "mimeType": file_info.get("mimeType", "image/png")
-                        })
-                        processed_file_ids.add(fid)
-
-                # 注意：不再调用 _parse_image_from_content，因为图片通过 fileId 处理
-                # 这样避免了重复添加图片
-
-                # 检查 attachments
-                attachments = reply.get("attachments") or gc.get("attachments") or content.get("attachments") or []
-                for att in attachments:
-                    self._parse_attachment(att, result, auto_save_images)
-
-                if not text:
-                    continue
-                if thought:
-                    if include_thoughts:
-                        result.thoughts.append(text)
+                answer = sar.get("answer") or {}
+                answer_state = answer.get("state") or sar.get("state")
+                skipped_reasons = answer.get("assistSkippedReasons") or sar.get("assistSkippedReasons") or []
+                policy_result = answer.get("customerPolicyEnforcementResult") or sar.get("customerPolicyEnforcementResult") or {}
+
+                # 检查 answer 级别的 generatedImages
+                answer_gen_images = answer.get("generatedImages") or []
+                for gen_img in answer_gen_images:
+                    self._parse_generated_image(gen_img, result, auto_save_images)
+
+                replies = answer.get("replies") or []
+
+                # 处理被策略阻断的情况：无回复但 state=SKIPPED
+                if (answer_state == "SKIPPED" or skipped_reasons) and not replies:
+                    violation_detail = None
+                    if "CUSTOMER_POLICY_VIOLATION" in skipped_reasons:
+                        for pr in policy_result.get("policyResults") or []:
+                            armor = pr.get("modelArmorEnforcementResult") or {}
+                            violation_detail = armor.get("modelArmorViolation")
+                            if violation_detail:
+                                break
+                    if "CUSTOMER_POLICY_VIOLATION" in skipped_reasons:
+                        msg = "由于提示违反了您组织定义的安全政策，因此 Gemini Enterprise 无法回复。"
+                        if violation_detail:
+                            msg += f"（原因: {violation_detail}）"
+                    elif skipped_reasons:
+                        msg = f"Gemini Enterprise 未能生成回复（原因: {', '.join(skipped_reasons)}）"
+                    else:
+                        msg = f"Gemini Enterprise 未能生成回复（状态: {answer_state or '未知'}）"
+
+                    texts.append(msg)
+                    _append_delta(pending, msg, thought=False)
                     continue
-                texts.append(text)
+
+                for reply in replies:
+                    # 检查 reply 级别的 generatedImages
+                    reply_gen_images = reply.get("generatedImages") or []
+                    for gen_img in reply_gen_images:
+                        self._parse_generated_image(gen_img, result, auto_save_images)
+
+                    gc = reply.get("groundedContent", {})
+                    content = gc.get("content", {})
+                    text = content.get("text", "")
+                    thought = content.get("thought", False)
+
+                    # 检查 file 字段（图片生成的关键）
+                    file_info = content.get("file")
+                    if file_info and file_info.get("fileId"):
+                        fid = file_info["fileId"]
+                        # 只收集未处理过的 file_id
+                        if fid not in processed_file_ids:
+                            file_ids.append({
+                                "fileId": fid,
+                                "mimeType": file_info.get("mimeType", "image/png")
+                            })
+                            processed_file_ids.add(fid)
+
+                    # 注意：不再调用 _parse_image_from_content，因为图片通过 fileId 处理
+                    # 这样避免了重复添加图片
+
+                    # 检查 attachments
+                    attachments = reply.get("attachments") or gc.get("attachments") or content.get("attachments") or []
+                    for att in attachments:
+                        self._parse_attachment(att, result, auto_save_images)
+
+                    if not text:
+                        continue
+                    if thought:
+                        if include_thoughts:
+                            result.thoughts.append(text)
+                            _append_delta(pending, text, thought=True)
+                        continue
+                    texts.append(text)
+                    _append_delta(pending, text, thought=False)
+
+            for delta in pending:
+                yield delta
+
+        if parse_failed or not parser.complete:
+            # 解析失败时，直接返回原始文本（尚未产出增量时一并作为增量输出）
+            yielded = bool(texts or result.thoughts)
+            result = ChatResponse(text="".join(raw_lines))
+            if result.text and not yielded:
+                yield ChatDelta(result.text)
+            yield result
+            return
+
+        # 调试模式：打印完整响应
+        if debug:
+            logger.debug("完整 API 响应:")
+            logger.debug(json.dumps(data_list, indent=2, ensure_ascii=False))
 
         # 处理通过 fileId 引用的图片
         if file_ids and current_session and auto_save_images:
@@ -1308,7 +1519,7 @@ class BizGeminiClient:
                     logger.debug(f"获取文件元数据失败: {e}")
 
         result.text = "".join(texts)
-        return result
+        yield result
 
     def _parse_generated_image(self, gen_img: dict, result: ChatResponse, auto_save: bool) -> None:
         """解析 generatedImages 中的图片"""
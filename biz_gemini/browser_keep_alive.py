@@ -3,7 +3,7 @@ import asyncio
 from datetime import datetime
 from typing import Callable, Optional, List
 
-from .auth import on_cookie_refreshed
+from .auth import _parse_csesidx_from_url, _parse_group_id_from_url, on_cookie_refreshed
 from .config import (
     TIME_FMT,
     get_proxy,
@@ -754,9 +754,7 @@ class BrowserKeepAliveService:
             return None
 
         # 尝试从 URL 提取 csesidx
-        csesidx = None
-        if "csesidx=" in current_url:
-            csesidx = current_url.split("csesidx=", 1)[1].split("&", 1)[0]
+        csesidx = _parse_csesidx_from_url(current_url)
 
         # 构造 cookie_raw
         gemini_cookies = [f"{k}={v}" for k, v in cookie_map.items()]
@@ -1712,9 +1710,10 @@ async def _extract_and_save_cookies(context, current_url: str, captured_csesidx:
 
         # 提取 csesidx：优先使用传入的 captured_csesidx，其次从 URL 提取
         csesidx = captured_csesidx
-        if not csesidx and "csesidx=" in current_url:
-            csesidx = current_url.split("csesidx=", 1)[1].split("&", 1)[0]
-            logger.info(f"[自动登录]   从 URL 提取到 csesidx: {csesidx}")
+        if not csesidx:
+            csesidx = _parse_csesidx_from_url(current_url)
+            if csesidx:
+                logger.info(f"[自动登录]   从 URL 提取到 csesidx: {csesidx}")
 
         # 如果仍然没有 csesidx，尝试多种方式获取
         if not csesidx:
@@ -1914,12 +1913,7 @@ async def _extract_and_save_cookies(context, current_url: str, captured_csesidx:
             }
 
         # 提取 group_id
-        group_id = None
-        if "/cid/" in current_url:
-            after = current_url.split("/cid/", 1)[1]
-            for sep in ("/", "?", "#"):
-                after = after.split(sep, 1)[0]
-            group_id = after
+        group_id = _parse_group_id_from_url(current_url)
 
         # 构造 cookie_raw
         gemini_cookies = [f"{k}={v}" for k, v in cookie_map.items()]
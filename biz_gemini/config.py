@@ -7,6 +7,7 @@
 - 配置热重载
 - 账号状态管理（JWT 缓存、Cookie 状态等）
 """
+import functools
 import json
 import logging
 import os
@@ -17,6 +18,8 @@ from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, Optional
 
+from .constants import REDIS_JWT_KEYS
+
 # 配置文件路径
 PROJECT_ROOT = Path(__file__).parent.parent
 NEW_CONFIG_FILE = PROJECT_ROOT / "config.json"
@@ -304,6 +307,9 @@ def save_config(update: dict) -> dict:
     with open(NEW_CONFIG_FILE, "w", encoding="utf-8") as f:
         json.dump(save_data, f, ensure_ascii=False, indent=2)
     
+    # mtime 精度不足时同一时刻的写入可能无法被检测到，显式失效
+    invalidate_config_cache()
+    
     return cfg
 
 
@@ -342,11 +348,19 @@ def cookies_age_seconds(config: dict) -> Optional[float]:
     
     if not ts_str:
         return None
+    dt = _parse_saved_at(ts_str)
+    if dt is None:
+        return None
+    return (datetime.now() - dt).total_seconds()
+
+
+@functools.lru_cache(maxsize=8)
+def _parse_saved_at(ts_str: str) -> Optional[datetime]:
+    """解析 cookie 保存时间；同一时间戳在 cookie 刷新前会被反复检查，解析结果按字符串缓存。"""
     try:
-        dt = datetime.strptime(ts_str, TIME_FMT)
+        return datetime.strptime(ts_str, TIME_FMT)
     except ValueError:
         return None
-    return (datetime.now() - dt).total_seconds()
 
 
 def cookies_expired(config: dict, max_age_hours: int = 0) -> bool:
@@ -370,7 +384,7 @@ def cookies_expired(config: dict, max_age_hours: int = 0) -> bool:
     return age > max_age_hours * 3600
 
 
-# 配置热重载支持
+# 配置热重载支持（按配置文件路径 + mtime_ns 失效）
 _config_cache = None
 _config_mtime = None
 
@@ -387,19 +401,26 @@ _account_state: Dict[str, Any] = {
     "last_refresh_time": 0,
     "conversation_sessions": {},
 }
+# 认证状态代数：清除 JWT 缓存或标记 Cookie 过期时递增，
+# auth 模块据此判断基于旧状态得出的 JWT 快照是否仍可复用
+_auth_state_generation = 0
 
 
 def get_cached_config(force_reload: bool = False) -> dict:
-    """获取缓存的配置，支持文件变更检测"""
+    """获取缓存的配置，支持文件变更检测
+
+    只做一次 stat，文件路径和 mtime_ns 都未变化时直接返回缓存，
+    避免重复的 open/read/json 解析。
+    """
     global _config_cache, _config_mtime
     
     if force_reload:
-        _config_cache = None
-        _config_mtime = None
+        invalidate_config_cache()
     
-    current_mtime = None
-    if NEW_CONFIG_FILE.exists():
-        current_mtime = NEW_CONFIG_FILE.stat().st_mtime
+    try:
+        current_mtime = (str(NEW_CONFIG_FILE), NEW_CONFIG_FILE.stat().st_mtime_ns)
+    except OSError:
+        current_mtime = (str(NEW_CONFIG_FILE), None)
     
     if _config_cache is None or _config_mtime != current_mtime:
         _config_cache = load_config()
@@ -408,6 +429,13 @@ def get_cached_config(force_reload: bool = False) -> dict:
     return _config_cache
 
 
+def invalidate_config_cache() -> None:
+    """使配置缓存失效（保存配置后调用）"""
+    global _config_cache, _config_mtime
+    _config_cache = None
+    _config_mtime = None
+
+
 def reload_config() -> dict:
     """强制重新加载配置"""
     return get_cached_config(force_reload=True)
@@ -441,9 +469,16 @@ def set_cached_jwt(jwt: str, expires_at: float) -> None:
         _account_state["jwt_expires_at"] = expires_at
 
 
+def get_auth_state_generation() -> int:
+    """获取当前认证状态代数。"""
+    return _auth_state_generation
+
+
 def clear_jwt_cache() -> None:
     """清除 JWT 缓存（Cookie 刷新后调用）"""
+    global _auth_state_generation
     with _account_state_lock:
+        _auth_state_generation += 1
         _account_state["jwt"] = ""
         _account_state["jwt_time"] = 0
         _account_state["jwt_expires_at"] = 0
@@ -451,7 +486,9 @@ def clear_jwt_cache() -> None:
 
 def mark_cookie_expired(reason: str = "") -> None:
     """标记 Cookie 已过期"""
+    global _auth_state_generation
     with _account_state_lock:
+        _auth_state_generation += 1
         _account_state["cookie_expired"] = True
         _account_state["available"] = False
         if reason:
@@ -594,7 +631,8 @@ def clear_redis_session_cache() -> None:
                 logger.info(f"已清除 Redis session 缓存: {redis_key}")
             
             # 同时清除 JWT 缓存（确保一致性）
-            redis_mgr.delete("jwt_token")
+            for key in REDIS_JWT_KEYS:
+                redis_mgr.delete(key)
             logger.debug("已清除 Redis JWT 缓存")
             
             # 清除 cookie_state 缓存
@@ -173,6 +173,11 @@ REDIS_SESSION_TTL = 3600  # 会话缓存过期时间（秒）：1 小时
 REDIS_JWT_TTL = 360  # JWT 缓存过期时间（秒）：6 分钟
 REDIS_LOCK_TTL = 120  # 分布式锁过期时间（秒）：2 分钟
 
+# JWT 分两个普通字符串 key 存放，热路径用一次 MGET 读取，无需 JSON 解析
+REDIS_JWT_TOKEN_KEY = "jwt_token:token"
+REDIS_JWT_EXPIRES_KEY = "jwt_token:expires_at"
+REDIS_JWT_KEYS = [REDIS_JWT_TOKEN_KEY, REDIS_JWT_EXPIRES_KEY]
+
 # =============================================================================
 # 服务器默认配置
 # =============================================================================
@@ -13,6 +13,14 @@ except ImportError:
     REDIS_AVAILABLE = False
     logger.warning("Redis库未安装，将使用内存存储作为降级方案")
 
+# 比较并删除：GET 与 DEL 在服务端原子执行
+_DELETE_IF_EQUALS_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
 
 class RedisManager:
     """Redis管理器，支持自动降级到内存存储"""
@@ -151,6 +159,106 @@ class RedisManager:
             del self._memory_store[full_key]
         return True
     
+    def set_nx(self, key: str, value: str, ex: Optional[int] = None) -> bool:
+        """仅当 key 不存在时设置值（可用作简单的分布式锁）
+        
+        Args:
+            key: 键名
+            value: 值
+            ex: 过期时间（秒）
+            
+        Returns:
+            是否设置成功（key 已存在时返回 False）
+        """
+        full_key = self._make_key(key)
+        
+        if self.enabled:
+            try:
+                return bool(self.client.set(full_key, value, nx=True, ex=ex))
+            except Exception as e:
+                logger.warning(f"Redis set_nx失败，使用内存降级: {e}")
+                self.enabled = False
+        
+        # 内存存储降级
+        self._cleanup_expired()
+        if full_key in self._memory_store:
+            return False
+        expire_time = (time.time() + ex) if ex else None
+        self._memory_store[full_key] = (value, expire_time)
+        return True
+    
+    def delete_if_equals(self, key: str, value: str) -> bool:
+        """仅当 key 的当前值等于 value 时删除（释放 set_nx 锁时使用，避免误删他人的锁）
+        
+        Args:
+            key: 键名
+            value: 期望的值
+            
+        Returns:
+            是否删除了 key
+        """
+        full_key = self._make_key(key)
+        
+        if self.enabled:
+            try:
+                return bool(self.client.eval(_DELETE_IF_EQUALS_SCRIPT, 1, full_key, value))
+            except Exception as e:
+                logger.warning(f"Redis delete_if_equals失败，使用内存降级: {e}")
+                self.enabled = False
+        
+        # 内存存储降级
+        self._cleanup_expired()
+        entry = self._memory_store.get(full_key)
+        if entry is None or entry[0] != value:
+            return False
+        del self._memory_store[full_key]
+        return True
+    
+    def mget(self, keys: list[str]) -> list[Optional[str]]:
+        """一次往返批量获取多个值
+        
+        Args:
+            keys: 键名列表
+            
+        Returns:
+            与 keys 顺序对应的值列表，不存在的项为None
+        """
+        if self.enabled:
+            try:
+                return self.client.mget([self._make_key(k) for k in keys])
+            except Exception as e:
+                logger.warning(f"Redis mget失败，使用内存降级: {e}")
+                self.enabled = False
+        
+        # 内存存储降级
+        return [self.get(k) for k in keys]
+    
+    def set_many(self, mapping: Dict[str, str], ex: Optional[int] = None) -> bool:
+        """在一个事务管道中设置多个值（同一过期时间）
+        
+        Args:
+            mapping: 键名到值的映射
+            ex: 过期时间（秒）
+            
+        Returns:
+            是否成功
+        """
+        if self.enabled:
+            try:
+                pipe = self.client.pipeline(transaction=True)
+                for key, value in mapping.items():
+                    pipe.set(self._make_key(key), value, ex=ex)
+                pipe.execute()
+                return True
+            except Exception as e:
+                logger.warning(f"Redis set_many失败，使用内存降级: {e}")
+                self.enabled = False
+        
+        # 内存存储降级
+        for key, value in mapping.items():
+            self.set(key, value, ex=ex)
+        return True
+    
     def get_json(self, key: str) -> Optional[Any]:
         """获取JSON值
         
@@ -11,6 +11,7 @@ from typing import Any, Callable, Dict, Optional
 
 from playwright.async_api import async_playwright, Browser, Page, BrowserContext
 
+from .auth import _parse_csesidx_from_url, _parse_group_id_from_url, check_session_status_async
 from .config import load_config, get_proxy
 from .logger import get_logger
 
@@ -579,23 +580,16 @@ class RemoteBrowserSession:
             url = self._page.url
 
             # 解析 csesidx、group_id 和 project_id
-            csesidx = None
-            group_id = None
+            csesidx = _parse_csesidx_from_url(url)
             project_id = None
 
-            if "csesidx=" in url:
-                csesidx = url.split("csesidx=", 1)[1].split("&", 1)[0]
-
             # 提取 project_id（从 URL 参数 project= 获取）
-            if "project=" in url:
-                project_id = url.split("project=", 1)[1].split("&", 1)[0]
+            _, sep, rest = url.partition("project=")
+            if sep:
+                project_id = rest.partition("&")[0]
                 logger.debug(f"从 URL 获取到 project_id: {project_id}")
 
-            if "/cid/" in url:
-                after = url.split("/cid/", 1)[1]
-                for sep in ("/", "?", "#"):
-                    after = after.split(sep, 1)[0]
-                group_id = after
+            group_id = _parse_group_id_from_url(url)
 
             # 如果 URL 中没有 group_id，尝试从页面中获取或等待重定向
             if not group_id:
@@ -610,11 +604,8 @@ class RemoteBrowserSession:
 
                     # 尝试从 URL 中的重定向获取（有时页面会自动重定向到包含 cid 的 URL）
                     current_url = self._page.url
-                    if "/cid/" in current_url:
-                        after = current_url.split("/cid/", 1)[1]
-                        for sep in ("/", "?", "#"):
-                            after = after.split(sep, 1)[0]
-                        group_id = after
+                    group_id = _parse_group_id_from_url(current_url)
+                    if group_id:
                         logger.info(f"从重定向 URL 获取到 group_id: {group_id}")
                 except Exception as e:
                     logger.warning(f"从页面获取 group_id 失败: {e}")
@@ -626,11 +617,8 @@ class RemoteBrowserSession:
                         links = await self._page.query_selector_all('a[href*="/cid/"]')
                         if links:
                             href = await links[0].get_attribute('href')
-                            if href and "/cid/" in href:
-                                after = href.split("/cid/", 1)[1]
-                                for sep in ("/", "?", "#"):
-                                    after = after.split(sep, 1)[0]
-                                group_id = after
+                            group_id = _parse_group_id_from_url(href) if href else None
+                            if group_id:
                                 logger.info(f"从页面链接获取到 group_id: {group_id}")
                     except Exception as e:
                         logger.warning(f"从页面链接获取 group_id 失败: {e}")
@@ -726,8 +714,7 @@ class RemoteBrowserSession:
                 })
 
                 try:
-                    from .auth import check_session_status
-                    session_status = check_session_status(self._login_config)
+                    session_status = await check_session_status_async(self._login_config)
                     username = session_status.get("username")
                     if username:
                         self._login_config["username"] = username
@@ -23,7 +23,7 @@ from fastapi.responses import HTMLResponse, StreamingResponse, FileResponse, JSO
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
-from biz_gemini.auth import JWTManager, check_session_status, ensure_jwt_valid, request_getoxsrf, GETOXSRF_URL, on_cookie_refreshed
+from biz_gemini.auth import JWTManager, check_session_status_async, ensure_jwt_valid, request_getoxsrf, GETOXSRF_URL, on_cookie_refreshed
 from biz_gemini.biz_client import BizGeminiClient
 from biz_gemini.config import (
     cookies_age_seconds,
@@ -36,7 +36,7 @@ from biz_gemini.config import (
     mark_cookie_expired,
 )
 from biz_gemini.openai_adapter import OpenAICompatClient
-from biz_gemini.anthropic_adapter import AnthropicCompatClient
+from biz_gemini.anthropic_adapter import AnthropicCompatClient, format_sse_event
 from biz_gemini.web_login import get_login_service
 from biz_gemini.remote_browser import get_browser_service, BrowserSessionStatus
 from biz_gemini.keep_alive import get_keep_alive_service
@@ -44,6 +44,7 @@ from biz_gemini.browser_keep_alive import (
     get_browser_keep_alive_service,
     try_refresh_cookie_via_browser,
 )
+from biz_gemini.exceptions import AuthenticationError
 from biz_gemini.logger import get_logger
 from biz_gemini.api_keys import (
     generate_api_key,
@@ -461,6 +462,8 @@ class AnthropicRequest(BaseModel):
     top_k: Optional[int] = None
     stop_sequences: Optional[List[str]] = None
     metadata: Optional[dict] = None
+    # 扩展思考: {"type": "enabled", "budget_tokens": 1024}
+    thinking: Optional[dict] = None
 
 
 # Anthropic 接口的会话管理
@@ -612,7 +615,7 @@ async def get_status() -> dict:
                 }
 
         # 主动检查一次（缓存过期或标记失效）
-        session_status = check_session_status(config)
+        session_status = await check_session_status_async(config)
 
         # 同步更新保活服务缓存，减少短期重复误判
         if session_status.get("valid", False):
@@ -794,7 +797,7 @@ async def logout() -> dict:
         config = load_config()
 
         # 先检查 session 状态获取 signout_url
-        session_status = check_session_status(config)
+        session_status = await check_session_status_async(config)
         signout_url = session_status.get("signout_url")
 
         # 清除本地 session 配置
@@ -1164,7 +1167,7 @@ async def list_sessions() -> list:
 
         return result
 
-    except RuntimeError as e:
+    except (RuntimeError, AuthenticationError) as e:
         error_msg = str(e)
         # 检查是否是权限错误（403）- 这种情况需要告知前端
         if "403" in error_msg or "PERMISSION_DENIED" in error_msg:
@@ -1736,6 +1739,8 @@ async def _chat_completions_handler(
     session_id = x_session_id or conversation_id or request.session_id or str(uuid.uuid4())
     try:
         client, session_data, canonical_session_id = get_or_create_client(session_id, request.session_name)
+    except AuthenticationError as e:
+        raise HTTPException(status_code=401, detail=f"登录已过期，请重新登录: {e}")
     except RuntimeError as e:
         error_msg = str(e)
         # 检查是否是权限错误（403）
@@ -2304,10 +2309,10 @@ async def anthropic_messages(
                     top_p=request.top_p,
                     top_k=request.top_k,
                     stop_sequences=request.stop_sequences,
+                    thinking=request.thinking,
                 )
                 for event in response_gen:
-                    event_type = event.get("type", "unknown")
-                    yield f"event: {event_type}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                    yield format_sse_event(event)
             except Exception as e:
                 error_event = {
                     "type": "error",
@@ -2338,6 +2343,7 @@ async def anthropic_messages(
                 top_p=request.top_p,
                 top_k=request.top_k,
                 stop_sequences=request.stop_sequences,
+                thinking=request.thinking,
             )
             return response
         except Exception as e:
@@ -2,6 +2,7 @@
 import os
 import sqlite3
 import tempfile
+from datetime import datetime
 from pathlib import Path
 from unittest.mock import patch
 
@@ -9,6 +10,7 @@ import pytest
 
 from biz_gemini.api_keys import (
     generate_api_key,
+    generate_api_keys,
     list_api_keys,
     get_api_key_by_id,
     validate_api_key,
@@ -88,6 +90,25 @@ class TestGenerateApiKey:
         assert result["name"] == ""
 
 
+class TestGenerateApiKeys:
+    """generate_api_keys 批量生成测试。"""
+
+    def test_batch_generate(self, temp_db):
+        """测试批量生成返回正确的 id 与顺序。"""
+        with patch("biz_gemini.api_keys.DB_FILE", temp_db):
+            results = generate_api_keys(["A", "B", "C"])
+            stored = [get_api_key_by_id(item["id"]) for item in results]
+
+        assert [item["name"] for item in results] == ["A", "B", "C"]
+        assert len({item["key"] for item in results}) == 3
+        assert [item["key"] for item in stored] == [item["key"] for item in results]
+
+    def test_batch_generate_empty(self, temp_db):
+        """测试空列表。"""
+        with patch("biz_gemini.api_keys.DB_FILE", temp_db):
+            assert generate_api_keys([]) == []
+
+
 class TestListApiKeys:
     """list_api_keys 函数测试。"""
 
@@ -188,6 +209,44 @@ class TestValidateApiKey:
 
         assert result is False
 
+    def test_last_used_flushed_in_batch(self, temp_db):
+        """测试最后使用时间入队后批量写入。"""
+        from biz_gemini.api_keys import flush_last_used_updates
+
+        with patch("biz_gemini.api_keys.DB_FILE", temp_db):
+            created = generate_api_key(name="Test")
+            flush_last_used_updates()
+            assert validate_api_key(created["key"]) is True
+            assert validate_api_key(created["key"]) is True
+            flush_last_used_updates()
+            result = get_api_key_by_id(created["id"])
+
+        # 库中存整数时间戳，读取时格式化为本地时间字符串
+        assert result["last_used_at"] is not None
+        datetime.strptime(result["last_used_at"], "%Y-%m-%d %H:%M:%S")
+
+    def test_forged_signed_key(self, temp_db):
+        """测试签名不符的新格式 key 被拒绝。"""
+        with patch("biz_gemini.api_keys.DB_FILE", temp_db):
+            created = generate_api_key(name="Test")
+            forged = created["key"][:-1] + ("0" if created["key"][-1] != "0" else "1")
+            result = validate_api_key(forged)
+
+        assert result is False
+
+    def test_legacy_key_still_valid(self, temp_db):
+        """测试旧格式（无签名）key 仍通过数据库验证。"""
+        legacy_key = "sk-" + "a" * 48
+        conn = sqlite3.connect(str(temp_db))
+        conn.execute("INSERT INTO api_keys (key, name) VALUES (?, ?)", (legacy_key, "legacy"))
+        conn.commit()
+        conn.close()
+
+        with patch("biz_gemini.api_keys.DB_FILE", temp_db):
+            result = validate_api_key(legacy_key)
+
+        assert result is True
+
     def test_inactive_key(self, temp_db):
         """测试已禁用的 key。"""
         with patch("biz_gemini.api_keys.DB_FILE", temp_db):
@@ -198,6 +257,93 @@ class TestValidateApiKey:
         assert result is False
 
 
+    def test_cached_key_invalidated_on_toggle(self, temp_db):
+        """测试缓存命中后禁用 key 立即生效。"""
+        with patch("biz_gemini.api_keys.DB_FILE", temp_db):
+            created = generate_api_key(name="Test")
+            assert validate_api_key(created["key"]) is True
+            toggle_api_key(created["id"], False)
+            assert validate_api_key(created["key"]) is False
+            toggle_api_key(created["id"], True)
+            assert validate_api_key(created["key"]) is True
+            delete_api_key(created["id"])
+            assert validate_api_key(created["key"]) is False
+
+
+    def test_external_change_visible_after_reload(self, temp_db):
+        """测试其他进程写入的 key 在快照重新加载后生效。"""
+        from biz_gemini.api_keys import reload_active_keys
+
+        external_key = "sk-" + "b" * 48
+        with patch("biz_gemini.api_keys.DB_FILE", temp_db):
+            assert validate_api_key(external_key) is False
+            conn = sqlite3.connect(str(temp_db))
+            conn.execute("INSERT INTO api_keys (key, name) VALUES (?, ?)", (external_key, "ext"))
+            conn.commit()
+            conn.close()
+            reload_active_keys()
+            assert validate_api_key(external_key) is True
+
+
+    def test_external_change_visible_without_reload(self, temp_db):
+        """测试其他进程在快照加载后启停、删除、新增 key，验证结果随之变化。"""
+        external_key = "sk-" + "c" * 48
+        with patch("biz_gemini.api_keys.DB_FILE", temp_db), \
+                patch("biz_gemini.api_keys._ACTIVE_KEYS_CHECK_INTERVAL", 0):
+            created = generate_api_key(name="Test")
+            assert validate_api_key(created["key"]) is True
+
+            conn = sqlite3.connect(str(temp_db))
+            conn.execute("UPDATE api_keys SET is_active = 0 WHERE id = ?", (created["id"],))
+            conn.commit()
+            assert validate_api_key(created["key"]) is False
+
+            conn.execute("UPDATE api_keys SET is_active = 1 WHERE id = ?", (created["id"],))
+            conn.commit()
+            assert validate_api_key(created["key"]) is True
+
+            conn.execute("DELETE FROM api_keys WHERE id = ?", (created["id"],))
+            conn.execute("INSERT INTO api_keys (key, name) VALUES (?, ?)", (external_key, "ext"))
+            conn.commit()
+            conn.close()
+            assert validate_api_key(created["key"]) is False
+            assert validate_api_key(external_key) is True
+
+    def test_change_detection_throttled(self, temp_db):
+        """测试检测间隔内的验证不查询 data_version，间隔过后才发现外部变更。"""
+        import biz_gemini.api_keys as api_keys
+
+        with patch("biz_gemini.api_keys.DB_FILE", temp_db):
+            created = generate_api_key(name="Test")
+            assert validate_api_key(created["key"]) is True
+
+            conn = sqlite3.connect(str(temp_db))
+            conn.execute("UPDATE api_keys SET is_active = 0 WHERE id = ?", (created["id"],))
+            conn.commit()
+            conn.close()
+            with patch("biz_gemini.api_keys._read_data_version", side_effect=AssertionError):
+                assert validate_api_key(created["key"]) is True
+
+            entry = api_keys._active_keys[str(temp_db)]
+            api_keys._active_keys[str(temp_db)] = entry[:3] + (0.0,)
+            assert validate_api_key(created["key"]) is False
+
+    def test_signed_key_miss_falls_back_to_db(self, temp_db):
+        """测试签名有效但不在快照中的 key 回退查库。"""
+        from biz_gemini.api_keys import _get_hmac_secret, _new_api_key
+
+        with patch("biz_gemini.api_keys.DB_FILE", temp_db):
+            assert validate_api_key(generate_api_key(name="Test")["key"]) is True
+            other_key = _new_api_key(_get_hmac_secret())
+            conn = sqlite3.connect(str(temp_db))
+            conn.execute("INSERT INTO api_keys (key, name) VALUES (?, ?)", (other_key, "other"))
+            conn.commit()
+            conn.close()
+            # 模拟变更检测未能及时发现这次写入
+            with patch("biz_gemini.api_keys._get_active_keys", return_value={}):
+                assert validate_api_key(other_key) is True
+
+
 class TestDeleteApiKey:
     """delete_api_key 函数测试。"""
 
@@ -222,6 +368,21 @@ class TestDeleteApiKey:
         assert result is False
 
 
+class TestModifyWithoutReturning:
+    """SQLite < 3.35（无 RETURNING）时的回退路径测试。"""
+
+    def test_fallback_delete_and_toggle(self, temp_db):
+        """测试回退路径下删除与启停结果一致。"""
+        with patch("biz_gemini.api_keys.DB_FILE", temp_db), \
+                patch("biz_gemini.api_keys._HAS_RETURNING", False):
+            created = generate_api_key(name="Test")
+            assert toggle_api_key(created["id"], False) is True
+            assert validate_api_key(created["key"]) is False
+            assert delete_api_key(created["id"]) is True
+            assert delete_api_key(created["id"]) is False
+            assert toggle_api_key(created["id"], True) is False
+
+
 class TestToggleApiKey:
     """toggle_api_key 函数测试。"""
 
@@ -250,3 +411,155 @@ class TestToggleApiKey:
             result = toggle_api_key(99999, True)
 
         assert result is False
+
+
+class TestConnectionPragmas:
+    """数据库连接 PRAGMA 测试。"""
+
+    def test_pragmas_applied(self, temp_db):
+        """测试连接已设置 busy_timeout 与 synchronous。"""
+        from biz_gemini.api_keys import _read_connection
+
+        with patch("biz_gemini.api_keys.DB_FILE", temp_db):
+            with _read_connection() as conn:
+                assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+                # NORMAL == 1
+                assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+                assert conn.execute("PRAGMA mmap_size").fetchone()[0] == 268435456
+
+    def test_new_db_page_size(self, temp_dir):
+        """测试新建数据库使用 8192 页大小。"""
+        db_path = temp_dir / "fresh.db"
+        with patch("biz_gemini.api_keys.DB_FILE", db_path):
+            init_db()
+
+        conn = sqlite3.connect(str(db_path))
+        try:
+            assert conn.execute("PRAGMA page_size").fetchone()[0] == 8192
+        finally:
+            conn.close()
+
+    def test_read_pool_reuses_connections(self, temp_db):
+        """测试连接池复用连接，并发借用不超过上限，close_connections 后自动重建。"""
+        from biz_gemini import api_keys
+        from biz_gemini.api_keys import _read_connection, close_connections
+
+        with patch("biz_gemini.api_keys.DB_FILE", temp_db), \
+                patch("biz_gemini.api_keys._READ_POOL_SIZE", 2):
+            with _read_connection() as conn1:
+                pass
+            with _read_connection() as again:
+                assert again is conn1
+
+            with _read_connection() as a, _read_connection() as b:
+                assert a is not b
+            assert api_keys._read_pool._created == 2
+
+            close_connections()
+            with _read_connection() as conn2:
+                assert conn2 is not conn1
+                assert conn2.execute("SELECT count(*) FROM api_keys").fetchone()[0] == 0
+
+    def test_read_connection_is_read_only(self, temp_db):
+        """测试读连接为只读，写操作走独立的写连接。"""
+        from biz_gemini.api_keys import _read_connection
+
+        with patch("biz_gemini.api_keys.DB_FILE", temp_db):
+            with _read_connection() as conn:
+                with pytest.raises(sqlite3.OperationalError):
+                    conn.execute("DELETE FROM api_keys")
+            created = generate_api_key(name="Test")
+            assert get_api_key_by_id(created["id"]) is not None
+
+    def test_init_db_enables_wal(self, temp_db):
+        """测试 init_db 将数据库切换为 WAL 模式。"""
+        with patch("biz_gemini.api_keys.DB_FILE", temp_db):
+            init_db()
+
+        conn = sqlite3.connect(str(temp_db))
+        try:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        finally:
+            conn.close()
+
+    def test_key_lookup_uses_index(self, temp_db):
+        """测试按 key 查询走索引而不是全表扫描。"""
+        with patch("biz_gemini.api_keys.DB_FILE", temp_db):
+            init_db()
+
+        conn = sqlite3.connect(str(temp_db))
+        try:
+            plan = conn.execute(
+                "EXPLAIN QUERY PLAN SELECT id, is_active FROM api_keys WHERE key = ?", ("sk-x",)
+            ).fetchall()
+            detail = " ".join(row[-1] for row in plan)
+            assert "INDEX" in detail
+            indexes = {row[1] for row in conn.execute("PRAGMA index_list(api_keys)")}
+            assert "idx_api_keys_created_at" in indexes
+        finally:
+            conn.close()
+
+
+class TestMigrateDb:
+    """_migrate_db_if_needed 函数测试。"""
+
+    def test_migrates_once(self, temp_dir):
+        """测试旧数据库被迁移并写入完成标记。"""
+        from biz_gemini.api_keys import _migrate_db_if_needed
+
+        old_db = temp_dir / "api_keys.db"
+        old_db.write_bytes(b"old")
+        data_dir = temp_dir / "data"
+        new_db = data_dir / "api_keys.db"
+
+        with patch("biz_gemini.api_keys.OLD_DB_FILE", old_db), \
+                patch("biz_gemini.api_keys.DATA_DIR", data_dir), \
+                patch("biz_gemini.api_keys.DB_FILE", new_db):
+            _migrate_db_if_needed()
+            assert not old_db.exists()
+            assert new_db.read_bytes() == b"old"
+            assert (data_dir / ".migrated").exists()
+
+            # 标记存在后不再处理
+            old_db.write_bytes(b"again")
+            new_db.unlink()
+            _migrate_db_if_needed()
+            assert old_db.exists()
+
+
+class TestInitialize:
+    """_initialize 函数测试。"""
+
+    def test_skips_when_marker_present(self, temp_dir):
+        """测试完成标记存在时不再执行建表。"""
+        from biz_gemini import api_keys
+
+        data_dir = temp_dir / "data"
+        db_path = data_dir / "api_keys.db"
+        with patch("biz_gemini.api_keys.DATA_DIR", data_dir), \
+                patch("biz_gemini.api_keys.DB_FILE", db_path), \
+                patch("biz_gemini.api_keys.OLD_DB_FILE", temp_dir / "missing.db"):
+            api_keys._initialize()
+            assert (data_dir / ".initialized").read_text() == api_keys.SCHEMA_VERSION
+
+            with patch("biz_gemini.api_keys.init_db") as mock_init:
+                api_keys._initialize()
+            mock_init.assert_not_called()
+
+
+class TestReadOnlyMode:
+    """只读模式测试。"""
+
+    def test_read_only_rejects_writes(self, temp_db):
+        """测试只读模式下可以验证但不能写入。"""
+        from biz_gemini.exceptions import ConfigurationError
+
+        with patch("biz_gemini.api_keys.DB_FILE", temp_db):
+            created = generate_api_key(name="Test")
+            with patch("biz_gemini.api_keys.READ_ONLY", True):
+                assert validate_api_key(created["key"]) is True
+                assert list_api_keys()[0]["id"] == created["id"]
+                with pytest.raises(ConfigurationError):
+                    generate_api_key(name="Other")
+                with pytest.raises(ConfigurationError):
+                    delete_api_key(created["id"])
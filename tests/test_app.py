@@ -0,0 +1,19 @@
+"""命令行入口测试。"""
+import app
+
+
+class TestCheckLoginStatus:
+    """check_login_status 函数测试。"""
+
+    def test_returns_copy_of_cached_config(self, monkeypatch):
+        """测试返回的配置是副本，修改它不影响共享的配置缓存。"""
+        cached = {"secure_c_ses": "ses", "csesidx": "123", "group_id": "g"}
+        monkeypatch.setattr(app, "get_cached_config", lambda: cached)
+        monkeypatch.setattr(app, "_cookies_expired_cached", lambda cfg: False)
+
+        logged_in, cfg, _ = app.check_login_status()
+
+        assert logged_in
+        assert cfg == cached and cfg is not cached
+        cfg["secure_c_ses"] = "changed"
+        assert cached["secure_c_ses"] == "ses"
@@ -1,8 +1,10 @@
 """认证模块测试。"""
 import base64
 import json
+import threading
 import time
 
+import httpx
 import pytest
 
 from biz_gemini.auth import (
@@ -12,6 +14,18 @@ from biz_gemini.auth import (
     create_jwt,
     _build_cookie_header,
     _parse_cookie_str,
+    _parse_setcookie_name_value,
+    _parse_csesidx_from_url,
+    _parse_group_id_from_url,
+    JWTManager,
+    ensure_jwt_valid,
+    _get_jwt_via_api,
+    check_session_status,
+    check_session_status_async,
+    request_getoxsrf,
+    request_getoxsrf_async,
+    _get_httpx_client,
+    close_httpx_clients,
 )
 
 
@@ -153,6 +167,32 @@ class TestCreateJwt:
         assert sig1 != sig2
 
 
+    def test_payload_claims(self):
+        """测试 payload 为紧凑 JSON 且声明完整。"""
+        key = b"test_secret_key_32_bytes_long!!"
+        jwt, expires = create_jwt(key, "key", 'se"ss', lifetime=300)
+
+        payload_b64 = jwt.split(".")[1]
+        payload_json = base64.urlsafe_b64decode(payload_b64 + "=" * (-len(payload_b64) % 4)).decode()
+        payload = json.loads(payload_json)
+        assert payload_json == json.dumps(payload, separators=(",", ":"))
+        assert payload["sub"] == 'csesidx/se"ss'
+        assert payload["exp"] == payload["iat"] + 300 == int(expires)
+        assert payload["nbf"] == payload["iat"]
+
+    def test_signature_matches_hmac_sha256(self):
+        """测试签名与标准 HMAC-SHA256 一致（重复签名同一密钥时亦然）。"""
+        import hashlib
+        import hmac
+
+        key = b"test_secret_key_32_bytes_long!!"
+        for _ in range(2):
+            jwt, _ = create_jwt(key, "key", "sess")
+            message, sig = jwt.rsplit(".", 1)
+            expected = hmac.new(key, message.encode("utf-8"), hashlib.sha256).digest()
+            assert sig == url_safe_b64encode(expected)
+
+
 class TestBuildCookieHeader:
     """_build_cookie_header 函数测试。"""
 
@@ -207,6 +247,16 @@ class TestBuildCookieHeader:
         assert debug_info["cookie_header_length"] == 200
         assert "..." in debug_info["cookie_header_preview"]  # 被截断
 
+    def test_debug_info_as_dict(self):
+        """测试调试信息可转换为普通字典。"""
+        cookie_str, debug_info = _build_cookie_header({"cookie_raw": "a=b"})
+
+        assert dict(debug_info) == {
+            "cookie_source": "cookie_raw",
+            "cookie_header_length": 3,
+            "cookie_header_preview": "a=b",
+        }
+
 
 class TestParseCookieStr:
     """_parse_cookie_str 函数测试。"""
@@ -230,7 +280,480 @@ class TestParseCookieStr:
         result = _parse_cookie_str("")
         assert result == {}
 
+    def test_value_with_equals_and_bare_segment(self):
+        """测试值中含 "=" 以及缺少 "=" 的片段。"""
+        result = _parse_cookie_str("a=b=c; flag; d = e ;")
+        assert result == {"a": "b=c", "d": "e"}
+
     def test_cookie_with_special_values(self):
         """测试包含特殊字符的值。"""
         result = _parse_cookie_str("name=value%20with%20spaces")
         assert "name" in result
+
+
+class TestParseSetCookieNameValue:
+    """_parse_setcookie_name_value 函数测试。"""
+
+    def test_strips_attributes(self):
+        """测试只提取第一段的 name=value。"""
+        result = _parse_setcookie_name_value("NID = abc=1 ; Path=/; HttpOnly")
+        assert result == ("NID", "abc=1")
+
+    def test_without_value(self):
+        """测试第一段没有 "=" 时返回 None。"""
+        assert _parse_setcookie_name_value("HttpOnly; Path=/") is None
+
+
+class TestParseLoginUrl:
+    """登录 URL 解析测试。"""
+
+    def test_csesidx(self):
+        """测试从查询参数中提取 csesidx。"""
+        url = "https://business.gemini.google/home/cid/abc?foo=1&csesidx=12345#frag"
+        assert _parse_csesidx_from_url(url) == "12345"
+        assert _parse_csesidx_from_url("https://business.gemini.google/") is None
+
+    def test_group_id(self):
+        """测试从路径中提取 group_id。"""
+        url = "https://business.gemini.google/home/cid/51518926-c5e4-4372-b9c1-b4e6f2afa7ed/r/research?x=1"
+        assert _parse_group_id_from_url(url) == "51518926-c5e4-4372-b9c1-b4e6f2afa7ed"
+        assert _parse_group_id_from_url("https://business.gemini.google/home/cid/") is None
+
+
+class TestJWTManagerRefresh:
+    """JWTManager 并发刷新测试。"""
+
+    def test_concurrent_get_jwt_refreshes_once(self, monkeypatch):
+        """测试缓存失效时并发调用 get_jwt 只刷新一次。"""
+        calls = []
+
+        def fake_get_jwt_via_api(config):
+            calls.append(config)
+            time.sleep(0.05)
+            return {"jwt": "jwt-token", "expires_at_ts": time.time() + 300}
+
+        monkeypatch.setattr("biz_gemini.auth._get_jwt_via_api", fake_get_jwt_via_api)
+        manager = JWTManager(config={}, use_global_cache=False)
+        manager._redis_manager = None
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(manager.get_jwt()))
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(calls) == 1
+        assert results == ["jwt-token"] * 8
+
+    def test_fresh_instance_jwt_skips_shared_caches(self, monkeypatch):
+        """测试实例 JWT 仍新鲜时不再读取 Redis。"""
+        from biz_gemini.redis_manager import RedisManager
+
+        monkeypatch.setattr(
+            "biz_gemini.auth._get_jwt_via_api",
+            lambda config: {"jwt": "jwt-token", "expires_at_ts": time.time() + 300},
+        )
+        manager = JWTManager(config={}, use_global_cache=False)
+        manager._redis_manager = RedisManager({})
+        manager._redis_enabled = True
+        assert manager.get_jwt() == "jwt-token"
+
+        mget_calls = []
+        monkeypatch.setattr(manager._redis_manager, "mget", lambda keys: mget_calls.append(keys))
+        assert manager.get_jwt() == "jwt-token"
+        assert mget_calls == []
+
+        manager.invalidate()
+        assert manager._fresh_until == 0.0
+
+    def test_redis_cache_round_trip(self):
+        """测试 JWT 以两个 key 写入 Redis 并通过 MGET 读回。"""
+        from biz_gemini.redis_manager import RedisManager
+
+        manager = JWTManager(config={}, use_global_cache=False)
+        manager._redis_manager = RedisManager({})
+        manager._redis_enabled = True
+
+        expires_at = time.time() + 300
+        manager._set_cached_jwt_to_redis("jwt-token", expires_at)
+        assert manager._get_cached_jwt_from_redis() == ("jwt-token", expires_at)
+
+        manager._clear_jwt_from_redis()
+        assert manager._get_cached_jwt_from_redis() == (None, 0.0)
+
+    def _redis_backed_manager(self):
+        from biz_gemini.redis_manager import RedisManager
+
+        manager = JWTManager(config={}, use_global_cache=False)
+        manager._redis_manager = RedisManager({})
+        manager._redis_enabled = True
+        return manager
+
+    def test_refresh_lock_release_keeps_foreign_lock(self, monkeypatch):
+        """测试刷新超过锁 TTL、锁已被其他 worker 获取时，不会删除对方的锁。"""
+        from biz_gemini.auth import _JWT_REFRESH_LOCK_KEY
+
+        manager = self._redis_backed_manager()
+
+        def slow_get_jwt_via_api(config):
+            # 模拟本进程的锁已过期，被其他 worker 重新获取
+            manager._redis_manager.set(_JWT_REFRESH_LOCK_KEY, "other-worker")
+            return {"jwt": "jwt-token", "expires_at_ts": time.time() + 300}
+
+        monkeypatch.setattr("biz_gemini.auth._get_jwt_via_api", slow_get_jwt_via_api)
+
+        assert manager.get_jwt() == "jwt-token"
+        assert manager._redis_manager.get(_JWT_REFRESH_LOCK_KEY) == "other-worker"
+
+    def test_wait_for_other_worker_outside_process_lock(self, monkeypatch):
+        """测试等待其他 worker 刷新期间不持有进程内刷新锁，并复用其结果。"""
+        from biz_gemini.auth import _JWT_REFRESH_LOCK, _JWT_REFRESH_LOCK_KEY
+
+        def fail_get_jwt_via_api(config):
+            raise AssertionError("不应自行刷新")
+
+        monkeypatch.setattr("biz_gemini.auth._get_jwt_via_api", fail_get_jwt_via_api)
+        manager = self._redis_backed_manager()
+        manager._redis_manager.set_nx(_JWT_REFRESH_LOCK_KEY, "other-worker", ex=60)
+
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(manager.get_jwt()))
+        waiter.start()
+        time.sleep(0.15)
+
+        assert _JWT_REFRESH_LOCK.acquire(blocking=False)
+        _JWT_REFRESH_LOCK.release()
+        manager._set_cached_jwt_to_redis("other-jwt", time.time() + 300)
+        waiter.join(timeout=5)
+
+        assert results == ["other-jwt"]
+
+    def test_initial_jwt_served_without_refresh(self, monkeypatch):
+        """测试构造时传入的 JWT 直接命中实例缓存，且实例不带 __dict__。"""
+        def fail_get_jwt_via_api(config):
+            raise AssertionError("不应刷新")
+
+        monkeypatch.setattr("biz_gemini.auth._get_jwt_via_api", fail_get_jwt_via_api)
+        manager = JWTManager({}, "jwt-token", time.time() + 300, use_global_cache=False)
+
+        assert manager.get_jwt() == "jwt-token"
+        assert not hasattr(manager, "__dict__")
+
+
+class TestHttpxClientPool:
+    """getoxsrf 共享连接池测试。"""
+
+    def test_transport_reused_per_proxy(self):
+        """测试同一代理复用同一连接池，cookie jar 每次独立，不同代理各自独立。"""
+        try:
+            client = _get_httpx_client(None)
+            again = _get_httpx_client(None)
+            assert again._transport is client._transport
+            assert again.cookies is not client.cookies
+            other = _get_httpx_client("http://127.0.0.1:8888")
+            assert other._transport is not client._transport
+        finally:
+            close_httpx_clients()
+
+        assert _get_httpx_client(None)._transport is not client._transport
+        close_httpx_clients()
+
+    def test_concurrent_requests_not_serialized(self, monkeypatch):
+        """测试一次慢速 getoxsrf 不会阻塞同一代理上的其他调用。"""
+        slow_started = threading.Event()
+        release = threading.Event()
+
+        def handler(request):
+            if "slow" in request.headers.get("cookie", ""):
+                slow_started.set()
+                release.wait(5)
+            return httpx.Response(200, content=b"{}")
+
+        monkeypatch.setattr("biz_gemini.auth._CLIENT_CACHE", {None: httpx.MockTransport(handler)})
+        slow = threading.Thread(
+            target=request_getoxsrf, args=({"secure_c_ses": "slow", "csesidx": "1"},)
+        )
+        slow.start()
+        try:
+            assert slow_started.wait(5)
+            resp, _ = request_getoxsrf({"secure_c_ses": "fast", "csesidx": "1"})
+            assert resp.status_code == 200
+        finally:
+            release.set()
+            slow.join(5)
+
+
+class TestEnsureJwtValid:
+    """ensure_jwt_valid 刷新策略测试。"""
+
+    CONFIG = {"secure_c_ses": "ses", "csesidx": "123"}
+
+    @pytest.fixture(autouse=True)
+    def _isolate(self, monkeypatch):
+        from biz_gemini.config import clear_jwt_cache
+
+        monkeypatch.setattr("biz_gemini.auth.is_cookie_expired", lambda: False)
+        monkeypatch.setattr("biz_gemini.auth.mark_cookie_valid", lambda: None)
+        monkeypatch.setattr("biz_gemini.auth._ENSURE_JWT_SNAPSHOT", None)
+        clear_jwt_cache()
+        yield
+        clear_jwt_cache()
+
+    def test_stale_jwt_returned_while_refreshing_in_background(self, monkeypatch):
+        """测试临近过期的 JWT 立即返回，刷新在后台完成。"""
+        from biz_gemini.config import get_cached_jwt, set_cached_jwt
+
+        release = threading.Event()
+        refreshed = threading.Event()
+
+        def fake_get_jwt_via_api(config):
+            release.wait(5)
+            refreshed.set()
+            return {"jwt": "new-jwt", "expires_at_ts": time.time() + 300}
+
+        monkeypatch.setattr("biz_gemini.auth._get_jwt_via_api", fake_get_jwt_via_api)
+        set_cached_jwt("old-jwt", time.time() + 100)
+
+        result = ensure_jwt_valid(self.CONFIG)
+        assert result["jwt"] == "old-jwt"
+        assert result["valid"] and not result["refreshed"]
+
+        release.set()
+        assert refreshed.wait(5)
+        for _ in range(50):
+            if get_cached_jwt()[0] == "new-jwt":
+                break
+            time.sleep(0.01)
+        assert get_cached_jwt()[0] == "new-jwt"
+
+    def test_snapshot_skips_config_reload(self, monkeypatch):
+        """测试无参连续调用复用快照，Cookie 刷新后失效。"""
+        import biz_gemini.auth as auth
+        from biz_gemini.config import set_cached_jwt
+
+        loads = []
+        monkeypatch.setattr("biz_gemini.auth.load_config", lambda: loads.append(1) or self.CONFIG)
+        set_cached_jwt("cached-jwt", time.time() + 600)
+
+        first = ensure_jwt_valid()
+        first["jwt"] = "mutated"
+        assert ensure_jwt_valid()["jwt"] == "cached-jwt"
+        assert len(loads) == 1
+
+        auth.on_cookie_refreshed()
+        set_cached_jwt("cached-jwt", time.time() + 600)
+        assert ensure_jwt_valid()["jwt"] == "cached-jwt"
+        assert len(loads) == 2
+
+    def test_snapshot_invalidated_by_cookie_expiry(self, monkeypatch):
+        """测试快照命中后标记 Cookie 过期，下一次调用立即返回无效。"""
+        import biz_gemini.config as config_module
+        from biz_gemini.config import mark_cookie_expired, mark_cookie_valid, set_cached_jwt
+
+        monkeypatch.setattr("biz_gemini.auth.load_config", lambda: self.CONFIG)
+        monkeypatch.setattr(
+            "biz_gemini.auth.is_cookie_expired",
+            lambda: config_module._account_state["cookie_expired"],
+        )
+        set_cached_jwt("cached-jwt", time.time() + 600)
+
+        assert ensure_jwt_valid()["valid"]
+        assert ensure_jwt_valid()["jwt"] == "cached-jwt"
+        try:
+            mark_cookie_expired("401")
+            result = ensure_jwt_valid()
+            assert not result["valid"]
+            assert result["jwt"] is None
+        finally:
+            mark_cookie_valid()
+
+    def test_snapshot_invalidated_by_jwt_cache_clear(self, monkeypatch):
+        """测试 clear_jwt_cache() 后不再返回快照中的旧 JWT。"""
+        from biz_gemini.config import clear_jwt_cache, set_cached_jwt
+
+        monkeypatch.setattr("biz_gemini.auth.load_config", lambda: self.CONFIG)
+        monkeypatch.setattr(
+            "biz_gemini.auth._get_jwt_via_api",
+            lambda config: {"jwt": "new-jwt", "expires_at_ts": time.time() + 300},
+        )
+        set_cached_jwt("old-jwt", time.time() + 600)
+
+        assert ensure_jwt_valid()["jwt"] == "old-jwt"
+        clear_jwt_cache()
+        assert ensure_jwt_valid()["jwt"] == "new-jwt"
+
+    def test_blocks_when_no_usable_jwt(self, monkeypatch):
+        """测试没有可用 JWT 时同步刷新。"""
+        monkeypatch.setattr(
+            "biz_gemini.auth._get_jwt_via_api",
+            lambda config: {"jwt": "new-jwt", "expires_at_ts": time.time() + 300},
+        )
+
+        result = ensure_jwt_valid(self.CONFIG)
+        assert result["jwt"] == "new-jwt"
+        assert result["refreshed"]
+
+
+class TestGetJwtViaApi:
+    """_get_jwt_via_api 响应解析测试。"""
+
+    CONFIG = {"secure_c_ses": "ses", "csesidx": "123"}
+
+    def _mock_response(self, monkeypatch, content: bytes):
+        resp = httpx.Response(200, content=content)
+        debug_info = {"cookie_source": "fields", "used_cookie_variant": "minimal"}
+        monkeypatch.setattr(
+            "biz_gemini.auth.request_getoxsrf",
+            lambda config, allow_minimal_retry: (resp, debug_info),
+        )
+
+    def test_parses_prefixed_json(self, monkeypatch):
+        """测试去掉 )]}' 前缀后解析 JSON。"""
+        xsrf = base64.urlsafe_b64encode(b"k" * 32).decode().rstrip("=")
+        body = json.dumps({"keyId": "kid", "xsrfToken": xsrf}).encode()
+        self._mock_response(monkeypatch, b")]}'\n" + body)
+
+        result = _get_jwt_via_api(self.CONFIG)
+        assert result["key_id"] == "kid"
+        assert result["jwt"].count(".") == 2
+        assert result["cookie_debug"]["used_cookie_variant"] == "minimal"
+
+        status = check_session_status(self.CONFIG)
+        assert status["valid"]
+        assert status["cookie_debug"]["used_cookie_variant"] == "minimal"
+
+    def test_non_json_raises(self, monkeypatch):
+        """测试非 JSON 响应抛出 TokenRefreshError。"""
+        from biz_gemini.exceptions import TokenRefreshError
+
+        self._mock_response(monkeypatch, b"<html>login</html>")
+        with pytest.raises(TokenRefreshError):
+            _get_jwt_via_api(self.CONFIG)
+
+        status = check_session_status(self.CONFIG)
+        assert status["expired"]
+        assert status["cookie_debug"]["cookie_source"] == "fields"
+
+    async def test_check_session_status_async(self, monkeypatch):
+        """测试异步版本走 request_getoxsrf_async，返回结构与同步版本一致。"""
+        xsrf = base64.urlsafe_b64encode(b"k" * 32).decode().rstrip("=")
+        body = json.dumps({"keyId": "kid", "xsrfToken": xsrf}).encode()
+        debug_info = {"cookie_source": "fields", "used_cookie_variant": "full"}
+
+        async def fake_request_getoxsrf_async(config, allow_minimal_retry):
+            return httpx.Response(200, content=body), debug_info
+
+        monkeypatch.setattr("biz_gemini.auth.request_getoxsrf_async", fake_request_getoxsrf_async)
+
+        status = await check_session_status_async(self.CONFIG)
+        assert status["valid"]
+        assert status["cookie_debug"] is debug_info
+
+        status = await check_session_status_async({"csesidx": "123"})
+        assert status["expired"]
+        assert status["error"] == "缺少凭证信息"
+
+
+class TestRequestGetoxsrfVariant:
+    """request_getoxsrf Cookie 变体记忆测试。"""
+
+    def test_remembers_working_variant(self, monkeypatch):
+        """测试完整 Cookie 成功后，下次直接使用完整 Cookie。"""
+        sent = []
+
+        def handler(request):
+            cookie = request.headers.get("cookie", "")
+            sent.append(cookie)
+            if "NID=" in cookie:
+                return httpx.Response(200, content=b"{}")
+            return httpx.Response(302, headers={"location": "https://accounts.google.com/"})
+
+        client = httpx.Client(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr("biz_gemini.auth._get_httpx_client", lambda proxy: client)
+        monkeypatch.setattr("biz_gemini.auth._LAST_GOOD_VARIANT", None)
+        config = {
+            "secure_c_ses": "ses",
+            "csesidx": "123",
+            "cookie_raw": "__Secure-C_SES=ses; NID=nid",
+        }
+
+        resp, debug_info = request_getoxsrf(config)
+        assert resp.status_code == 200
+        assert debug_info["used_cookie_variant"] == "cookie_raw"
+        assert len(sent) == 2
+
+        sent.clear()
+        resp, debug_info = request_getoxsrf(config)
+        assert resp.status_code == 200
+        assert sent == ["__Secure-C_SES=ses; NID=nid"]
+
+    async def test_async_follows_same_variant_logic(self, monkeypatch):
+        """测试异步版本同样回退到完整 Cookie。"""
+        sent = []
+
+        def handler(request):
+            cookie = request.headers.get("cookie", "")
+            sent.append(cookie)
+            if "NID=" in cookie:
+                return httpx.Response(200, content=b"{}")
+            return httpx.Response(302, headers={"location": "https://accounts.google.com/"})
+
+        monkeypatch.setattr(
+            "biz_gemini.auth._httpx_client_kwargs",
+            lambda proxy: {"transport": httpx.MockTransport(handler)},
+        )
+        monkeypatch.setattr("biz_gemini.auth._LAST_GOOD_VARIANT", None)
+        config = {
+            "secure_c_ses": "ses",
+            "csesidx": "123",
+            "cookie_raw": "__Secure-C_SES=ses; NID=nid",
+        }
+
+        resp, debug_info = await request_getoxsrf_async(config)
+        assert resp.status_code == 200
+        assert debug_info["used_cookie_variant"] == "cookie_raw"
+        assert sent == ["__Secure-C_SES=ses", "__Secure-C_SES=ses; NID=nid"]
+
+    @staticmethod
+    def _refreshcookies_handler(sent):
+        def handler(request):
+            sent.append((request.url.path, request.headers.get("cookie", "")))
+            if request.url.path == "/refreshcookies":
+                return httpx.Response(204, headers={"set-cookie": "__Secure-C_SES=new; Path=/"})
+            if "C_SES=new" in request.headers.get("cookie", ""):
+                return httpx.Response(200, content=b"{}")
+            return httpx.Response(302, headers={"location": "https://business.gemini.google/refreshcookies"})
+
+        return handler
+
+    async def test_sync_and_async_follow_refreshcookies(self, monkeypatch):
+        """测试同步与异步版本以相同顺序跟随 refreshcookies 并合并新 Cookie。"""
+        config = {"secure_c_ses": "ses", "csesidx": "123"}
+        expected = [
+            ("/auth/getoxsrf", "__Secure-C_SES=ses"),
+            ("/refreshcookies", "__Secure-C_SES=ses"),
+            ("/auth/getoxsrf", "__Secure-C_SES=new"),
+        ]
+
+        sync_sent = []
+        client = httpx.Client(transport=httpx.MockTransport(self._refreshcookies_handler(sync_sent)))
+        monkeypatch.setattr("biz_gemini.auth._get_httpx_client", lambda proxy: client)
+        monkeypatch.setattr("biz_gemini.auth._LAST_GOOD_VARIANT", None)
+        resp, debug_info = request_getoxsrf(config)
+        assert resp.status_code == 200
+        assert sync_sent == expected
+
+        async_sent = []
+        handler = self._refreshcookies_handler(async_sent)
+        monkeypatch.setattr(
+            "biz_gemini.auth._httpx_client_kwargs",
+            lambda proxy: {"transport": httpx.MockTransport(handler)},
+        )
+        resp, async_debug_info = await request_getoxsrf_async(config)
+        assert resp.status_code == 200
+        assert async_sent == expected
+        assert async_debug_info == debug_info
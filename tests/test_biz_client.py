@@ -1,15 +1,36 @@
 """客户端数据结构测试。"""
+import json
 import os
 import tempfile
 from pathlib import Path
+from unittest.mock import MagicMock, patch
 
 import pytest
 
 from biz_gemini.biz_client import (
+    BizGeminiClient,
     ImageThumbnail,
+    ChatDelta,
     ChatImage,
     ChatResponse,
+    _JsonArrayStreamParser,
+    build_headers,
 )
+from biz_gemini.exceptions import AuthenticationError
+
+
+class TestBuildHeaders:
+    """build_headers 函数测试。"""
+
+    def test_authorization_and_independent_copies(self):
+        """测试每次返回独立的字典，且 authorization 位置不变。"""
+        headers = build_headers("jwt-1")
+        assert headers["authorization"] == "Bearer jwt-1"
+        assert list(headers).index("authorization") == 6
+
+        headers["cookie"] = "a=b"
+        assert "cookie" not in build_headers("jwt-2")
+        assert build_headers("jwt-2")["authorization"] == "Bearer jwt-2"
 
 
 class TestImageThumbnail:
@@ -200,3 +221,118 @@ class TestChatResponse:
 
         result = str(response)
         assert result == ""
+
+
+class TestJsonArrayStreamParser:
+    """_JsonArrayStreamParser 增量解析测试。"""
+
+    def test_yields_items_as_they_complete(self):
+        """测试每个顶层元素完整后立即返回。"""
+        parser = _JsonArrayStreamParser()
+
+        assert parser.feed('[{"a": "x}') == []
+        assert parser.feed('\\"y"},') == [{"a": 'x}"y'}]
+        assert parser.feed('{"b": [1, 2]}]') == [{"b": [1, 2]}]
+        assert parser.complete
+
+    def test_invalid_content_raises(self):
+        """测试非 JSON 内容抛出 ValueError。"""
+        parser = _JsonArrayStreamParser()
+
+        with pytest.raises(ValueError):
+            parser.feed("<html>error</html>")
+
+
+class TestChatStream:
+    """BizGeminiClient.chat_stream 测试。"""
+
+    @staticmethod
+    def _make_client(lines):
+        client = BizGeminiClient.__new__(BizGeminiClient)
+        resp = MagicMock()
+        resp.iter_lines.return_value = [line.encode("utf-8") for line in lines]
+        client._do_stream_assist = MagicMock(return_value=resp)
+        return client
+
+    def test_stream_deltas_then_response(self, mock_chat_response):
+        """测试先产出增量，最后产出完整响应。"""
+        lines = json.dumps(mock_chat_response, indent=2, ensure_ascii=False).split("\n")
+        client = self._make_client(lines)
+
+        events = list(client.chat_stream("你好"))
+
+        assert events[0] == ChatDelta("你好！我是 Gemini，很高兴见到你。")
+        assert isinstance(events[-1], ChatResponse)
+        assert events[-1].text == "你好！我是 Gemini，很高兴见到你。"
+
+    def test_single_batch_is_coalesced(self):
+        """测试上游一次性返回时，连续文本合并为一个增量。"""
+        replies = [
+            {"streamAssistResponse": {"answer": {"replies": [{"groundedContent": {"content": {"text": part}}}]}}}
+            for part in ("你好", "，", "世界")
+        ]
+        client = self._make_client([json.dumps(replies, ensure_ascii=False)])
+
+        events = list(client.chat_stream("你好"))
+
+        assert events[:-1] == [ChatDelta("你好，世界")]
+        assert events[-1].text == "你好，世界"
+
+    def test_chat_full_falls_back_to_raw_text(self):
+        """测试无法解析时 chat_full 返回原始文本。"""
+        client = self._make_client(["<html>", "error</html>"])
+
+        response = client.chat_full("你好")
+
+        assert response.text == "<html>\nerror</html>\n"
+
+
+class TestSessionAuthErrors:
+    """会话接口刷新 JWT 后仍返回 401 的测试。"""
+
+    @staticmethod
+    def _make_client():
+        client = BizGeminiClient.__new__(BizGeminiClient)
+        client.config = {}
+        client.group_id = "test-group-id"
+        client.jwt_manager = MagicMock()
+        client.jwt_manager.get_jwt.return_value = "jwt"
+        client._proxies = None
+        client._session_name = None
+        client._redis_manager = None
+        return client
+
+    def test_create_session_persistent_401(self):
+        """测试创建会话持续 401 时抛出 AuthenticationError。"""
+        client = self._make_client()
+        resp = MagicMock(status_code=401, text="unauthorized")
+        with patch("biz_gemini.biz_client.requests.post", return_value=resp):
+            with pytest.raises(AuthenticationError):
+                client.create_session()
+        assert client.jwt_manager.refresh.call_count == 2
+
+    def test_cli_prompts_login_when_session_creation_401(self, monkeypatch, capsys):
+        """测试首条消息在创建会话时 401，CLI 提示重新登录。"""
+        import asyncio
+        import io
+
+        import app
+
+        client = self._make_client()
+        backend = MagicMock()
+        backend.send_full.side_effect = lambda message: client.chat_full(message)
+        monkeypatch.setattr(app, "check_login_status", lambda: (True, {"group_id": "test-group-id"}, "已登录"))
+        monkeypatch.setattr(app, "BizGeminiChatBackend", lambda cfg, include_thoughts: backend)
+        monkeypatch.setattr("sys.stdin", io.StringIO("你好\n"))
+        resp = MagicMock(status_code=401, text="unauthorized")
+        loop = asyncio.new_event_loop()
+        try:
+            state = app.CliState(loop=loop)
+            with patch("biz_gemini.biz_client.requests.post", return_value=resp):
+                app._run_cli(state)
+        finally:
+            loop.close()
+
+        out = capsys.readouterr().out
+        assert "调用失败" in out and "请输入 /login" in out
+        assert state.logged_in is False
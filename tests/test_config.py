@@ -2,6 +2,7 @@
 import json
 import os
 import tempfile
+from datetime import datetime, timedelta
 from pathlib import Path
 from unittest.mock import patch
 
@@ -13,6 +14,10 @@ from biz_gemini.config import (
     load_config,
     save_config,
     get_proxy,
+    get_cached_config,
+    invalidate_config_cache,
+    cookies_expired,
+    TIME_FMT,
 )
 
 
@@ -221,3 +226,72 @@ class TestSaveConfig:
 
         # 其他字段应该保留
         assert result["server"]["port"] == sample_config["server"]["port"]
+
+
+class TestGetCachedConfig:
+    """get_cached_config 函数测试。"""
+
+    def test_returns_cached_when_unchanged(self, config_file):
+        """测试文件未变化时复用缓存。"""
+        with patch("biz_gemini.config.NEW_CONFIG_FILE", config_file):
+            with patch("biz_gemini.config.OLD_CONFIG_FILE", config_file.parent / "old.json"):
+                invalidate_config_cache()
+                first = get_cached_config()
+                with patch("biz_gemini.config.load_config") as mock_load:
+                    second = get_cached_config()
+
+        assert second is first
+        mock_load.assert_not_called()
+        invalidate_config_cache()
+
+    def test_reloads_after_save(self, config_file):
+        """测试保存配置后缓存失效。"""
+        with patch("biz_gemini.config.NEW_CONFIG_FILE", config_file):
+            with patch("biz_gemini.config.OLD_CONFIG_FILE", config_file.parent / "old.json"):
+                invalidate_config_cache()
+                get_cached_config()
+                save_config({"csesidx": "new_csesidx"})
+                config = get_cached_config()
+
+        assert config["csesidx"] == "new_csesidx"
+        invalidate_config_cache()
+
+
+class TestCookiesExpired:
+    """cookies_expired 函数测试。"""
+
+    def test_age_threshold(self):
+        """测试按保存时间判断是否超时，重复检查结果一致。"""
+        fresh = (datetime.now() - timedelta(hours=1)).strftime(TIME_FMT)
+        stale = (datetime.now() - timedelta(hours=25)).strftime(TIME_FMT)
+
+        for _ in range(2):
+            assert not cookies_expired({"session": {"cookies_saved_at": fresh}}, 24)
+            assert cookies_expired({"session": {"cookies_saved_at": stale}}, 24)
+
+    def test_invalid_or_missing_timestamp(self):
+        """测试时间戳缺失或格式错误时视为未超时。"""
+        assert not cookies_expired({"cookies_saved_at": "not-a-time"}, 24)
+        assert not cookies_expired({}, 24)
+        assert not cookies_expired({"cookies_saved_at": "2000-01-01 00:00:00"}, 0)
+
+
+class TestClearRedisSessionCache:
+    """clear_redis_session_cache 函数测试。"""
+
+    def test_clears_jwt_keys_used_by_auth(self):
+        """测试清除的 JWT key 与 auth 模块读写的 key 一致。"""
+        from unittest.mock import MagicMock
+
+        import biz_gemini.auth as auth
+        from biz_gemini.config import clear_redis_session_cache
+
+        redis_mgr = MagicMock()
+        redis_mgr.is_redis_enabled.return_value = True
+        with patch("biz_gemini.config.load_config", return_value={"group_id": "g"}), \
+                patch("biz_gemini.redis_manager.get_redis_manager", return_value=redis_mgr):
+            clear_redis_session_cache()
+
+        deleted = [c.args[0] for c in redis_mgr.delete.call_args_list]
+        assert set(auth.REDIS_JWT_KEYS) <= set(deleted)
+        assert "session:g" in deleted